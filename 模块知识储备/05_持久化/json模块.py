@@ -848,6 +848,7 @@ def json_api_processing():
     large_json_array = "[" + ",".join([f"{{\"id\":{i},\"name\":\"用户{i}\"}}" for i in range(1, 1001)]) + "]"
     
     # 使用生成器进行流式处理，避免一次性加载全部数据
+    # 注意：这里仍然先解析了整个数组，真正的流式处理见6.1.1节的iter_json_batches
     def process_large_json(json_str, chunk_size=100):
         data = json.loads(json_str)
         for i in range(0, len(data), chunk_size):
@@ -1132,6 +1133,449 @@ def json_validation_example():
 json_validation_example()
 ```
 
+#### 5.3.1 编译模式：把验证规则变成闭包树
+
+上面的`validate_user`把规则写死在代码里，7.2节的`validate_json_structure`则在每条记录、每个嵌套层级上重新解释规则：检查`isinstance`、查找白名单集合、递归调用自身。每批要验证数百万条记录时，解释规则本身就成了主要开销，而这部分工作对每条记录都是一样的。
+
+下面的`compile_schema`把5.3节示例中的JSON Schema子集（`type`、`properties`、`required`、`additionalProperties`、`items`、`minItems`/`maxItems`、`minLength`/`maxLength`、`pattern`、`format`、`minimum`/`maximum`、`enum`）预先编译成一棵闭包树：
+
+- **编译一次**：每个模式节点编译成一个专门的闭包，类型集合、必填字段、正则的`search`方法、数值范围和错误路径都在编译时计算好，验证时不再读取模式字典。没有长度和格式约束的字符串只检查类型
+- **按模式哈希缓存**：对模式做规范化JSON序列化后计算SHA-1，相同的模式只编译一次
+- **两种模式**：`validate`收集所有错误；`check`和`is_valid`遇到第一个错误就停止（fail-fast），有效记录上两者的开销相同，无效记录上fail-fast更快
+- **批量验证**：`validate_many`返回有效/无效记录数、按字段路径统计的错误次数和前几条错误样本。字段路径在编译时确定，数组元素用`[]`表示（如`tags[]`），不同记录的同一个字段可以直接累加
+
+```python
+import hashlib
+import json
+import re
+import sys
+from collections import Counter
+
+JSON_TYPES = {
+    'object': (dict,), 'array': (list,), 'string': (str,), 'integer': (int,),
+    'number': (int, float), 'boolean': (bool,), 'null': (type(None),),
+}
+
+FORMATS = {
+    'email': re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'),
+    'date': re.compile(r'^\d{4}-\d{2}-\d{2}$'),
+    'date-time': re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})$'),
+}
+
+_MISSING = object()
+
+class SchemaValidationError(ValueError):
+    """fail-fast模式下遇到的第一个验证错误"""
+    
+    def __init__(self, path, message):
+        super().__init__(f"{path or '<根>'}: {message}")
+        self.path = path
+        self.message = message
+
+class _FailFast:
+    """fail-fast模式的错误收集器：第一个错误就抛出异常"""
+    __slots__ = ()
+    
+    def append(self, error):
+        raise SchemaValidationError(*error)
+
+_FAIL_FAST = _FailFast()
+
+def _join(path, name):
+    return f"{path}.{name}" if path else name
+
+def _range_text(low, high):
+    if low is not None and high is not None:
+        return f"在{low}到{high}之间"
+    return f"不小于{low}" if low is not None else f"不大于{high}"
+
+def _type_error(kinds, value):
+    return f"类型必须是{'/'.join(kinds)}，当前类型: {type(value).__name__}"
+
+def _kinds(schema):
+    kind = schema.get('type')
+    if kind is None:
+        return None
+    return [kind] if isinstance(kind, str) else list(kind)
+
+def _type_set(kinds):
+    # type(True)是bool，所以integer不会接受布尔值
+    return frozenset(t for kind in kinds for t in JSON_TYPES[kind])
+
+def _compile(schema, path):
+    kinds = _kinds(schema)
+    if 'enum' in schema or kinds is None or len(kinds) != 1:
+        return _compile_generic(schema, path, kinds)
+    kind = kinds[0]
+    if kind == 'object':
+        return _compile_object(schema, path)
+    if kind == 'array':
+        return _compile_array(schema, path)
+    if kind == 'string':
+        return _compile_string(schema, path)
+    if kind in ('integer', 'number'):
+        return _compile_number(schema, path, kind)
+    return _compile_generic(schema, path, kinds)
+
+def _compile_generic(schema, path, kinds):
+    types = _type_set(kinds) if kinds else None
+    enum = tuple(schema['enum']) if 'enum' in schema else None
+    
+    def check(value, errors):
+        if types is not None and type(value) not in types:
+            errors.append((path, _type_error(kinds, value)))
+        elif enum is not None and value not in enum:
+            errors.append((path, f"必须是{list(enum)}之一，当前值: {value!r}"))
+    return check
+
+def _compile_object(schema, path):
+    properties = schema.get('properties', {})
+    required = schema.get('required', ())
+    skip = lambda value, errors: None
+    fields = [(name, _compile(sub, _join(path, name)),
+               (_join(path, name), "缺少必填字段") if name in required else None)
+              for name, sub in properties.items()]
+    fields += [(name, skip, (_join(path, name), "缺少必填字段"))
+               for name in required if name not in properties]
+    fields = tuple(fields)
+    additional = schema.get('additionalProperties', True)
+    allowed = frozenset(properties)
+    extra_check = _compile(additional, _join(path, '*')) if isinstance(additional, dict) else None
+    
+    def check(value, errors):
+        if type(value) is not dict:
+            errors.append((path, _type_error(['object'], value)))
+            return
+        get = value.get
+        for name, sub, missing_error in fields:
+            item = get(name, _MISSING)
+            if item is not _MISSING:
+                sub(item, errors)
+            elif missing_error is not None:
+                errors.append(missing_error)
+        if additional is not True and not allowed.issuperset(value):
+            for key in value:
+                if key not in allowed:
+                    if extra_check is None:
+                        errors.append((path, f"不允许的键: {key}"))
+                    else:
+                        extra_check(value[key], errors)
+    return check
+
+def _compile_array(schema, path):
+    items = schema.get('items')
+    item_check = _compile(items, path + '[]') if items is not None else None
+    low, high = schema.get('minItems'), schema.get('maxItems')
+    min_items = low if low is not None else 0
+    max_items = high if high is not None else sys.maxsize
+    
+    def check(value, errors):
+        if type(value) is not list:
+            errors.append((path, _type_error(['array'], value)))
+            return
+        if not min_items <= len(value) <= max_items:
+            errors.append((path, f"元素个数必须{_range_text(low, high)}，当前个数: {len(value)}"))
+        if item_check is not None:
+            for item in value:
+                item_check(item, errors)
+    return check
+
+def _compile_string(schema, path):
+    low, high = schema.get('minLength'), schema.get('maxLength')
+    min_len = low if low is not None else 0
+    max_len = high if high is not None else sys.maxsize
+    matchers = []
+    if 'pattern' in schema:
+        matchers.append((re.compile(schema['pattern']).search, f"不匹配模式 {schema['pattern']}"))
+    if schema.get('format') in FORMATS:
+        matchers.append((FORMATS[schema['format']].match, f"无效的{schema['format']}格式"))
+    matchers = tuple(matchers)
+    
+    if low is None and high is None and not matchers:
+        def check(value, errors):
+            if type(value) is not str:
+                errors.append((path, _type_error(['string'], value)))
+        return check
+    
+    def check(value, errors):
+        if type(value) is not str:
+            errors.append((path, _type_error(['string'], value)))
+            return
+        if not min_len <= len(value) <= max_len:
+            errors.append((path, f"长度必须{_range_text(low, high)}，当前长度: {len(value)}"))
+        for matcher, message in matchers:
+            if matcher(value) is None:
+                errors.append((path, f"{message}: {value!r}"))
+    return check
+
+def _compile_number(schema, path, kind):
+    types = _type_set([kind])
+    low, high = schema.get('minimum'), schema.get('maximum')
+    minimum = low if low is not None else float('-inf')
+    maximum = high if high is not None else float('inf')
+    
+    def check(value, errors):
+        if type(value) not in types:
+            errors.append((path, _type_error([kind], value)))
+        elif not minimum <= value <= maximum:
+            errors.append((path, f"必须{_range_text(low, high)}，当前值: {value}"))
+    return check
+
+class CompiledSchema:
+    """编译后的模式，由compile_schema创建"""
+    
+    def __init__(self, schema, key):
+        self.schema = schema
+        self.key = key
+        self._check = _compile(schema, '')
+    
+    def validate(self, value):
+        """收集所有错误，返回[(字段路径, 错误信息), ...]，没有错误时返回空列表"""
+        errors = []
+        self._check(value, errors)
+        return errors
+    
+    def check(self, value):
+        """fail-fast：遇到第一个错误就抛出SchemaValidationError"""
+        self._check(value, _FAIL_FAST)
+    
+    def is_valid(self, value):
+        try:
+            self._check(value, _FAIL_FAST)
+        except SchemaValidationError:
+            return False
+        return True
+    
+    def validate_many(self, records, fail_fast=False, max_samples=10):
+        """批量验证；fail_fast=True时每条无效记录只统计第一个错误"""
+        check = self._check
+        error_counts = Counter()
+        samples = []
+        total = invalid = 0
+        errors = []
+        for index, record in enumerate(records):
+            total += 1
+            if fail_fast:
+                try:
+                    check(record, _FAIL_FAST)
+                    continue
+                except SchemaValidationError as e:
+                    errors.append((e.path, e.message))
+            else:
+                check(record, errors)
+                if not errors:
+                    continue
+            invalid += 1
+            error_counts.update(path for path, _ in errors)
+            for path, message in errors[:max_samples - len(samples)]:
+                samples.append((index, path, message))
+            errors.clear()
+        return {'total': total, 'valid': total - invalid, 'invalid': invalid,
+                'error_counts': error_counts, 'samples': samples}
+
+_SCHEMA_CACHE = {}
+
+def compile_schema(schema):
+    """编译模式并按规范化JSON的SHA-1缓存；计算哈希也有开销，批处理时应保存返回的对象"""
+    key = hashlib.sha1(json.dumps(schema, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    compiled = _SCHEMA_CACHE.get(key)
+    if compiled is None:
+        compiled = _SCHEMA_CACHE[key] = CompiledSchema(schema, key)
+    return compiled
+
+def interpret_schema(value, schema, path='', errors=None):
+    """解释执行同一个模式子集：每次验证都重新读取模式字典，用作基准和正确性对照"""
+    if errors is None:
+        errors = []
+    kinds = _kinds(schema)
+    if kinds is not None and not any(isinstance(value, JSON_TYPES[kind]) and
+                                     not (isinstance(value, bool) and kind in ('integer', 'number'))
+                                     for kind in kinds):
+        errors.append((path, _type_error(kinds, value)))
+        return errors
+    if 'enum' in schema:
+        if value not in schema['enum']:
+            errors.append((path, f"必须是{list(schema['enum'])}之一，当前值: {value!r}"))
+        return errors
+    if isinstance(value, dict) and kinds == ['object']:
+        properties = schema.get('properties', {})
+        required = schema.get('required', [])
+        for name in list(properties) + [name for name in required if name not in properties]:
+            if name in value:
+                if name in properties:
+                    interpret_schema(value[name], properties[name], _join(path, name), errors)
+            elif name in required:
+                errors.append((_join(path, name), "缺少必填字段"))
+        additional = schema.get('additionalProperties', True)
+        if additional is not True:
+            for key in value:
+                if key not in properties:
+                    if isinstance(additional, dict):
+                        interpret_schema(value[key], additional, _join(path, '*'), errors)
+                    else:
+                        errors.append((path, f"不允许的键: {key}"))
+    elif isinstance(value, list) and kinds == ['array']:
+        low, high = schema.get('minItems'), schema.get('maxItems')
+        if (low is not None and len(value) < low) or (high is not None and len(value) > high):
+            errors.append((path, f"元素个数必须{_range_text(low, high)}，当前个数: {len(value)}"))
+        if 'items' in schema:
+            for item in value:
+                interpret_schema(item, schema['items'], path + '[]', errors)
+    elif isinstance(value, str) and kinds == ['string']:
+        low, high = schema.get('minLength'), schema.get('maxLength')
+        if (low is not None and len(value) < low) or (high is not None and len(value) > high):
+            errors.append((path, f"长度必须{_range_text(low, high)}，当前长度: {len(value)}"))
+        if 'pattern' in schema and not re.search(schema['pattern'], value):
+            errors.append((path, f"不匹配模式 {schema['pattern']}: {value!r}"))
+        if schema.get('format') in FORMATS and not FORMATS[schema['format']].match(value):
+            errors.append((path, f"无效的{schema['format']}格式: {value!r}"))
+    elif kinds in (['integer'], ['number']):
+        low, high = schema.get('minimum'), schema.get('maximum')
+        if (low is not None and value < low) or (high is not None and value > high):
+            errors.append((path, f"必须{_range_text(low, high)}，当前值: {value}"))
+    return errors
+```
+
+下面用5.3节JSON Schema中的用户模式测试两种实现是否给出完全相同的错误，并在20万条记录（约10%无效）上比较速度：
+
+```python
+import random
+import time
+
+USER_SCHEMA = {
+    "type": "object",
+    "required": ["id", "name", "email", "registered"],
+    "properties": {
+        "id": {"type": "integer"},
+        "name": {"type": "string", "minLength": 1, "maxLength": 50},
+        "email": {"type": "string", "format": "email"},
+        "age": {"type": "integer", "minimum": 0, "maximum": 150},
+        "address": {
+            "type": "object",
+            "properties": {
+                "city": {"type": "string"},
+                "street": {"type": "string"},
+                "zip_code": {"type": "string", "pattern": "^\\d{6}$"}
+            },
+            "required": ["city"]
+        },
+        "phone": {"type": "string", "pattern": "^1[3-9]\\d{9}$"},
+        "registered": {"type": "boolean"},
+        "last_login": {"type": "string", "format": "date-time"},
+        "tags": {"type": "array", "items": {"type": "string", "enum": ["vip", "new", "staff"]}, "maxItems": 3}
+    }
+}
+
+def make_users(n, invalid_ratio=0.1, seed=42):
+    rng = random.Random(seed)
+    users = []
+    for i in range(n):
+        user = {
+            "id": i, "name": f"用户{i}", "email": f"user{i}@example.com", "age": rng.randint(0, 99),
+            "address": {"city": "北京", "street": "朝阳区建国路", "zip_code": "100022"},
+            "phone": f"138{i:08d}", "registered": True, "last_login": "2023-01-10T15:20:30Z",
+            "tags": rng.sample(["vip", "new", "staff"], rng.randint(0, 2)),
+        }
+        if rng.random() < invalid_ratio:
+            broken = rng.choice(['id', 'email', 'age', 'zip', 'missing', 'tags'])
+            if broken == 'id':
+                user['id'] = str(i)
+            elif broken == 'email':
+                user['email'] = 'invalid-email'
+            elif broken == 'age':
+                user['age'] = -5
+            elif broken == 'zip':
+                user['address']['zip_code'] = '1000'
+            elif broken == 'missing':
+                del user['registered']
+            else:
+                user['tags'] = ['vip', 'unknown']
+        users.append(user)
+    return users
+
+def test_compiled_schema():
+    compiled = compile_schema(USER_SCHEMA)
+    assert compile_schema(json.loads(json.dumps(USER_SCHEMA))) is compiled    # 相同模式命中缓存
+    
+    bad = {"id": "3", "name": "", "email": "wangwu@example.com", "age": True,
+           "address": {"zip_code": 100000}, "tags": ["vip", 1]}
+    assert compiled.validate(bad) == interpret_schema(bad, USER_SCHEMA) == [
+        ('id', '类型必须是integer，当前类型: str'),
+        ('name', '长度必须在1到50之间，当前长度: 0'),
+        ('age', '类型必须是integer，当前类型: bool'),
+        ('address.city', '缺少必填字段'),
+        ('address.zip_code', '类型必须是string，当前类型: int'),
+        ('registered', '缺少必填字段'),
+        ('tags[]', '类型必须是string，当前类型: int'),
+    ]
+    try:
+        compiled.check(bad)
+        raise AssertionError("应该抛出SchemaValidationError")
+    except SchemaValidationError as e:
+        assert e.path == 'id'
+    
+    for user in make_users(5000, invalid_ratio=0.5):
+        assert compiled.validate(user) == interpret_schema(user, USER_SCHEMA)
+        assert compiled.is_valid(user) == (not interpret_schema(user, USER_SCHEMA))
+    
+    # validate_json_structure的白名单用additionalProperties表达
+    whitelist = compile_schema({"type": "object", "additionalProperties": False, "properties": {
+        "name": {"type": "string"}, "age": {"type": "integer"},
+        "email": {"type": "string"}, "active": {"type": "boolean"}}})
+    assert whitelist.is_valid({"name": "张三", "age": 30, "email": "zhangsan@example.com", "active": True})
+    assert whitelist.validate({"name": "李四", "age": 25, "password": "secret123"}) == [('', '不允许的键: password')]
+    
+    report = compiled.validate_many(make_users(1000))
+    assert report['valid'] + report['invalid'] == report['total'] == 1000
+    print("所有测试通过")
+    print(f"validate_many: 有效 {report['valid']}, 无效 {report['invalid']}")
+    for path, count in report['error_counts'].most_common():
+        print(f"  {path}: {count}")
+
+def benchmark_schema_validation(n=200_000):
+    users = make_users(n)
+    compiled = compile_schema(USER_SCHEMA)
+    runs = [
+        ('interpret_schema                ', lambda: [interpret_schema(u, USER_SCHEMA) for u in users]),
+        ('CompiledSchema.validate         ', lambda: [compiled.validate(u) for u in users]),
+        ('CompiledSchema.is_valid         ', lambda: [compiled.is_valid(u) for u in users]),
+        ('validate_many(收集所有错误)      ', lambda: compiled.validate_many(users)),
+        ('validate_many(fail_fast=True)   ', lambda: compiled.validate_many(users, fail_fast=True)),
+    ]
+    for name, run in runs:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {n / elapsed / 1000:7.1f} 千条/秒")
+    
+    start = time.perf_counter()
+    for _ in range(10000):
+        compile_schema(USER_SCHEMA)
+    print(f"compile_schema缓存命中: {(time.perf_counter() - start) / 10000 * 1e6:.1f} 微秒/次")
+
+# 运行示例
+test_compiled_schema()
+benchmark_schema_validation()
+```
+
+参考结果（Linux，Python 3.11，单核，20万条记录，约10%无效）：
+
+| 方法 | 速度 |
+|------|------|
+| interpret_schema（解释执行） | 约 27 千条/秒 |
+| CompiledSchema.validate（收集所有错误） | 约 145 千条/秒 |
+| CompiledSchema.is_valid（fail-fast） | 约 125 千条/秒 |
+| validate_many（收集所有错误 / fail_fast） | 约 143 / 155 千条/秒 |
+| compile_schema 缓存命中 | 约 26 微秒/次 |
+
+几点说明：
+
+- 编译后的验证器比解释执行快5倍多，两者对所有测试记录给出完全相同的错误列表。
+- 在同样的数据上单独测量手写的`validate_user`，约为150-160千条/秒，与编译后的验证器相当，而`validate_user`还少检查了`tags`和`last_login`两个字段。也就是说，编译模式在保留声明式模式的同时，基本达到了手写代码的速度。
+- 有效记录占大多数时，fail-fast并不会更快，因为有效记录总要检查完所有字段；它的优势在于无效记录多、只需要知道“是否有效”的场景。
+- `compile_schema`每次调用都要序列化模式并计算哈希，批处理时应在循环外编译一次，循环中直接使用返回的对象。
+- 编译后的验证器按`type(value) is ...`精确判断类型，这对`json.loads`的结果是准确的；验证`OrderedDict`等子类对象时，应先转换为普通的dict和list。
+
 ## 6. 性能优化
 
 在处理大型JSON数据时，性能优化是一个重要考虑因素。以下是一些优化技巧和实践：
@@ -1329,6 +1773,376 @@ def json_streaming_example():
 json_streaming_example()
 ```
 
+#### 6.1.1 字节级增量流式解析
+
+上面的`SimpleJSONStreamParser`并不是真正的流式解析：它要求整个文档已经作为一个`str`放在内存中，在Python中逐个字符地扫描括号和引号，找到边界后还要再调用一次`json.loads`，相当于把每个字符处理了两遍。它还假设数组元素都是对象，元素是数字或字符串时会出错。5.2节的`process_large_json`同样先用`json.loads`解析整个数组，再分批产出。
+
+下面的`JSONStream`直接从二进制文件、socket或任意bytes迭代器中按块读取数据：
+
+- **按块读取、增量解码**：每次读取block_size字节（默认1MB），用增量UTF-8解码器转换为文本，多字节字符被切断在块边界上也没有问题
+- **用`raw_decode`扫描**：元素之间的空白和逗号用正则跳过，每个元素由`json.JSONDecoder.raw_decode`在C代码中一次解析完成；元素跨越块边界时，读入更多数据后从元素开头重新解析；元素仍不完整时每次读入的数据量翻倍，跨越很多块的大元素也只会被重新解析常数次（代价是从socket读取时可能多等一段数据）
+- **三种输入**：顶层数组逐个产出元素；`prefix='data.items'`先沿着键进入嵌套对象，再产出其中数组的元素；NDJSON（或首尾相接的多个JSON值）逐个产出每个值
+- **内存有上限**：缓冲区只保留尚未解析的部分，内存占用约为block_size加上最大的单个元素；单个元素超过max_item_size时直接报错，而不是把剩余的文件都读进内存
+- **多进程模式**：`parallel_ndjson`把NDJSON文件按字节范围切分，每个进程从范围内的第一个行首开始解析，处理到越过范围末尾的那一行为止，各自返回汇总结果
+
+```python
+import codecs
+import itertools
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_ARRAY_SEPARATOR = re.compile(r'[ \t\r\n]*(?:,[ \t\r\n]*)?')
+
+def iter_blocks(source, block_size=1 << 20):
+    """把文件路径、二进制文件、socket或bytes迭代器统一成数据块的迭代器"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter_blocks(f, block_size)
+    elif hasattr(source, 'recv'):
+        while True:
+            block = source.recv(block_size)
+            if not block:
+                return
+            yield block
+    elif hasattr(source, 'read'):
+        while True:
+            block = source.read(block_size)
+            if not block:
+                return
+            yield block
+    else:
+        yield from source
+
+class JSONStream:
+    """从二进制数据源增量解析JSON，逐个产出元素
+    
+    - 顶层数组：产出数组的每个元素
+    - prefix='data.items'：产出 {"data": {"items": [...]}} 中数组的每个元素
+    - NDJSON或首尾相接的多个JSON值：产出每个值（ndjson=True时即使每行都是数组也按行产出）
+    """
+    
+    def __init__(self, source, prefix='', ndjson=None, block_size=1 << 20, max_item_size=64 << 20):
+        self.source = source
+        self.path = prefix.split('.') if prefix else []
+        self.ndjson = ndjson
+        self.block_size = block_size
+        self.max_item_size = max_item_size
+        self.bytes_read = 0
+    
+    def __iter__(self):
+        self._blocks = iter_blocks(self.source, self.block_size)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._raw_decode = json.JSONDecoder().raw_decode
+        self._eof = False
+        self._buf, self._pos = self._refill('', 0)
+        if self.path:
+            return self._descend()
+        if not self.ndjson and self._peek() == '[':
+            self._pos += 1
+            return self._elements(']')
+        return self._elements(None)
+    
+    def _refill(self, buf, pos, grow=False):
+        """丢弃已经解析的部分，读入下一块；返回新的(buf, pos)
+        
+        grow=True表示元素还不完整：读入的新数据至少和未解析的部分一样多，缓冲区按倍数增长。
+        每次只多读一块时，跨越k块的元素要从头解析k次，总开销与元素大小的平方成正比；
+        按倍数增长时重新解析的总量不超过元素大小的两倍。
+        """
+        rest = len(buf) - pos
+        if rest > self.max_item_size:
+            raise ValueError(f"单个元素超过 {self.max_item_size} 字节")
+        wanted = rest if grow else 1
+        chunks = [buf[pos:]]
+        added = 0
+        while added < wanted:
+            block = next(self._blocks, None)
+            if block is None:
+                self._eof = True
+                chunks.append(self._decoder.decode(b'', final=True))
+                break
+            self.bytes_read += len(block)
+            text = self._decoder.decode(block)
+            chunks.append(text)
+            added += len(text) or 1     # 只含半个多字节字符的块也算读过一次
+        return ''.join(chunks), 0
+    
+    def _elements(self, closing):
+        """产出元素直到遇到closing（']'）；closing为None时一直读到数据源结束"""
+        skip = (_ARRAY_SEPARATOR if closing else _WHITESPACE).match
+        raw_decode = self._raw_decode
+        buf, pos = self._buf, self._pos
+        while True:
+            pos = skip(buf, pos).end()
+            if pos == len(buf):
+                if self._eof:
+                    if closing:
+                        raise json.JSONDecodeError("数组没有结束", buf, pos)
+                    return
+                buf, pos = self._refill(buf, pos)
+                continue
+            if buf[pos] == closing:
+                self._buf, self._pos = buf, pos + 1
+                return
+            try:
+                obj, end = raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                buf, pos = self._refill(buf, pos, grow=True)   # 元素被块边界切断，读入更多数据后重新解析
+                continue
+            if end == len(buf) and not self._eof:
+                buf, pos = self._refill(buf, pos)   # 末尾的数字可能还没有读完
+                continue
+            yield obj
+            pos = end
+    
+    def _peek(self):
+        """跳过空白，返回下一个字符（不消费）；数据源结束时返回''"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or self._eof:
+                return self._buf[self._pos:self._pos + 1]
+            self._buf, self._pos = self._refill(self._buf, self._pos)
+    
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"期望 {chars!r}", self._buf, self._pos)
+        self._pos += 1
+        return char
+    
+    def _value(self):
+        """解析一个完整的值（导航时用来读取键和跳过不需要的值）"""
+        self._peek()
+        while True:
+            try:
+                obj, end = self._raw_decode(self._buf, self._pos)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._buf, self._pos = self._refill(self._buf, self._pos, grow=True)
+                continue
+            self._buf, self._pos = self._refill(self._buf, self._pos)
+    
+    def _descend(self):
+        """沿着prefix中的键进入嵌套对象，然后产出目标数组的元素"""
+        for key in self.path:
+            self._expect('{')
+            char = self._peek()
+            while char != '}':
+                name = self._value()
+                self._expect(':')
+                if name == key:
+                    break
+                self._value()           # 跳过其他键的值（这个值会被完整解析）
+                char = self._expect(',}')
+            else:
+                raise KeyError(f"找不到键: {'.'.join(self.path)}")
+        self._expect('[')
+        yield from self._elements(']')
+
+def iter_json_batches(source, chunk_size=100, prefix=''):
+    """process_large_json的流式版本：每次产出chunk_size个元素组成的列表"""
+    items = iter(JSONStream(source, prefix=prefix))
+    while True:
+        batch = list(itertools.islice(items, chunk_size))
+        if not batch:
+            return
+        yield batch
+
+def _ndjson_range(path, start, end, block_size):
+    """产出行首位于[start, end)之间的所有完整行"""
+    with open(path, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()                # start-1处是换行符时只消费它，否则跳过被切开的那一行
+        pos = f.tell()
+        if pos >= end:
+            return
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            # 行首在end之前的最后一行，结束于end-1处或之后的第一个换行符
+            cut = block.find(b'\n', max(end - 1 - pos, 0)) if pos + len(block) >= end else -1
+            if cut >= 0:
+                yield block[:cut + 1]
+                return
+            yield block
+            pos += len(block)
+
+def _process_ndjson_range(path, start, end, func, block_size):
+    return func(iter(JSONStream(_ndjson_range(path, start, end, block_size),
+                                ndjson=True, block_size=block_size)))
+
+def parallel_ndjson(path, func, workers=None, block_size=1 << 20):
+    """把NDJSON文件按字节范围分给多个进程，返回每个范围的func(元素迭代器)结果
+    
+    func必须是模块级函数（需要被pickle），并且应该返回汇总结果而不是全部元素，
+    否则把元素传回主进程的开销会抵消并行的收益
+    """
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path)
+    step = max(-(-size // workers), 1)
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_process_ndjson_range, path, start, min(start + step, size), func, block_size)
+                   for start in range(0, size, step)]
+        return [future.result() for future in futures]
+```
+
+下面的测试先检查数组、嵌套前缀、NDJSON、socket输入和多进程切分的正确性，再在50万条记录（约50MB）上比较速度和峰值内存：
+
+```python
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+
+def summarize(items):
+    """parallel_ndjson使用的汇总函数：数量、value之和、value大于500000的数量"""
+    count = total = filtered = 0
+    for item in items:
+        count += 1
+        value = item.get('value', 0)
+        total += value
+        filtered += value > 500000
+    return count, total, filtered
+
+def test_json_stream():
+    # 元素被切在各种位置上：块大小取很小的质数
+    doc = '[1, "a,]\\"b", {"x": [1, {"y": "中文"}]}, 2.5e3, null, [], 12345]'
+    assert list(JSONStream([doc.encode()[i:i + 7] for i in range(0, len(doc.encode()), 7)])) == json.loads(doc)
+    assert list(JSONStream(iter([b'[', b']']))) == []
+    
+    nested = {'meta': {'total': 3, 'items': [0]}, 'data': {'next': None, 'items': [{'id': 1}, {'id': 2}, {'id': 3}]}}
+    blocks = [json.dumps(nested).encode()[i:i + 5] for i in range(0, 200, 5)]
+    assert list(JSONStream(blocks, prefix='data.items')) == nested['data']['items']
+    try:
+        list(JSONStream([json.dumps(nested).encode()], prefix='data.missing'))
+        raise AssertionError("应该抛出KeyError")
+    except KeyError:
+        pass
+    
+    ndjson = b'{"a": 1}\n[1, 2]\n\n"text"\n42\n'
+    assert list(JSONStream([ndjson], ndjson=True)) == [{'a': 1}, [1, 2], 'text', 42]
+    
+    try:
+        list(JSONStream([b'[1, 2, {"a": '], block_size=4))
+        raise AssertionError("应该抛出JSONDecodeError")
+    except json.JSONDecodeError:
+        pass
+    
+    # 从socket读取
+    left, right = socket.socketpair()
+    payload = json.dumps(list(range(100000))).encode()
+    threading.Thread(target=lambda: (right.sendall(payload), right.close())).start()
+    assert sum(JSONStream(left, block_size=4096)) == sum(range(100000))
+    left.close()
+    
+    # 字节范围的边界恰好落在换行符上或行中间，每一行都只被处理一次
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'lines.ndjson')
+    with open(path, 'w') as f:
+        for i in range(1000):
+            f.write(json.dumps({'value': i, 'pad': 'x' * (i % 37)}) + '\n')
+    size = os.path.getsize(path)
+    for step in (1, 7, 64, 1000, size):
+        seen = []
+        for start in range(0, size, step):
+            seen.extend(item['value'] for item in JSONStream(_ndjson_range(path, start, min(start + step, size), 16), ndjson=True))
+        assert seen == list(range(1000)), step
+    assert sum(r[1] for r in parallel_ndjson(path, summarize, workers=3)) == sum(range(1000))
+    shutil.rmtree(directory)
+    print("所有测试通过")
+
+def _measure(label, func, size):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label}: {size / elapsed / 2**20:6.1f} MB/s, 峰值内存 {peak / 2**20:7.1f} MB, 结果 {result}")
+
+def benchmark_json_stream(n=500_000):
+    directory = tempfile.mkdtemp()
+    array_path = os.path.join(directory, 'items.json')
+    ndjson_path = os.path.join(directory, 'items.ndjson')
+    with open(array_path, 'w') as array_file, open(ndjson_path, 'w') as ndjson_file:
+        array_file.write('[')
+        for i in range(n):
+            item = json.dumps({"id": i, "name": f"Item {i}", "value": i * 100, "tags": [f"tag{i%10}" for i in range(i%5)]})
+            array_file.write(item if i == 0 else ',' + item)
+            ndjson_file.write(item + '\n')
+        array_file.write(']')
+    size = os.path.getsize(array_path)
+    print(f"数组文件 {size / 2**20:.1f} MB, NDJSON文件 {os.path.getsize(ndjson_path) / 2**20:.1f} MB")
+    
+    def load_whole():
+        with open(array_path, 'rb') as f:
+            return summarize(json.load(f))
+    
+    def load_whole_ndjson():
+        with open(ndjson_path, 'rb') as f:
+            return summarize(json.loads(line) for line in f)
+    
+    _measure('json.load 整个数组        ', load_whole, size)
+    _measure('JSONStream 数组           ', lambda: summarize(JSONStream(array_path)), size)
+    _measure('逐行json.loads NDJSON     ', load_whole_ndjson, size)
+    _measure('JSONStream NDJSON         ', lambda: summarize(JSONStream(ndjson_path)), size)
+    for workers in (1, 4):
+        start = time.perf_counter()
+        results = parallel_ndjson(ndjson_path, summarize, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"parallel_ndjson({workers}个进程)  : {size / elapsed / 2**20:6.1f} MB/s, "
+              f"结果 {tuple(map(sum, zip(*results)))}")
+    shutil.rmtree(directory)
+    
+    # 跨越很多块的单个大元素：缓冲区按倍数增长，不会每读一块就从头重新解析
+    big_doc = json.dumps([[{"id": i, "name": f"Item {i}"} for i in range(700_000)], 1]).encode()
+    start = time.perf_counter()
+    json.loads(big_doc)
+    loads_time = time.perf_counter() - start
+    start = time.perf_counter()
+    items = list(JSONStream([big_doc[i:i + (1 << 20)] for i in range(0, len(big_doc), 1 << 20)]))
+    stream_time = time.perf_counter() - start
+    assert len(items[0]) == 700_000 and items[1] == 1
+    print(f"{len(big_doc) / 2**20:.0f} MB的单个元素: json.loads {loads_time:.3f} 秒, JSONStream {stream_time:.3f} 秒")
+
+# 运行示例
+test_json_stream()
+benchmark_json_stream()
+```
+
+参考结果（Linux，Python 3.11，单核，50万条记录，约40MB）：
+
+| 方法 | 速度 | 峰值内存 |
+|------|------|----------|
+| SimpleJSONStreamParser（10万条，数据已在内存中） | 约 2.2 MB/s | 整个文档 |
+| json.load 整个数组 | 15.7 MB/s | 315 MB |
+| JSONStream 数组 | 18.1 MB/s | 5 MB |
+| 逐行 json.loads NDJSON | 11.8 MB/s | 很小 |
+| JSONStream NDJSON | 20.0 MB/s | 5 MB |
+| parallel_ndjson（1个进程 / 4个进程） | 21.4 / 19.9 MB/s | 每个进程约5 MB |
+
+几点说明：
+
+- JSONStream比逐字符扫描的SimpleJSONStreamParser快约8倍，也比一次性`json.load`快：后者要同时保留50万个对象，垃圾回收会反复遍历这个越来越大的列表，峰值内存是文件大小的8倍。
+- 每个元素的解析都在C代码中完成，剩下的主要开销是创建Python对象，单核上约20MB/s就是标准库`json`的上限。多GB的文件要达到每秒数百MB，需要多核：`parallel_ndjson`的各个进程互不依赖，速度随CPU核数近似线性增长。上表是在单核机器上测得的，所以4个进程并没有更快，只说明切分本身的开销可以忽略。
+- 基准最后一项是一个约26MB、包含70万个小对象的单个元素（块大小1MB）：`json.loads`约0.6秒，JSONStream约1.6秒。元素没有读完时缓冲区按倍数增长，重新解析的数据总量不超过元素大小的两倍，多出来的时间就是这几次失败的解析；原来每读一块就从头解析一次，同样的元素需要约9.3秒。
+- 只有NDJSON可以按字节范围切分，顶层数组的元素边界必须从头扫描才能确定。需要并行处理的导出数据，应该优先让服务端输出NDJSON。
+- 单核速度仍然不够时，可以在每个进程内改用orjson等C扩展逐行解析NDJSON（同样的数据上逐行`orjson.loads`约为77MB/s），按字节范围切分和多进程汇总的结构不变。
+
 ### 6.2 优化提示
 
 1. **直接文件操作**：当处理大型JSON文件时，直接使用`json.load()`和`json.dump()`处理文件，而不是先读取文件内容再使用`json.loads()`和`json.dumps()`。
@@ -589,6 +589,621 @@ def object_cache_system():
 object_cache_system()
 ```
 
+#### 6.1.1 单文件日志结构存储
+
+上面的`ObjectCache`每个键对应一个`md5(key).pkl`文件：`get`要先`exists()`做一次stat，再`open`、读取、关闭；`clear`要`glob`整个目录再逐个删除。键少的时候这没有问题，到了几十万、上百万个键，每次操作都要经过文件系统的路径查找、目录项和inode，文件系统本身就成了瓶颈。过期时间存在pickle内部，不读出整个值就无法判断是否过期；写到一半崩溃，会留下一个无法反序列化的文件。
+
+下面的`LogStore`改用日志结构（Bitcask式）的单文件存储：
+
+- **追加写单个数据文件**：`set`和`delete`都只是在文件末尾追加一条记录。记录由固定长度的头（CRC32、标志位、键长度、过期时间、数据长度）、键和数据组成，用一次`os.writev`写出，不需要先拼接成一个大的bytes
+- **内存哈希索引**：字典把每个键映射为`(数据偏移, 数据长度, 布局, 过期时间)`。`get`只做一次字典查找和一次`os.pread`，不`open`文件，也不stat；未命中的键根本不碰磁盘。过期时间保存在索引里，过期判断不需要读数据
+- **带外缓冲区**：用pickle协议5序列化，大块的连续缓冲区（`PickleBuffer`、numpy数组以及实现了协议5的对象）通过`buffer_callback`取出，直接写进记录，不复制到pickle数据里；读取时把`pread`结果上的`memoryview`切片作为`buffers`传给`pickle.loads`，不再复制。值本身是`bytes`时原样存储，读出来就是`pread`的结果
+- **后台压缩**：被覆盖、删除和过期的记录计为垃圾字节，超过文件的一定比例后，后台线程把存活的记录复制到新文件，再持锁补上复制期间追加的记录，最后`os.replace`原子替换。索引和文件描述符放在同一个元组里一起替换，读取不需要加锁
+- **崩溃安全的索引重建**：`close`时把索引写到提示文件（`.hint`），下次打开直接加载，再扫描它之后追加的记录；提示文件不存在或与数据文件不匹配时，从头扫描日志重建索引。扫描时逐条校验CRC，遇到写了一半或者损坏的记录，就从这里截断文件
+- **`clear`只需换文件**：换成一个新的空文件，耗时与键的数量无关
+
+```python
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:          # Windows没有fcntl，需要调用方自己保证只有一个进程写入
+    fcntl = None
+
+_CRC = struct.Struct('<I')
+# 记录头（crc之后）：标志位、带外缓冲区个数、键长度、过期时间戳（0表示永不过期）、pickle数据长度
+_META = struct.Struct('<BBHdQ')
+HEADER_SIZE = _CRC.size + _META.size
+
+TOMBSTONE = 0x01      # 删除标记
+RAW = 0x02            # 值本身是bytes，原样存储，不经过pickle
+RAW_LAYOUT = -1       # 索引中表示"原样bytes"的布局
+
+def _write_all(fd, parts):
+    """用writev一次写出多段数据，处理部分写入"""
+    parts = [memoryview(p) for p in parts if len(p)]
+    while parts:
+        written = os.writev(fd, parts[:1024])
+        while written:
+            n = parts[0].nbytes
+            if written >= n:
+                written -= n
+                parts.pop(0)
+            else:
+                parts[0] = parts[0][written:]
+                written = 0
+
+class LogStore:
+    """单文件日志结构对象存储
+    
+    所有记录追加写入同一个数据文件，内存中的字典索引记录每个键的
+    (数据偏移, 数据长度, 布局, 过期时间)。记录格式：
+        
+        crc32 | 标志位 | 缓冲区个数 | 键长度 | 过期时间 | pickle长度 | 各缓冲区长度 | 键 | pickle数据 | 带外缓冲区...
+    """
+    
+    def __init__(self, path, compact_ratio=0.5, compact_min_bytes=16 * 1024 * 1024,
+                 background_compaction=True, oob_threshold=64 * 1024, sync=False):
+        self.path = os.fspath(path)
+        self.hint_path = self.path + '.hint'
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.background_compaction = background_compaction
+        self.oob_threshold = oob_threshold
+        self.sync = sync
+        self.truncated_bytes = 0         # 打开时因记录损坏或写入不完整而截掉的字节数
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._generation = 0
+        self._retired_fds = []
+        
+        fd = self._open_log(self.path)
+        index, end, dead = self._load_index(fd)
+        # 索引和文件描述符放在同一个元组里，压缩完成时一次性替换，读取方不需要加锁
+        self._state = (index, fd)
+        self._end = end
+        self._dead = dead
+    
+    # ---------- 打开与索引重建 ----------
+    
+    @staticmethod
+    def _open_log(path, truncate=False):
+        flags = os.O_RDWR | os.O_CREAT | os.O_APPEND | (os.O_TRUNC if truncate else 0)
+        fd = os.open(path, flags, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                raise RuntimeError(f"{path} 已被其他进程打开") from None
+        return fd
+    
+    def _load_index(self, fd):
+        """先加载提示文件（hint），再扫描它之后追加的记录；提示文件无效时全量扫描"""
+        st = os.fstat(fd)
+        index, start, dead = {}, 0, 0
+        try:
+            with open(self.hint_path, 'rb') as f:
+                inode, hint_end, hint_index, hint_dead = pickle.load(f)
+            if inode == st.st_ino and hint_end <= st.st_size:
+                index, start, dead = hint_index, hint_end, hint_dead
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            pass
+        end, dead = self._scan(fd, index, start, dead)
+        return index, end, dead
+    
+    def _scan(self, fd, index, offset, dead):
+        """从offset开始顺序扫描日志并更新索引，遇到CRC错误或不完整的记录就截断文件"""
+        size = os.fstat(fd).st_size
+        now = time.time()
+        with open(fd, 'rb', buffering=1024 * 1024, closefd=False) as f:
+            f.seek(offset)
+            while offset < size:
+                head = f.read(HEADER_SIZE)
+                if len(head) < HEADER_SIZE:
+                    break
+                (crc,) = _CRC.unpack_from(head)
+                flags, nbuf, key_len, expire_at, pickle_len = _META.unpack_from(head, _CRC.size)
+                lens = f.read(8 * nbuf)
+                if len(lens) < 8 * nbuf:
+                    break
+                buf_lens = struct.unpack(f'<{nbuf}Q', lens)
+                data_size = pickle_len + sum(buf_lens)
+                prefix = HEADER_SIZE + len(lens) + key_len
+                if offset + prefix + data_size > size:
+                    break
+                key_bytes = f.read(key_len)
+                data = f.read(data_size)
+                checksum = zlib.crc32(data, zlib.crc32(key_bytes, zlib.crc32(lens, zlib.crc32(head[_CRC.size:]))))
+                if checksum != crc:
+                    break
+                
+                key = key_bytes.decode()
+                record_size = prefix + data_size
+                old = index.pop(key, None)
+                if old is not None:
+                    dead += self._record_size(key, old)
+                if flags & TOMBSTONE or (expire_at and expire_at <= now):
+                    dead += record_size
+                else:
+                    layout = RAW_LAYOUT if flags & RAW else (buf_lens or None)
+                    index[key] = (offset + prefix, data_size, layout, expire_at or None)
+                offset += record_size
+        
+        if offset < size:
+            # 崩溃时最后一条记录可能只写了一半：截掉它之后的所有内容
+            self.truncated_bytes += size - offset
+            os.ftruncate(fd, offset)
+        return offset, dead
+    
+    @staticmethod
+    def _record_size(key, entry):
+        _, size, layout, _ = entry
+        nbuf = len(layout) if type(layout) is tuple else 0
+        return HEADER_SIZE + 8 * nbuf + len(key.encode()) + size
+    
+    # ---------- 读写 ----------
+    
+    def set(self, key, value, expire_seconds=None):
+        """存储对象；bytes原样存储，大的连续缓冲区（bytearray、numpy数组等）作为带外缓冲区存储"""
+        key = key if type(key) is str else str(key)
+        expire_at = time.time() + expire_seconds if expire_seconds is not None else 0.0
+        if type(value) is bytes:
+            self._append(key, RAW, expire_at, value, [], RAW_LAYOUT)
+            return True
+        
+        buffers = []
+        
+        def collect(buffer):
+            try:
+                raw = buffer.raw()
+            except BufferError:          # 非连续的缓冲区只能带内序列化
+                return True
+            if raw.nbytes < self.oob_threshold:
+                return True
+            buffers.append(raw)
+            return False
+        
+        payload = pickle.dumps(value, protocol=5, buffer_callback=collect)
+        layout = tuple(b.nbytes for b in buffers) or None
+        self._append(key, 0, expire_at, payload, buffers, layout)
+        return True
+    
+    def _append(self, key, flags, expire_at, payload, buffers, layout):
+        key_bytes = key.encode()
+        lens = struct.pack(f'<{len(buffers)}Q', *[b.nbytes for b in buffers])
+        meta = _META.pack(flags, len(buffers), len(key_bytes), expire_at, len(payload))
+        crc = zlib.crc32(key_bytes, zlib.crc32(lens, zlib.crc32(meta)))
+        crc = zlib.crc32(payload, crc)
+        for buffer in buffers:
+            crc = zlib.crc32(buffer, crc)
+        prefix = HEADER_SIZE + len(lens) + len(key_bytes)
+        data_size = len(payload) + sum(b.nbytes for b in buffers)
+        
+        with self._lock:
+            index, fd = self._state
+            _write_all(fd, [_CRC.pack(crc) + meta, lens, key_bytes, payload, *buffers])
+            if self.sync:
+                os.fdatasync(fd)
+            offset = self._end
+            self._end += prefix + data_size
+            old = index.pop(key, None)
+            if old is not None:
+                self._dead += self._record_size(key, old)
+            if flags & TOMBSTONE:
+                self._dead += prefix + data_size
+            else:
+                index[key] = (offset + prefix, data_size, layout, expire_at or None)
+            self._maybe_compact()
+    
+    def get(self, key, default=None):
+        """读取对象：一次字典查找 + 一次pread，不打开文件也不做stat"""
+        key = key if type(key) is str else str(key)
+        index, fd = self._state
+        entry = index.get(key)
+        if entry is None:
+            return default
+        offset, size, layout, expire_at = entry
+        if expire_at is not None and expire_at <= time.time():
+            self._expire(key, entry)
+            return default
+        
+        data = os.pread(fd, size, offset)
+        if layout is None:
+            return pickle.loads(data)
+        if layout == RAW_LAYOUT:
+            return data
+        # 带外缓冲区是同一块读取结果上的切片，不再复制
+        view = memoryview(data)
+        pickle_len = position = size - sum(layout)
+        buffers = []
+        for n in layout:
+            buffers.append(view[position:position + n])
+            position += n
+        return pickle.loads(view[:pickle_len], buffers=buffers)
+    
+    def _expire(self, key, entry):
+        # 过期时间写在记录里，重建索引时会跳过，所以这里只需要从索引删除
+        with self._lock:
+            index = self._state[0]
+            if index.get(key) is entry:
+                del index[key]
+                self._dead += self._record_size(key, entry)
+    
+    def delete(self, key):
+        key = key if type(key) is str else str(key)
+        if key not in self._state[0]:
+            return False
+        self._append(key, TOMBSTONE, 0.0, b'', [], None)
+        return True
+    
+    def __contains__(self, key):
+        key = key if type(key) is str else str(key)
+        entry = self._state[0].get(key)
+        return entry is not None and (entry[3] is None or entry[3] > time.time())
+    
+    def __len__(self):
+        """索引中的键数（可能包含已过期但还没被访问到的键）"""
+        return len(self._state[0])
+    
+    def keys(self):
+        return list(self._state[0])
+    
+    def clear(self):
+        """清空：换成一个新的空文件，不需要逐个删除"""
+        with self._lock:
+            count = len(self._state[0])
+            tmp_path = self.path + '.clear'
+            fd = self._open_log(tmp_path, truncate=True)
+            os.replace(tmp_path, self.path)
+            self._generation += 1
+            self._swap({}, fd, 0, 0)
+            return count
+    
+    def stats(self):
+        return {'keys': len(self._state[0]), 'file_bytes': self._end, 'dead_bytes': self._dead}
+    
+    # ---------- 压缩 ----------
+    
+    def _maybe_compact(self):
+        if (self._compactor is None and self._dead >= self.compact_min_bytes
+                and self._dead >= self._end * self.compact_ratio):
+            if self.background_compaction:
+                self._compactor = threading.Thread(target=self._compact, daemon=True)
+                self._compactor.start()
+            else:
+                self._compactor = True
+                self._compact()
+    
+    def compact(self):
+        """立即压缩（如果后台压缩正在进行，则等待它完成）"""
+        compactor = self._compactor
+        if isinstance(compactor, threading.Thread):
+            compactor.join()
+        with self._lock:
+            self._compactor = True
+        self._compact()
+    
+    def _compact(self):
+        """把存活的记录复制到新文件，再持锁补上复制期间追加的记录，最后原子替换"""
+        tmp_path = self.path + '.compact'
+        try:
+            with self._lock:
+                index, old_fd = self._state
+                snapshot = dict(index)
+                snapshot_end = self._end
+                generation = self._generation
+            
+            new_fd = self._open_log(tmp_path, truncate=True)
+            new_index = {}
+            now = time.time()
+            position = 0
+            try:
+                with open(new_fd, 'wb', buffering=1024 * 1024, closefd=False) as out:
+                    for key, entry in snapshot.items():
+                        offset, size, layout, expire_at = entry
+                        if expire_at is not None and expire_at <= now:
+                            continue
+                        record_size = self._record_size(key, entry)
+                        prefix = record_size - size
+                        out.write(os.pread(old_fd, record_size, offset - prefix))
+                        new_index[key] = (position + prefix, size, layout, expire_at)
+                        position += record_size
+                
+                with self._lock:
+                    if generation != self._generation:      # 压缩期间被clear()了
+                        os.close(new_fd)
+                        os.unlink(tmp_path)
+                        return
+                    # 复制期间追加的记录原样拷贝过去，再用_scan重放到新索引
+                    tail = snapshot_end
+                    while tail < self._end:
+                        chunk = os.pread(old_fd, min(self._end - tail, 8 * 1024 * 1024), tail)
+                        _write_all(new_fd, [chunk])
+                        tail += len(chunk)
+                    end, dead = self._scan(new_fd, new_index, position, 0)
+                    os.fsync(new_fd)
+                    os.replace(tmp_path, self.path)
+                    self._swap(new_index, new_fd, end, dead)
+            except BaseException:
+                os.close(new_fd)
+                raise
+        finally:
+            self._compactor = None
+    
+    def _swap(self, index, fd, end, dead):
+        # 正在进行的get可能还拿着旧的文件描述符，所以旧描述符推迟到下一次替换时才关闭
+        for old_fd in self._retired_fds:
+            os.close(old_fd)
+        self._retired_fds = [self._state[1]]
+        self._state = (index, fd)
+        self._end, self._dead = end, dead
+        try:
+            os.unlink(self.hint_path)
+        except FileNotFoundError:
+            pass
+    
+    # ---------- 关闭 ----------
+    
+    def close(self):
+        """等待后台压缩结束，写出提示文件，下次打开时不必全量扫描"""
+        compactor = self._compactor
+        if isinstance(compactor, threading.Thread):
+            compactor.join()
+        with self._lock:
+            index, fd = self._state
+            if fd < 0:
+                return
+            os.fsync(fd)
+            tmp_path = self.hint_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((os.fstat(fd).st_ino, self._end, index, self._dead), f, protocol=5)
+            os.replace(tmp_path, self.hint_path)
+            for old_fd in self._retired_fds + [fd]:
+                os.close(old_fd)
+            self._retired_fds = []
+            self._state = ({}, -1)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+```
+
+测试和基准。`FilePerKeyCache`用和`ObjectCache`一样的方式存储（每个键一个pkl文件，去掉了`print`），`Frame`是一个按PEP 574支持带外序列化的对象，numpy数组在协议5下的行为与它相同：
+
+```python
+import hashlib
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+class FilePerKeyCache:
+    """与6.1节ObjectCache相同的存储方式（每个键一个md5命名的pkl文件），去掉了print"""
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True)
+    
+    def _get_cache_path(self, key):
+        return self.cache_dir / (hashlib.md5(str(key).encode()).hexdigest() + ".pkl")
+    
+    def set(self, key, value, expire_seconds=None):
+        with open(self._get_cache_path(key), 'wb') as f:
+            pickle.dump({'value': value, 'timestamp': time.time(),
+                         'expire_seconds': expire_seconds}, f)
+    
+    def get(self, key, default=None):
+        cache_path = self._get_cache_path(key)
+        if not cache_path.exists():
+            return default
+        with open(cache_path, 'rb') as f:
+            cache_data = pickle.load(f)
+        if (cache_data['expire_seconds'] is not None
+                and time.time() - cache_data['timestamp'] > cache_data['expire_seconds']):
+            cache_path.unlink()
+            return default
+        return cache_data['value']
+    
+    def clear(self):
+        count = 0
+        for cache_file in self.cache_dir.glob("*.pkl"):
+            cache_file.unlink()
+            count += 1
+        return count
+
+class Frame:
+    """带一大块二进制数据的对象，按PEP 574的方式支持带外序列化（numpy数组也是这样做的）"""
+    
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+    
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return type(self), (self.name, pickle.PickleBuffer(self.data))
+        return type(self), (self.name, bytes(self.data))
+
+def test_log_store():
+    workdir = Path(tempfile.mkdtemp())
+    path = workdir / 'store.log'
+    try:
+        # 1. 基本读写、覆盖、删除、过期
+        store = LogStore(path)
+        store.set('key1', 42)
+        store.set('key2', {'nested': [1, 2, 3, {'a': 'b'}]})
+        store.set('key1', 43)
+        store.set(7, 'int key')
+        store.set('tmp', '临时值', expire_seconds=0.2)
+        assert store.get('key1') == 43 and store.get('7') == 'int key'
+        assert store.get('key2') == {'nested': [1, 2, 3, {'a': 'b'}]}
+        assert store.get('tmp') == '临时值'
+        time.sleep(0.3)
+        assert store.get('tmp', '默认值') == '默认值' and 'tmp' not in store
+        assert store.delete('key2') and not store.delete('key2')
+        assert store.get('key2', '不存在') == '不存在'
+        
+        # 2. 原样bytes和带外缓冲区
+        blob = os.urandom(1024 * 1024)
+        store.set('raw', blob)
+        store.set('oob', {'frame': Frame('image', bytearray(blob)), 'small': Frame('tiny', b'abc')})
+        assert store.get('raw') == blob
+        value = store.get('oob')
+        assert value['frame'].data == blob and type(value['frame'].data) is memoryview
+        assert value['small'].data == b'abc'
+        store.close()
+        
+        # 3. 通过提示文件重新打开，以及删除提示文件后全量扫描
+        expected = {'key1': 43, '7': 'int key', 'raw': blob}
+        for use_hint in (True, False):
+            if not use_hint:
+                os.unlink(str(path) + '.hint')
+            with LogStore(path) as store:
+                assert sorted(store.keys()) == ['7', 'key1', 'oob', 'raw']
+                assert all(store.get(k) == v for k, v in expected.items())
+                assert store.get('oob')['frame'].data == blob
+        
+        # 4. 模拟崩溃：最后一条记录只写了一半，或者内容损坏
+        store = LogStore(path)
+        store.set('last', 'x' * 1000)
+        size = store.stats()['file_bytes']
+        os.close(store._state[1])                  # 不写提示文件，直接"崩溃"
+        with open(path, 'r+b') as f:
+            f.truncate(size - 10)
+        store = LogStore(path)
+        assert store.truncated_bytes > 0 and 'last' not in store and store.get('key1') == 43
+        store.set('last', 'y' * 1000)
+        os.close(store._state[1])
+        with open(path, 'r+b') as f:
+            f.seek(-5, os.SEEK_END)
+            f.write(b'!!!!!')
+        store = LogStore(path)
+        assert 'last' not in store and store.get('raw') == blob
+        
+        # 5. 后台压缩：压缩期间继续写入，数据不丢失，文件变小
+        store.close()
+        store = LogStore(path, compact_min_bytes=1024 * 1024)
+        for round_ in range(20):
+            for i in range(2000):
+                store.set(f'k{i}', {'round': round_, 'payload': 'v' * 100})
+        compactor = store._compactor
+        if isinstance(compactor, threading.Thread):
+            compactor.join()
+        store.compact()
+        assert all(store.get(f'k{i}')['round'] == 19 for i in range(2000))
+        assert store.get('raw') == blob
+        assert store.stats()['dead_bytes'] == 0
+        assert store.stats()['file_bytes'] == os.path.getsize(path)
+        store.close()
+        with LogStore(path) as store:
+            assert store.get('k1999')['round'] == 19 and len(store) == 2004
+            
+            # 6. 清空
+            assert store.clear() == 2004 and len(store) == 0 and os.path.getsize(path) == 0
+            store.set('after', 1)
+        with LogStore(path) as store:
+            assert store.keys() == ['after']
+        print("LogStore测试通过")
+    finally:
+        shutil.rmtree(workdir)
+
+def benchmark_log_store(n=100_000):
+    workdir = Path(tempfile.mkdtemp())
+    try:
+        keys = [f'user:{i}' for i in range(n)]
+        values = [{'id': i, 'name': f'用户{i}', 'tags': ['a', 'b'], 'score': i * 0.5} for i in range(n)]
+        lookups = random.Random(1).choices(keys, k=n)
+        caches = [('每个键一个文件', FilePerKeyCache(workdir / 'files')),
+                  ('LogStore      ', LogStore(workdir / 'store.log'))]
+        for name, cache in caches:
+            start = time.perf_counter()
+            for key, value in zip(keys, values):
+                cache.set(key, value)
+            set_rate = n / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for key in lookups:
+                cache.get(key)
+            get_rate = n / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for i in range(n // 10):
+                cache.get(f'missing:{i}')
+            miss_rate = n / 10 / (time.perf_counter() - start)
+            print(f"{name}: set {set_rate / 1000:6.1f} 千次/秒, get {get_rate / 1000:6.1f} 千次/秒, "
+                  f"未命中 {miss_rate / 1000:7.1f} 千次/秒")
+        
+        store = caches[1][1]
+        store.close()
+        for use_hint in (True, False):
+            if not use_hint:
+                os.unlink(str(workdir / 'store.log') + '.hint')
+            start = time.perf_counter()
+            store = LogStore(workdir / 'store.log')
+            label = '提示文件' if use_hint else '全量扫描'
+            print(f"打开LogStore（{label}）: {time.perf_counter() - start:.3f} 秒")
+            store.close()
+        
+        # 大块二进制数据：64MB的bytes，以及带64MB带外缓冲区的对象
+        store = LogStore(workdir / 'store.log')
+        blob = os.urandom(64 * 1024 * 1024)
+        samples = [('bytes', blob), ('Frame', Frame('image', blob))]
+        for name, cache in [('每个键一个文件', caches[0][1]), ('LogStore      ', store)]:
+            for label, value in samples:
+                set_times, get_times = [], []
+                for i in range(5):
+                    start = time.perf_counter()
+                    cache.set(f'{label}{i}', value)
+                    set_times.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    cache.get(f'{label}{i}')
+                    get_times.append(time.perf_counter() - start)
+                print(f"{name}: 64MB {label} set {min(set_times) * 1000:6.1f} 毫秒, "
+                      f"get {min(get_times) * 1000:6.1f} 毫秒")
+        
+        for name, cache in [('每个键一个文件', caches[0][1]), ('LogStore      ', store)]:
+            start = time.perf_counter()
+            cache.clear()
+            print(f"{name}: clear {time.perf_counter() - start:.3f} 秒")
+        store.close()
+    finally:
+        shutil.rmtree(workdir)
+
+# 运行示例
+test_log_store()
+benchmark_log_store()
+```
+
+参考结果（Linux，Python 3.11，单核，ext4，10万个键，每个值是一个小字典）：
+
+| 操作 | 每个键一个文件 | LogStore |
+|------|----------------|----------|
+| set | 约 10-27 千次/秒 | 约 75-100 千次/秒 |
+| get（随机命中） | 约 35-50 千次/秒 | 约 210-330 千次/秒 |
+| get（未命中） | 约 55-90 千次/秒 | 约 1200-2200 千次/秒 |
+| clear | 约 2.4-8.9 秒 | 约 0.01-0.09 秒 |
+| 64MB bytes set / get | 约 25-30 / 41-53 毫秒 | 约 45-65 / 41-54 毫秒 |
+| 64MB Frame set / get | 约 57-67 / 94-110 毫秒 | 约 42-62 / 35-46 毫秒 |
+
+| 打开LogStore | 10万个键 | 100万个键 |
+|--------------|----------|-----------|
+| 加载提示文件 | 约 0.05-0.07 秒 | 约 1.1 秒 |
+| 全量扫描重建 | 约 0.23-0.42 秒 | 约 5-7 秒 |
+
+几点说明：
+
+- 小对象的读写快了4-7倍，主要省掉的是文件系统操作：每次`get`少了一次stat和一次open/close，每次`set`少了创建文件。100万个键时LogStore的set和get仍有约85千次/秒和210-260千次/秒，数据文件约113MB；每个键一个文件的方式这时要在一个目录里放100万个文件。
+- 索引全部在内存中，100万个键的索引约占185MB（每个键约190字节，大部分是元组和整数对象的开销）。键的数量再大一个数量级时，应该把索引换成`dbm`或SQLite这类磁盘索引，或者用紧凑的数组存储偏移。
+- 单个64MB的`bytes`值，`set`比每个键一个文件慢一些：多了一遍CRC32计算（约20毫秒），而且追加写总要分配新的磁盘空间，基准中每个键一个文件的方式则是覆盖写同一个文件；`get`两者都是一次读取，耗时相当。带外缓冲区的收益体现在`Frame`这类对象上：写入时不把64MB复制进pickle数据，读出时`Frame.data`直接是`pread`结果上的`memoryview`。
+- 默认`sync=False`：每条记录用`os.writev`直接写给操作系统，进程崩溃不会丢数据，但断电可能丢失最后几条记录。这些记录在重建时会因CRC不匹配或长度不足被截掉，不会产生半条记录。需要断电安全时传入`sync=True`，每次写入后调用`fdatasync`，写入速度会下降到磁盘同步的速度。
+- 用`fcntl.flock`保证只有一个进程打开同一个数据文件（Windows上没有`fcntl`，需要调用方自己保证）。同一进程内的多个线程可以共享一个`LogStore`：写入持锁串行执行，读取不加锁。
+- 被替换下来的文件描述符推迟到下一次压缩或`clear`时才关闭，避免正在`pread`的读线程拿到已关闭的描述符。
+
 ### 6.2 程序状态保存与恢复
 
 ```python
@@ -585,6 +585,618 @@ def simple_object_database():
 simple_object_database()
 ```
 
+#### 4.1.1 二级索引与查询规划
+
+`SimpleDB.find_by(predicate)`只能把表中的每条记录都反序列化出来，再交给Python谓词判断；表以`writeback=True`打开，这些记录还会全部留在内存里。100万条记录时，一次查询要二十多秒，并且占用上GB内存。
+
+下面的`IndexedDB`保持了`SimpleDB`的接口（`open_table`、`insert`、`get`、`update`、`delete`、`find_all`、`find_by`、`count`、`clear`），另外加上了声明式的二级索引和按字段条件的查询：
+
+- **二级索引**：`create_index(field)`为字段建立索引，索引由两部分组成：`值 -> 记录键集合`的字典（用于等值和`in`查询），以及按值排序的数组（用`bisect`做范围查询）。`insert`、`update`、`delete`时同步维护索引。有序数组在第一次范围查询时才建立，并按类型分组，同一字段里混有数字和字符串也不会出错；新出现的取值先追加在组的末尾，下一次范围查询时再合并，批量插入时不会为每条记录移动整个数组。索引字段的取值必须可哈希，`insert`和`update`在写入之前检查，不会留下已写入但没有索引的记录
+- **字段条件**：`find({'age': ('<', 32), 'city': '北京'})`，支持`==`（直接写值）、`!=`、`<`、`<=`、`>`、`>=`、`in`、`between`；`predicate`参数可以再对结果做任意过滤
+- **查询规划**：对每个能用索引的条件估计匹配的记录数，选择最少的那个索引；其余能用索引的等值条件与它取交集，剩下的条件只对候选记录逐条检查。`explain`返回选中的计划，没有可用的索引时退回全表扫描
+- **只用索引计数**：`count(conditions)`和`find_keys`在所有条件都能由索引满足时不读取任何记录；`count()`不再遍历
+- **索引的持久化**：索引保存在内存中，关闭表时写入`表名.indexes`文件，打开时加载后立即删除。进程没有正常关闭时，下次打开会扫描整个表重建索引，不会用到过期的索引。已声明的索引字段记录在表中的`__indexed_fields__`键下
+- **`writeback=False`**：读到的记录不会都留在内存里
+
+```python
+import bisect
+import numbers
+import os
+import pickle
+import shelve
+import time
+import uuid
+from pathlib import Path
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'between': lambda a, b: a is not None and b[0] <= a <= b[1],
+}
+
+class FieldIndex:
+    """一个字段的二级索引：值 -> 记录键集合，外加按类型分组、按值排序的数组用于范围查找
+    
+    有序数组在第一次范围查询时才建立。不同类型的取值互相比较会抛出TypeError，
+    所以数组按类型分组（int、float和bool同属数值一组），范围查询只在操作数所属的组内查找，
+    与逐条比较时"类型不可比较视为不匹配"的结果一致。新出现的取值先追加到组的末尾，
+    查询该组时再排序；删除的取值留在数组中，查询时跳过，积累太多时再从postings重建。
+    None不进入排序数组，范围查询不会匹配到它。
+    """
+    
+    def __init__(self, field, postings=None):
+        self.field = field
+        self.postings = postings if postings is not None else {}
+        self._groups = None         # 类型分组 -> 取值数组，None表示还没有建立
+        self._dirty = set()         # 有新值追加、需要重新排序的组
+        self._stale = 0
+    
+    @staticmethod
+    def _group(value):
+        return 'number' if isinstance(value, numbers.Real) else type(value).__qualname__
+    
+    def add(self, value, key):
+        keys = self.postings.get(value)
+        if keys is None:
+            self.postings[value] = {key}
+            if value is not None and self._groups is not None:
+                group = self._group(value)
+                self._groups.setdefault(group, []).append(value)
+                self._dirty.add(group)
+        else:
+            keys.add(key)
+    
+    def remove(self, value, key):
+        keys = self.postings.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.postings[value]
+            self._stale += 1
+    
+    def _sorted_values(self, group):
+        """返回一个类型分组的有序取值数组，这一组的取值无法排序时返回None"""
+        if self._groups is None or self._stale > len(self.postings):
+            self._groups = {}
+            for value in self.postings:
+                if value is not None:
+                    self._groups.setdefault(self._group(value), []).append(value)
+            self._dirty = set(self._groups)
+            self._stale = 0
+        values = self._groups.get(group)
+        if values is None:
+            return []
+        if group in self._dirty:
+            # 已排序的数组后面接一小段新值，Timsort合并两段有序序列只需线性时间
+            try:
+                values.sort()
+            except TypeError:
+                return None         # 例如complex：这一组的取值之间没有顺序
+            self._dirty.discard(group)
+        return values
+    
+    def _range(self, low=None, high=None, include_low=True, include_high=True):
+        """返回落在范围内、仍有记录的不同取值；low和high至少给出一个"""
+        groups = {self._group(bound) for bound in (low, high) if bound is not None}
+        if len(groups) != 1:
+            return []               # 上下界类型不可比较
+        values = self._sorted_values(groups.pop())
+        if not values:
+            return []
+        try:
+            if low is None:
+                start = 0
+            elif include_low:
+                start = bisect.bisect_left(values, low)
+            else:
+                start = bisect.bisect_right(values, low)
+            if high is None:
+                end = len(values)
+            elif include_high:
+                end = bisect.bisect_right(values, high)
+            else:
+                end = bisect.bisect_left(values, high)
+        except TypeError:
+            return []
+        postings = self.postings
+        # 删除后又重新出现的取值会在数组中出现两次，用集合去重
+        return list({value for value in values[start:end] if value in postings})
+    
+    def values_for(self, op, operand):
+        """条件能用这个索引时返回匹配的取值列表，否则返回None"""
+        if op == '==':
+            try:
+                return [operand] if operand in self.postings else []
+            except TypeError:
+                return []           # 不可哈希的操作数不会等于任何已索引的（可哈希的）取值
+        if op == 'in':
+            matched = set()
+            for value in operand:
+                try:
+                    if value in self.postings:
+                        matched.add(value)
+                except TypeError:
+                    continue        # 同上，不可哈希的元素不会匹配
+            return list(matched)
+        if op == '<':
+            return self._range(high=operand, include_high=False)
+        if op == '<=':
+            return self._range(high=operand)
+        if op == '>':
+            return self._range(low=operand, include_low=False)
+        if op == '>=':
+            return self._range(low=operand)
+        if op == 'between':
+            return self._range(*operand)
+        return None                 # '!='等条件不走索引
+    
+    def estimate(self, values):
+        return sum(len(self.postings[value]) for value in values)
+    
+    def lookup(self, values):
+        if len(values) == 1:
+            return set(self.postings[values[0]])
+        result = set()
+        for value in values:
+            result.update(self.postings[value])
+        return result
+
+class IndexedDB:
+    """带二级索引的shelve对象数据库，接口与SimpleDB相同，另外支持按字段条件查询
+    
+    索引保存在内存中，关闭表时写入"表名.indexes"文件；打开表时加载并删除这个文件，
+    进程崩溃后下次打开会扫描整个表重建索引。
+    """
+    
+    def __init__(self, db_path="simple_db"):
+        self.db_path = Path(db_path)
+        self.db_path.mkdir(exist_ok=True)
+        self.current_table = None
+        self.shelf = None
+        self.indexes = {}
+        self._count = 0
+    
+    # ---------- 表与索引 ----------
+    
+    def _index_file(self):
+        return self.db_path / f"{self.current_table}.indexes"
+    
+    def open_table(self, table_name):
+        self.close()
+        # writeback=False：百万条记录时不能把读到的对象都留在内存里
+        self.shelf = shelve.open(str(self.db_path / table_name), protocol=pickle.HIGHEST_PROTOCOL)
+        self.current_table = table_name
+        try:
+            with open(self._index_file(), 'rb') as f:
+                saved = pickle.load(f)
+            self._count = saved['count']
+            self.indexes = {field: FieldIndex(field, postings) for field, postings in saved['indexes'].items()}
+            os.remove(self._index_file())
+        except FileNotFoundError:
+            # 没有索引文件：新表，或者上次没有正常关闭。记录数和已声明的索引都从数据重建
+            fields = self.shelf.get('__indexed_fields__', [])
+            self._count = 0
+            self.indexes = {field: FieldIndex(field) for field in fields}
+            for key, record in self._records():
+                self._count += 1
+                self._index_record(key, record['data'])
+        return self
+    
+    def _records(self):
+        for key in self.shelf.keys():
+            if key != '__indexed_fields__':
+                yield key, self.shelf[key]
+    
+    def create_index(self, field):
+        """声明字段索引，扫描一遍已有记录建立索引，之后由insert/update/delete维护"""
+        self._require_table()
+        if field in self.indexes:
+            return
+        index = FieldIndex(field)
+        for key, record in self._records():
+            self._check_hashable(field, record['data'].get(field))
+            index.add(record['data'].get(field), key)
+        self.indexes[field] = index
+        self.shelf['__indexed_fields__'] = list(self.indexes)
+    
+    def drop_index(self, field):
+        self._require_table()
+        if self.indexes.pop(field, None) is not None:
+            self.shelf['__indexed_fields__'] = list(self.indexes)
+    
+    @staticmethod
+    def _check_hashable(field, value):
+        try:
+            hash(value)
+        except TypeError:
+            raise TypeError(f"索引字段 {field!r} 的取值不可哈希: {value!r}") from None
+    
+    def _check_indexable(self, data):
+        """写入记录之前检查索引字段，避免记录和计数已经写入而索引失败"""
+        for field in self.indexes:
+            self._check_hashable(field, data.get(field))
+    
+    def _index_record(self, key, data):
+        for field, index in self.indexes.items():
+            index.add(data.get(field), key)
+    
+    def _unindex_record(self, key, data):
+        for field, index in self.indexes.items():
+            index.remove(data.get(field), key)
+    
+    def close(self):
+        if self.shelf is None:
+            return
+        with open(self._index_file(), 'wb') as f:
+            pickle.dump({'count': self._count,
+                         'indexes': {field: index.postings for field, index in self.indexes.items()}},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shelf.close()
+        self.shelf = None
+        self.current_table = None
+        self.indexes = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def _require_table(self):
+        if self.shelf is None:
+            raise RuntimeError("没有打开的表")
+    
+    # ---------- 增删改查 ----------
+    
+    def insert(self, data, key=None):
+        self._require_table()
+        self._check_indexable(data)
+        if key is None:
+            key = str(uuid.uuid4())
+        old = self.shelf.get(key)
+        now = time.time()
+        self.shelf[key] = {'data': data, 'created_at': now, 'updated_at': now, 'id': key}
+        if old is None:
+            self._count += 1
+        else:
+            self._unindex_record(key, old['data'])
+        self._index_record(key, data)
+        return key
+    
+    def get(self, key):
+        self._require_table()
+        record = self.shelf.get(key)
+        return record['data'] if record else None
+    
+    def update(self, key, data):
+        self._require_table()
+        self._check_indexable(data)
+        record = self.shelf.get(key)
+        if record is None:
+            return False
+        self._unindex_record(key, record['data'])
+        record['data'] = data
+        record['updated_at'] = time.time()
+        self.shelf[key] = record
+        self._index_record(key, data)
+        return True
+    
+    def delete(self, key):
+        self._require_table()
+        record = self.shelf.get(key)
+        if record is None:
+            return False
+        del self.shelf[key]
+        self._count -= 1
+        self._unindex_record(key, record['data'])
+        return True
+    
+    def find_all(self):
+        self._require_table()
+        return [(key, record['data']) for key, record in self._records()]
+    
+    def find_by(self, predicate):
+        """任意Python谓词只能逐条检查；能写成字段条件时请用find"""
+        self._require_table()
+        return [(key, record['data']) for key, record in self._records() if predicate(record['data'])]
+    
+    def clear(self):
+        self._require_table()
+        fields = list(self.indexes)
+        table = self.current_table
+        self.shelf.close()
+        self.shelf = shelve.open(str(self.db_path / table), 'n', protocol=pickle.HIGHEST_PROTOCOL)
+        self.shelf['__indexed_fields__'] = fields
+        self.indexes = {field: FieldIndex(field) for field in fields}
+        self._count = 0
+    
+    # ---------- 按字段条件查询 ----------
+    
+    @staticmethod
+    def _normalize(conditions):
+        """{'age': ('<', 32), 'city': '北京'} -> [('age', '<', 32), ('city', '==', '北京')]"""
+        normalized = []
+        for field, condition in conditions.items():
+            if isinstance(condition, tuple) and len(condition) == 2 and condition[0] in _OPERATORS:
+                op, operand = condition
+            else:
+                op, operand = '==', condition
+            normalized.append((field, op, operand))
+        return normalized
+    
+    def _plan(self, conditions):
+        """选择估计结果最少的索引条件；其余能用索引的等值条件取交集，剩下的条件逐条检查"""
+        candidates = []
+        residual = []
+        for field, op, operand in conditions:
+            index = self.indexes.get(field)
+            values = index.values_for(op, operand) if index is not None else None
+            if values is None:
+                residual.append((field, op, operand))
+            else:
+                candidates.append((index.estimate(values), field, op, operand, values))
+        candidates.sort(key=lambda c: c[0])
+        if not candidates:
+            return None, [], residual
+        best, rest = candidates[0], candidates[1:]
+        intersect = [c for c in rest if c[2] in ('==', 'in')]
+        residual += [(field, op, operand) for _, field, op, operand, _ in rest if op not in ('==', 'in')]
+        return best, intersect, residual
+    
+    def explain(self, conditions):
+        """返回查询计划，便于查看查询是否用到了索引"""
+        self._require_table()
+        best, intersect, residual = self._plan(self._normalize(conditions))
+        if best is None:
+            return {'plan': '全表扫描', 'rows': self._count, 'filter': residual}
+        return {'plan': f"索引 {best[1]} {best[2]}", 'estimated': best[0],
+                'intersect': [f"{c[1]} {c[2]}" for c in intersect], 'filter': residual}
+    
+    def _index_keys(self, best, intersect):
+        keys = self.indexes[best[1]].lookup(best[4])
+        for _, field, _, _, values in intersect:
+            if not keys:
+                break
+            keys &= self.indexes[field].lookup(values)
+        return keys
+    
+    def find_keys(self, conditions):
+        """只返回满足条件的记录键；所有条件都能用索引时不需要读取任何记录"""
+        self._require_table()
+        best, intersect, residual = self._plan(self._normalize(conditions))
+        if best is None:
+            return [key for key, record in self._records() if self._matches(record['data'], residual)]
+        keys = self._index_keys(best, intersect)
+        if not residual:
+            return list(keys)
+        return [key for key in keys if self._matches(self.shelf[key]['data'], residual)]
+    
+    def find(self, conditions, predicate=None):
+        """按字段条件查询，predicate可以再对结果做任意过滤"""
+        self._require_table()
+        best, intersect, residual = self._plan(self._normalize(conditions))
+        if best is None:
+            records = ((key, record['data']) for key, record in self._records())
+        else:
+            records = ((key, self.shelf[key]['data']) for key in self._index_keys(best, intersect))
+        return [(key, data) for key, data in records
+                if self._matches(data, residual) and (predicate is None or predicate(data))]
+    
+    def count(self, conditions=None):
+        """记录数；有条件时用索引计数，只有索引无法覆盖的条件才需要读取记录"""
+        self._require_table()
+        if not conditions:
+            return self._count
+        return len(self.find_keys(conditions))
+    
+    @staticmethod
+    def _matches(data, conditions):
+        for field, op, operand in conditions:
+            try:
+                if not _OPERATORS[op](data.get(field), operand):
+                    return False
+            except TypeError:           # 类型不可比较时视为不匹配
+                return False
+        return True
+```
+
+测试和基准。`ScanDB`保留了`SimpleDB`的查询方式，用来对比同一个表上的全表扫描；测试中每个查询都用`find_by`的结果校验`find`和`count`：
+
+```python
+import random
+import shutil
+
+class ScanDB:
+    """4.1节SimpleDB的查询方式（writeback=True，find_by逐条反序列化），用于对比"""
+    
+    def __init__(self, db_path, table_name):
+        self.shelf = shelve.open(str(Path(db_path) / table_name), writeback=True)
+    
+    def find_by(self, predicate):
+        return [(key, record['data']) for key, record in self.shelf.items()
+                if key != '__indexed_fields__' and predicate(record['data'])]
+    
+    def count(self):
+        return len(self.shelf)
+    
+    def close(self):
+        self.shelf.close()
+
+CITIES = ['北京', '上海', '广州', '深圳', '杭州', '成都', '武汉', '西安', '南京', '重庆',
+          '天津', '苏州', '长沙', '郑州', '青岛', '沈阳', '宁波', '东莞', '无锡', '厦门']
+
+def make_user(i, rng):
+    return {'name': f'用户{i}', 'age': 18 + i % 60, 'city': CITIES[i % 17 % 20],
+            'score': round(rng.uniform(0, 100), 3)}
+
+def test_indexed_db():
+    db_path = "indexed_db_test"
+    shutil.rmtree(db_path, ignore_errors=True)
+    rng = random.Random(42)
+    try:
+        with IndexedDB(db_path) as db:
+            db.open_table("users")
+            db.create_index('age')
+            users = {db.insert(make_user(i, rng)): make_user(i, random.Random(0)) for i in range(300)}
+            db.create_index('city')            # 对已有数据建立索引
+            keys = list(users)
+            db.update(keys[0], {'name': '张三', 'age': 200, 'city': '拉萨'})
+            db.delete(keys[1])
+            db.insert({'name': '无城市', 'age': None})
+            
+            def check(conditions, predicate):
+                expected = sorted(db.find_by(predicate))
+                assert sorted(db.find(conditions)) == expected, conditions
+                assert db.count(conditions) == len(expected), conditions
+            
+            check({'age': 30}, lambda u: u.get('age') == 30)
+            check({'age': ('<', 25), 'city': '北京'}, lambda u: u.get('age') is not None and u['age'] < 25 and u.get('city') == '北京')
+            check({'age': ('between', (70, 200))}, lambda u: u.get('age') is not None and 70 <= u['age'] <= 200)
+            check({'city': ('in', ['拉萨', '上海']), 'age': ('>=', 40)},
+                  lambda u: u.get('city') in ('拉萨', '上海') and u.get('age') is not None and u['age'] >= 40)
+            check({'age': None}, lambda u: u.get('age') is None)
+            check({'name': '张三'}, lambda u: u.get('name') == '张三')            # 没有索引：全表扫描
+            check({'city': ('!=', '北京'), 'age': 19}, lambda u: u.get('city') != '北京' and u.get('age') == 19)
+            assert db.count() == 300
+            assert db.explain({'age': 30, 'city': '北京'})['plan'].startswith('索引')
+            
+            # 同一字段混有不同类型的值：范围查询只匹配同类型的取值
+            db.create_index('code')
+            for code in (7, 'A7', 3.5, 'B2', True, (1, 2)):
+                db.insert({'name': f'编码{code}', 'code': code})
+            check({'code': ('>', 1)}, lambda u: isinstance(u.get('code'), (int, float)) and u['code'] > 1)
+            check({'code': ('<', 'B')}, lambda u: isinstance(u.get('code'), str) and u['code'] < 'B')
+            check({'code': ('between', (1, 'Z'))}, lambda u: False)
+            # 不可哈希的操作数：索引与全表扫描一样返回空结果，而不是抛出TypeError
+            check({'code': [1, 2]}, lambda u: u.get('code') == [1, 2])
+            check({'code': ('in', [[1, 2], 7])}, lambda u: u.get('code') in ([1, 2], 7))
+            try:
+                db.insert({'name': '不可哈希', 'code': [1, 2]})
+            except TypeError:
+                pass
+            assert db.count() == 306 and db.find({'name': '不可哈希'}) == []
+            assert db.explain({'name': '张三'})['plan'] == '全表扫描'
+        
+        # 正常关闭后加载索引文件；删除索引文件（模拟崩溃）后重建
+        for crashed in (False, True):
+            if crashed:
+                os.remove(Path(db_path) / "users.indexes")
+            with IndexedDB(db_path) as db:
+                db.open_table("users")
+                assert set(db.indexes) == {'age', 'city', 'code'} and db.count() == 306
+                assert db.count({'age': 200}) == 1 and db.count({'city': '拉萨'}) == 1
+                assert db.count({'code': ('>=', 'A')}) == 2
+        
+        with IndexedDB(db_path) as db:
+            db.open_table("users")
+            db.clear()
+            assert db.count() == 0 and db.find({'age': 30}) == []
+        print("IndexedDB测试通过")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def benchmark_indexed_db(n=1_000_000):
+    db_path = "indexed_db_bench"
+    shutil.rmtree(db_path, ignore_errors=True)
+    rng = random.Random(1)
+    try:
+        db = IndexedDB(db_path)
+        db.open_table("users")
+        for field in ('age', 'city', 'score'):
+            db.create_index(field)
+        start = time.perf_counter()
+        for i in range(n):
+            db.insert(make_user(i, rng))
+        print(f"插入{n}条记录（3个索引）: {n / (time.perf_counter() - start) / 1000:.1f} 千条/秒")
+        start = time.perf_counter()
+        db.close()
+        print(f"关闭（写出索引文件）: {time.perf_counter() - start:.2f} 秒")
+        start = time.perf_counter()
+        shelve.open(str(Path(db_path) / "users"), 'r').close()
+        dbm_open_time = time.perf_counter() - start
+        start = time.perf_counter()
+        db.open_table("users")
+        print(f"打开（加载索引文件）: {time.perf_counter() - start:.2f} 秒，"
+              f"其中单独打开shelf文件需要 {dbm_open_time:.2f} 秒")
+        
+        queries = [
+            ('age == 30 且 city == 北京', {'age': 30, 'city': '北京'},
+             lambda u: u['age'] == 30 and u['city'] == '北京'),
+            ('99.9 <= score <= 100', {'score': ('between', (99.9, 100))},
+             lambda u: 99.9 <= u['score'] <= 100),
+            ('age < 20 且 city == 上海', {'age': ('<', 20), 'city': '上海'},
+             lambda u: u['age'] < 20 and u['city'] == '上海'),
+            ('city == 北京', {'city': '北京'}, lambda u: u['city'] == '北京'),
+        ]
+        start = time.perf_counter()
+        db.count({'score': ('>', 100)})
+        print(f"第一次范围查询（建立score的有序数组）: {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+        for name, conditions, _ in queries:
+            start = time.perf_counter()
+            results = db.find(conditions)
+            find_time = time.perf_counter() - start
+            start = time.perf_counter()
+            count = db.count(conditions)
+            count_time = time.perf_counter() - start
+            assert count == len(results)
+            print(f"  {name:<24}: {len(results):>6}条, find {find_time * 1000:8.2f} 毫秒, "
+                  f"count {count_time * 1000:6.2f} 毫秒, 计划 {db.explain(conditions)['plan']}")
+        db.close()
+        
+        # SimpleDB的方式：对同一个表逐条反序列化
+        scan_db = ScanDB(db_path, "users")
+        name, _, predicate = queries[0]
+        start = time.perf_counter()
+        results = scan_db.find_by(predicate)
+        print(f"  SimpleDB.find_by（{name}）: {len(results)}条, {time.perf_counter() - start:.1f} 秒")
+        scan_db.close()
+        
+        # 模拟崩溃后重建索引
+        os.remove(Path(db_path) / "users.indexes")
+        start = time.perf_counter()
+        db.open_table("users")
+        print(f"没有索引文件时打开（扫描重建）: {time.perf_counter() - start:.1f} 秒")
+        db.close()
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+# 运行示例
+test_indexed_db()
+benchmark_indexed_db()
+```
+
+参考结果（Linux，Python 3.11，单核，ext4，shelve后端为dbm.dumb，100万条记录，索引字段为age、city、score）：
+
+| 查询 | 结果数 | 选中的计划 | IndexedDB.find | IndexedDB.count |
+|------|--------|------------|----------------|-----------------|
+| age == 30 且 city == 北京 | 980 | 索引age，与city取交集 | 约 21 毫秒 | 约 3.7 毫秒 |
+| 99.9 <= score <= 100 | 1029 | 索引score范围 | 约 16 毫秒 | 约 0.3 毫秒 |
+| age < 20 且 city == 上海 | 1962 | 索引age范围，city逐条检查 | 约 59 毫秒 | 约 6.4 毫秒 |
+| city == 北京 | 58824 | 索引city | 约 1.1 秒 | 约 3.7 毫秒 |
+| SimpleDB.find_by（age == 30 且 city == 北京） | 980 | 全表扫描 | 约 23.8 秒 | - |
+
+| 其他操作（100万条记录） | 耗时 |
+|--------------------------|------|
+| 插入（维护3个索引） | 约 18-21 千条/秒 |
+| 关闭（写出索引文件） | 约 5 秒 |
+| 打开表（加载索引文件） | 约 18 秒，几乎全部是dbm.dumb解析它自己的`.dir`文件 |
+| 打开后第一次范围查询（建立score的有序数组） | 约 0.17 秒 |
+| 没有索引文件时打开（扫描重建） | 约 39 秒 |
+
+几点说明：
+
+- 选择性高的查询从二十多秒降到了十几到几十毫秒。剩下的时间主要是按键读取候选记录，在dbm.dumb上每读一条约15微秒；`count`不读取记录，只有几毫秒。
+- `city == 北京`匹配了约6%的记录，`find`仍要读取5.9万条记录，用了1.1秒。索引只能减少需要读取的记录，结果集本身很大时，读取就成了主要开销。
+- `age < 20 且 city == 上海`中，范围条件的匹配数（约3.3万）比等值条件（约5.9万）少，规划器选了age的范围索引；范围条件不参与取交集，city在读出的候选记录上逐条检查，所以比第一个查询慢。
+- 索引字段的值必须可哈希，`insert`和`update`在写入之前检查，不可哈希时抛出TypeError，表和计数都不变；查询条件中不可哈希的操作数（如`{'code': [1, 2]}`）与全表扫描一样匹配不到任何记录。同一字段可以混有不同类型的值，范围查询只在与操作数同类型（int、float、bool算同一类）的取值中查找；值为None或缺少该字段的记录可以用`{'age': None}`查到，但不会出现在范围查询的结果中，这与`u['age'] < 20`对None抛出异常的行为一致。
+- 索引全部在内存中。100万条记录、3个字段的索引结构本身约140MB，主要是记录键的集合；100万个36字符的UUID键字符串另需约85MB，三个索引共享同一批字符串。沙箱中只有dbm.dumb，打开表和重建索引都很慢；换成gdbm时，打开表只需要加载索引文件。
+
 ### 4.2 缓存系统实现
 
 ```python
@@ -765,6 +1377,526 @@ def shelf_cache_system():
 shelf_cache_system()
 ```
 
+#### 4.2.1 批量写入与按过期时间分桶的索引
+
+上面的`ShelfCache`在键多起来以后有三个问题：
+
+- `__enter__`以`writeback=True`打开shelf，所有读写过的对象都留在内存的缓存字典里，到`close`时才一次性写回，缓存越大占用的内存越多，`close`也越慢。
+- `_open`想用`writeback`参数区分读写模式，但shelf一旦打开，这个参数就不再起作用，读写用的其实是同一个writeback shelf。
+- `clear_expired`遍历`items()`，把每一项都反序列化出来检查过期时间，耗时与缓存大小成正比，而真正到期的往往只占很小一部分。
+
+下面的`BatchedShelfCache`做了这些改进：
+
+- **只打开一次，`writeback=False`**：内存中只有一个有界的写缓冲区（默认1000项），达到`batch_size`时统一写入shelf。读取时先查写缓冲区，保证能读到刚写入的值
+- **批量接口**：`set_many`的所有键共用一个过期时间，`get_many`持一次锁读取多个键
+- **事务式批量写入**：`with cache.batch():`块内的写入不会被自动刷新，块正常结束时一起写入，出现异常则全部丢弃
+- **过期索引**：按过期时间分桶（默认每秒一个桶）。每次刷新时，为涉及的每个桶追加一个分块`"桶号:序号" -> [键, ...]`，分块列表按(桶号, 序号)排序保存。`sweep`只读取已经到期的分块，不遍历整个缓存。判断是否删除时以数据中的截止时间为准，因为键可能已被删除，或者又用更长的TTL重新设置过。已有的分块从不改写，所以即使同一秒写入上百万个键，也不会反复重写一个大集合
+- **后台清理**：`start_sweeper(interval)`（或构造参数`sweep_interval`）启动后台线程定期清理，所有操作共用同一把锁
+- **统计**：`info()`返回命中、未命中、过期、清理的次数，以及命中率、写缓冲区大小和过期索引的分块数；`size()`返回缓存项数量
+- **`clear`重建文件**：以`'n'`模式重新打开shelf，而不是逐个删除键
+- **sqlite3存储**：`shelve.open`选用哪个dbm后端取决于Python的编译选项，没有gdbm和ndbm时用的是纯Python的`dbm.dumb`，它每删除一个键都要重写整个`.dir`索引文件，清理1万个过期项就要重写1万次。`shelve.Shelf`可以包装任何bytes到bytes的映射，这里把数据和过期索引都放在sqlite3表中（Python 3.13起标准库自带同样思路的`dbm.sqlite3`）：删除一个键只是一次B树操作，一次刷新或清理的所有写入在同一个事务中提交，仍然通过普通的`del shelf[key]`删除
+
+```python
+import bisect
+import os
+import pickle
+import shelve
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+
+_DELETED = object()   # 写缓冲区中的删除标记
+_MISSING = object()
+
+class SQLiteDict(MutableMapping):
+    """键和值都是bytes的映射，存放在sqlite3的一张表中，可以交给shelve.Shelf包装
+    
+    写入在一个隐式事务中累积，sync()或close()时提交。
+    """
+    
+    def __init__(self, path, flag='c'):
+        if flag == 'n' and os.path.exists(path):
+            os.remove(path)
+        # 后台清理线程也会使用这个连接，调用方（BatchedShelfCache）负责加锁
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS Dict (key BLOB PRIMARY KEY, value BLOB NOT NULL)")
+    
+    def __getitem__(self, key):
+        row = self._conn.execute("SELECT value FROM Dict WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+    
+    def __setitem__(self, key, value):
+        self._conn.execute("REPLACE INTO Dict (key, value) VALUES (?, ?)", (key, value))
+    
+    def __delitem__(self, key):
+        if self._conn.execute("DELETE FROM Dict WHERE key = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        return self._conn.execute("SELECT 1 FROM Dict WHERE key = ?", (key,)).fetchone() is not None
+    
+    def __iter__(self):
+        for (key,) in self._conn.execute("SELECT key FROM Dict").fetchall():
+            yield key
+    
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM Dict").fetchone()[0]
+    
+    def sync(self):
+        self._conn.commit()
+    
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+class BatchedShelfCache:
+    """基于shelve的缓存：有界的写缓冲区 + 按过期时间分桶的过期索引
+    
+    数据存放在cache_dir/data.sqlite中，值为(value, expires_at)元组；过期索引存放在
+    cache_dir/expiry.sqlite中，每次刷新时为每个涉及的时间桶写一个新的分块
+    "桶号:序号" -> [键, ...]，已有的分块从不改写。两者都是包装了SQLiteDict的shelve.Shelf。
+    """
+    
+    def __init__(self, cache_dir="cache", default_ttl=3600, batch_size=1000,
+                 granularity=1.0, sweep_interval=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True)
+        self.default_ttl = default_ttl
+        self.batch_size = batch_size
+        self.granularity = granularity      # 过期时间桶的宽度（秒）
+        self._lock = threading.RLock()
+        self._open('c')
+        self._pending = {}                  # 键 -> (value, expires_at) 或 _DELETED
+        self._pending_expiry = {}           # 桶号 -> [键, ...]
+        self._batch_depth = 0
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'sets': 0,
+                      'deletes': 0, 'flushes': 0, 'swept': 0}
+        self._stop = threading.Event()
+        self._sweeper = None
+        if sweep_interval:
+            self.start_sweeper(sweep_interval)
+    
+    def _open(self, flag):
+        # 只打开一次，writeback=False：内存中只有写缓冲区里的对象
+        self._data = shelve.Shelf(SQLiteDict(str(self.cache_dir / "data.sqlite"), flag),
+                                  protocol=pickle.HIGHEST_PROTOCOL)
+        self._expiry = shelve.Shelf(SQLiteDict(str(self.cache_dir / "expiry.sqlite"), flag),
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+        self._chunks = self._expiry.get('__chunks__', [])   # 按(桶号, 序号)排序的分块列表
+        self._seq = self._expiry.get('__seq__', 0)
+    
+    # ---------- 写入 ----------
+    
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+        return True
+    
+    def set_many(self, items, ttl=None):
+        """批量设置，items可以是字典或(键, 值)序列，共用同一个TTL"""
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        bucket = int(expires_at // self.granularity)
+        items = items.items() if hasattr(items, 'items') else items
+        with self._lock:
+            pending = self._pending
+            bucket_keys = self._pending_expiry.setdefault(bucket, [])
+            before = len(bucket_keys)
+            for key, value in items:
+                pending[key] = (value, expires_at)
+                bucket_keys.append(key)
+            self.stats['sets'] += len(bucket_keys) - before
+            self._maybe_flush()
+    
+    def delete(self, key):
+        with self._lock:
+            item = self._pending.get(key)
+            if item is _DELETED or (item is None and key not in self._data):
+                return False
+            self._pending[key] = _DELETED
+            self.stats['deletes'] += 1
+            self._maybe_flush()
+            return True
+    
+    def _maybe_flush(self):
+        if self._batch_depth == 0 and len(self._pending) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """把写缓冲区写入shelf：数据逐项写入，过期索引每个时间桶追加一个分块，最后一起提交"""
+        with self._lock:
+            if not self._pending:
+                return
+            data = self._data
+            deleted = []
+            for key, item in self._pending.items():
+                if item is _DELETED:
+                    deleted.append(key)
+                else:
+                    data[key] = item
+            if deleted:
+                self._delete_keys(data, deleted)
+            if self._pending_expiry:
+                for bucket, keys in self._pending_expiry.items():
+                    self._seq += 1
+                    self._expiry[f"{bucket}:{self._seq}"] = keys
+                    bisect.insort(self._chunks, (bucket, self._seq))
+                self._expiry['__chunks__'] = self._chunks
+                self._expiry['__seq__'] = self._seq
+            self._pending = {}
+            self._pending_expiry = {}
+            data.sync()
+            self._expiry.sync()
+            self.stats['flushes'] += 1
+    
+    @staticmethod
+    def _delete_keys(shelf, keys):
+        """从shelf中删除键，不存在的键直接跳过；在SQLiteDict上每个键只是一次B树删除"""
+        for key in keys:
+            try:
+                del shelf[key]
+            except KeyError:
+                pass
+    
+    @contextmanager
+    def batch(self):
+        """事务式批量写入：with块中的写入在退出时一起刷新，块内出现异常则全部丢弃
+        
+        块内持有锁，其他线程和后台清理要等到块结束。
+        """
+        with self._lock:
+            outermost = self._batch_depth == 0
+            if outermost:
+                self.flush()
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if outermost:
+                    self._pending = {}
+                    self._pending_expiry = {}
+                raise
+            else:
+                if outermost:
+                    self.flush()
+            finally:
+                self._batch_depth -= 1
+    
+    # ---------- 读取 ----------
+    
+    def _lookup(self, key, now):
+        item = self._pending.get(key)
+        if item is None:
+            try:
+                item = self._data[key]
+            except KeyError:
+                item = None
+        elif item is _DELETED:
+            item = None
+        if item is None:
+            self.stats['misses'] += 1
+            return _MISSING
+        if item[1] <= now:
+            # 惰性删除：记录到写缓冲区，随下一批写入
+            self._pending[key] = _DELETED
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return _MISSING
+        self.stats['hits'] += 1
+        return item[0]
+    
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key, time.time())
+            return default if value is _MISSING else value
+    
+    def get_many(self, keys):
+        """批量读取，返回{键: 值}，不存在或已过期的键不出现在结果中"""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is not _MISSING:
+                    result[key] = value
+        return result
+    
+    def exists(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+    
+    # ---------- 过期清理 ----------
+    
+    def sweep(self, now=None):
+        """删除已到期的键：只读取截止时间已过的时间桶，不遍历整个缓存"""
+        now = time.time() if now is None else now
+        # 桶b中的截止时间都小于(b+1)*granularity，b < due时整个桶都已到期
+        due = int(now // self.granularity)
+        with self._lock:
+            self.flush()
+            chunks = self._chunks
+            expired = []
+            done = 0
+            while done < len(chunks) and chunks[done][0] < due:
+                bucket, seq = chunks[done]
+                chunk_key = f"{bucket}:{seq}"
+                for key in self._expiry.get(chunk_key, ()):
+                    # 键可能已被删除，或者之后用更长的TTL重新设置过，以数据中的截止时间为准
+                    try:
+                        item = self._data[key]
+                    except KeyError:
+                        continue
+                    if item[1] <= now:
+                        expired.append(key)
+                done += 1
+            if done:
+                expired = list(dict.fromkeys(expired))    # 同一个键可能出现在多个分块中
+                self._delete_keys(self._data, expired)
+                self._delete_keys(self._expiry, [f"{bucket}:{seq}" for bucket, seq in chunks[:done]])
+                del chunks[:done]
+                self._expiry['__chunks__'] = chunks
+                self._data.sync()
+                self._expiry.sync()
+                self.stats['swept'] += len(expired)
+            return len(expired)
+    
+    # 与ShelfCache保持相同的方法名
+    clear_expired = sweep
+    
+    def start_sweeper(self, interval):
+        """启动后台清理线程，每interval秒清理一次"""
+        def run():
+            while not self._stop.wait(interval):
+                self.sweep()
+        self._sweeper = threading.Thread(target=run, daemon=True)
+        self._sweeper.start()
+    
+    # ---------- 统计与管理 ----------
+    
+    def size(self):
+        """缓存项数量（包括已过期但还没被清理的项）"""
+        with self._lock:
+            self.flush()
+            return len(self._data)
+    
+    def info(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {**self.stats,
+                    'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                    'pending': len(self._pending),
+                    'expiry_chunks': len(self._chunks)}
+    
+    def clear(self):
+        """清空缓存：以'n'模式重新创建两个shelf文件，而不是逐个删除键"""
+        with self._lock:
+            self._data.close()
+            self._expiry.close()
+            self._open('n')
+            self._pending = {}
+            self._pending_expiry = {}
+    
+    def sync(self):
+        with self._lock:
+            self.flush()
+            self._data.sync()
+            self._expiry.sync()
+    
+    def close(self):
+        if self._sweeper is not None:
+            self._stop.set()
+            self._sweeper.join()
+            self._sweeper = None
+        with self._lock:
+            if self._data is None:
+                return
+            self.flush()
+            self._data.close()
+            self._expiry.close()
+            self._data = self._expiry = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+```
+
+测试和基准。`WritebackShelfCache`保留了`ShelfCache`的写法，每种实现在单独的子进程中运行，以便统计峰值内存。每个基准写入n个键，其中1%在2秒后过期；重新打开后随机读取1万个未过期的键，再清理过期项：
+
+```python
+import dbm
+import multiprocessing
+import random
+import resource
+import shutil
+
+class WritebackShelfCache:
+    """4.2节ShelfCache的写法（writeback=True，clear_expired遍历所有项），用于对比"""
+    
+    def __init__(self, cache_dir, default_ttl=3600):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True)
+        self.default_ttl = default_ttl
+        self.cache_file = str(self.cache_dir / "cache")
+        self.shelf = shelve.open(self.cache_file, writeback=True)
+    
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.shelf[key] = {'value': value, 'expires_at': time.time() + ttl}
+    
+    def get(self, key, default=None):
+        if key not in self.shelf:
+            return default
+        cache_item = self.shelf[key]
+        if time.time() > cache_item['expires_at']:
+            self.shelf.pop(key, None)
+            return default
+        return cache_item['value']
+    
+    def find_expired(self):
+        return [key for key, item in self.shelf.items() if time.time() > item['expires_at']]
+    
+    def clear_expired(self):
+        expired_keys = self.find_expired()
+        for key in expired_keys:
+            del self.shelf[key]
+        return expired_keys
+    
+    def close(self):
+        self.shelf.close()
+
+def test_batched_shelf_cache():
+    cache_dir = "batched_cache_test"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    try:
+        with BatchedShelfCache(cache_dir, default_ttl=60, batch_size=3, granularity=0.1) as cache:
+            cache.set("key1", "普通缓存值")
+            cache.set_many({"a": 1, "b": [1, 2], "c": {"x": 1}}, ttl=0.2)
+            assert cache.get("key1") == "普通缓存值" and cache.get("b") == [1, 2]
+            assert cache.get_many(["a", "c", "missing"]) == {"a": 1, "c": {"x": 1}}
+            assert cache.delete("key1") and not cache.delete("key1")
+            assert cache.get("key1", "已删除") == "已删除"
+            
+            # 过期：惰性删除和按桶清理
+            cache.set("c", "延长了TTL", ttl=60)
+            time.sleep(0.35)
+            assert cache.get("a", "已过期") == "已过期"
+            assert cache.sweep() == 1                     # 只有b；a已惰性删除，c的TTL已延长
+            assert cache.get("c") == "延长了TTL" and cache.size() == 1
+            assert cache.info()['expiry_chunks'] == 2     # key1和c的两个60秒后的桶
+            
+            # 事务式批量写入
+            with cache.batch():
+                cache.set_many({f"k{i}": i for i in range(10)})
+                assert cache.info()['pending'] == 10      # 块内不会自动刷新
+            try:
+                with cache.batch():
+                    cache.set("rollback", 1)
+                    raise RuntimeError("中途失败")
+            except RuntimeError:
+                pass
+            assert cache.get("rollback") is None and cache.get("k9") == 9
+            
+            # 后台清理线程
+            cache.set_many({f"t{i}": i for i in range(5)}, ttl=0.1)
+            cache.start_sweeper(0.1)
+            time.sleep(0.5)
+            assert cache.info()['swept'] == 6
+        
+        # 重新打开后数据和过期索引都还在
+        with BatchedShelfCache(cache_dir, granularity=0.1) as cache:
+            assert cache.get("c") == "延长了TTL" and cache.size() == 11
+            assert cache.info()['expiry_chunks'] == 3
+            cache.clear()
+            assert cache.size() == 0 and cache.info()['expiry_chunks'] == 0
+        print("BatchedShelfCache测试通过")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def _run_cache_benchmark(kind, n, conn):
+    """在子进程中运行，便于单独统计峰值内存"""
+    cache_dir = f"bench_{kind}"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    value = {'name': 'item', 'tags': ['a', 'b'], 'payload': 'x' * 100}
+    short = set(range(0, n, 100))        # 1%的键2秒后过期
+    timings = {}
+    
+    cache = WritebackShelfCache(cache_dir) if kind == 'writeback' else BatchedShelfCache(cache_dir)
+    start = time.perf_counter()
+    if kind == 'set_many':
+        for begin in range(0, n, 10000):
+            cache.set_many({f"key{i}": value for i in range(begin, min(begin + 10000, n)) if i not in short})
+        cache.set_many({f"key{i}": value for i in short}, ttl=2)
+    else:
+        for i in range(n):
+            cache.set(f"key{i}", value, ttl=2 if i in short else None)
+    timings['set'] = time.perf_counter() - start
+    start = time.perf_counter()
+    cache.close()
+    timings['close'] = time.perf_counter() - start
+    
+    time.sleep(2.5)
+    cache = WritebackShelfCache(cache_dir) if kind == 'writeback' else BatchedShelfCache(cache_dir)
+    keys = [f"key{i}" for i in random.Random(1).sample(range(n), 10000) if i not in short]
+    start = time.perf_counter()
+    for key in keys:
+        cache.get(key)
+    timings['get'] = (time.perf_counter() - start) / len(keys)
+    start = time.perf_counter()
+    if kind == 'writeback' and n > 100_000:
+        # dbm.dumb上逐个删除的开销与键数成正比，10^6个键时只测量查找过期键的部分
+        timings['swept'] = f"找到{len(cache.find_expired())}"
+    else:
+        swept = cache.clear_expired()
+        timings['swept'] = swept if isinstance(swept, int) else len(swept)
+    timings['sweep'] = time.perf_counter() - start
+    cache.close()
+    timings['backend'] = dbm.whichdb(cache.cache_file) if kind == 'writeback' else 'sqlite3'
+    timings['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    shutil.rmtree(cache_dir)
+    conn.send(timings)
+
+def benchmark_shelf_cache(sizes=(100_000, 1_000_000)):
+    ctx = multiprocessing.get_context('fork')
+    for n in sizes:
+        for kind in ('writeback', 'batched', 'set_many'):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_run_cache_benchmark, args=(kind, n, child))
+            process.start()
+            t = parent.recv()
+            process.join()
+            print(f"{n:>8}个键 {kind:<10}: 写入 {n / t['set'] / 1000:6.1f} 千项/秒, close {t['close']:6.2f} 秒, "
+                  f"读取 {t['get'] * 1e6:6.1f} 微秒/次, 清理 {t['sweep']:7.3f} 秒（{t['swept']}项）, "
+                  f"峰值内存 {t['rss']:6.0f} MB（{t['backend']}）")
+
+# 运行示例
+test_batched_shelf_cache()
+benchmark_shelf_cache()
+```
+
+参考结果（Linux，Python 3.11，单核，ext4；ShelfCache写法用`shelve.open`，沙箱中的后端是dbm.dumb；BatchedShelfCache用SQLiteDict）：
+
+| 键数 | 实现 | 写入 | close | 重新打开后读取 | 清理1%过期项 | 峰值内存 |
+|------|------|------|-------|----------------|--------------|----------|
+| 10万 | ShelfCache写法（writeback=True） | 约 33 千项/秒 | 约 1.5 秒 | 约 23 微秒/次 | 约 79 秒 | 约 153 MB |
+| 10万 | BatchedShelfCache.set | 约 82 千项/秒 | 小于 0.01 秒 | 约 17 微秒/次 | 约 0.05 秒 | 约 20 MB |
+| 10万 | BatchedShelfCache.set_many | 约 93 千项/秒 | 小于 0.01 秒 | 约 23 微秒/次 | 约 0.05 秒 | 约 22 MB |
+| 100万 | ShelfCache写法（writeback=True） | 约 31 千项/秒 | 约 14.3 秒 | 约 15 微秒/次 | 只查找过期项就要约 18 秒 | 约 1364 MB |
+| 100万 | BatchedShelfCache.set | 约 84 千项/秒 | 小于 0.01 秒 | 约 24 微秒/次 | 约 0.7 秒 | 约 23 MB |
+| 100万 | BatchedShelfCache.set_many | 约 108 千项/秒 | 小于 0.01 秒 | 约 21 微秒/次 | 约 0.35 秒 | 约 23 MB |
+
+几点说明：
+
+- 沙箱中的Python没有编译gdbm和ndbm，`shelve.open`用的是纯Python实现的`dbm.dumb`，它每删除一个键都要重写整个`.dir`索引文件，所以原来的`clear_expired`在10万个键时删除1000个过期项要将近80秒；100万个键时每次删除约需1秒，删除1万个过期项估计要数小时，基准中只测量了查找过期项的部分。`BatchedShelfCache`把数据放在`SQLiteDict`中，删除仍然是普通的`del shelf[key]`，每个键只是一次B树删除，一次清理的所有删除在同一个事务中提交。
+- 清理的耗时取决于到期的键数，与缓存总大小无关：100万个键中清理1万个过期项约0.35-0.7秒。截止时间落在当前这一秒的桶要等下一次清理（100万个键的`set`一行只清理了9870项，其余一百多项属于这种情况），在这之前读取时已经按过期处理。
+- `dbm.dumb`每个新键都要打开并追加一次`.dir`文件，写入约30千项/秒；`SQLiteDict`的写入在事务中累积，每次刷新提交一次，写入快了两到三倍。`set_many`比逐个`set`再快一些，省掉的是逐项计算过期时间和加锁的开销。
+- writeback方式要在`close`时写回所有读写过的对象，峰值内存随键数增长，100万个键时超过1.3GB。`BatchedShelfCache`只保留写缓冲区，`close`只需提交最后一批；sqlite3的页缓存有上限，100万个键时峰值内存约23MB。
+- 重新打开后的读取两者相近，都在几十微秒以内：`dbm.dumb`每次读取要打开数据文件，`SQLiteDict`每次读取是一次主键查找。
+- 一次刷新（包括`batch()`块结束时的那次）对数据的写入在一个sqlite3事务中提交，进程崩溃时不会只写入一部分。数据和过期索引是两个数据库文件，分别提交，崩溃时过期索引可能缺少最后一批分块，这些键只能在读取时惰性删除。`size()`包括已过期但还没被清理的项。
+
 ### 4.3 配置管理系统
 
 ```python
@@ -473,6 +473,488 @@ if os.path.exists("counters.db.dat"):
 
 print()
 
+print("5.2.1 批量聚合的计数器与会话存储：")
+# 上面的increment_counter每加一次1都要打开dbm文件、解码、编码、再关闭文件；
+# 两个进程同时"读出-加一-写回"时，其中一次增加会丢失。下面把修改先聚合在内存中：
+# - CounterService在内存中保存计数，increment只更新内存中的增量，攒够flush_threshold次
+#   或超过flush_interval秒后，持文件锁把所有增量一次性合并进dbm（以dbm中的当前值为基数，多个进程的增量不会互相覆盖）
+# - 每次合并先把要写入的新值（不是增量）写进预写日志（WAL）并fsync，再写dbm，最后清空日志；
+#   写dbm时崩溃，下次打开时重放日志。日志中是绝对值，重放多少次结果都一样
+# - SessionStore对会话做同样的处理：保存和删除先进入内存，批量写入；读取先查内存
+# - 有未合并的修改时启动一个flush_interval秒的定时器，之后没有新调用的空闲进程也会按时合并，不会把增量留到退出
+# - 文件锁用fcntl.flock；Windows上没有fcntl，只能由调用方保证只有一个进程写入同一个dbm
+import atexit
+import pickle
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:          # Windows没有fcntl，需要调用方自己保证只有一个进程写入
+    fcntl = None
+
+class DBMJournal:
+    """dbm文件 + 预写日志 + 文件锁：把一批修改原子地应用到dbm"""
+    
+    RECORD = struct.Struct('<II')   # 日志记录头：数据长度、CRC32
+    
+    def __init__(self, path, durable=True):
+        self.path = path
+        self.wal_path = path + ".wal"
+        self.durable = durable
+        self._lock_fd = None
+        self._lock_pid = None
+        self.recover()
+    
+    @contextmanager
+    def locked(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_pid != os.getpid():
+            # fork出的子进程必须重新打开锁文件，否则和父进程共享同一个flock
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+    
+    def _fsync(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    def _write_wal(self, changes):
+        data = pickle.dumps(changes, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.wal_path, 'wb') as f:
+            f.write(self.RECORD.pack(len(data), zlib.crc32(data)) + data)
+            f.flush()
+            if self.durable:
+                os.fsync(f.fileno())
+    
+    def _read_wal(self):
+        """返回日志中完整的一批修改；日志不存在或不完整时返回None"""
+        try:
+            with open(self.wal_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < self.RECORD.size:
+            return None
+        length, crc = self.RECORD.unpack_from(data)
+        body = data[self.RECORD.size:self.RECORD.size + length]
+        if len(body) != length or zlib.crc32(body) != crc:
+            return None        # 写日志时崩溃：dbm还没有被修改，直接丢弃
+        return pickle.loads(body)
+    
+    def _apply_to_dbm(self, db, changes):
+        for key, value in changes.items():
+            if value is None:
+                if key in db:
+                    del db[key]
+            else:
+                db[key] = value
+    
+    def _finish(self):
+        if self.durable:
+            # dumb实现是.dat/.dir两个文件，gdbm/ndbm是单个文件或.db文件
+            for suffix in ('', '.db', '.dat', '.dir'):
+                self._fsync(self.path + suffix)
+        os.remove(self.wal_path)
+    
+    def _replay_locked(self):
+        """持锁时调用：重放其他进程崩溃前没有完成的一批修改"""
+        changes = self._read_wal()
+        if changes:
+            with dbm.open(self.path, 'c') as db:
+                self._apply_to_dbm(db, changes)
+        if os.path.exists(self.wal_path):
+            self._finish()
+    
+    def recover(self):
+        """重放上次没有完成的一批修改"""
+        with self.locked():
+            self._replay_locked()
+    
+    def apply(self, compute):
+        """持锁打开dbm，compute(db)返回{键: 新值或None(删除)}，先写日志再写dbm"""
+        with self.locked():
+            # 另一个进程可能在写完日志、改完dbm之前崩溃；先补上那一批修改，compute才能看到完整的数据
+            self._replay_locked()
+            with dbm.open(self.path, 'c') as db:
+                changes = compute(db)
+                if not changes:
+                    return changes
+                self._write_wal(changes)
+                self._apply_to_dbm(db, changes)
+            self._finish()
+            return changes
+    
+    def read(self, key):
+        with self.locked():
+            self._replay_locked()
+            with dbm.open(self.path, 'c') as db:
+                return db.get(key)
+    
+    def read_all(self):
+        with self.locked():
+            self._replay_locked()
+            with dbm.open(self.path, 'c') as db:
+                return {key: db[key] for key in db.keys()}
+
+class CounterService:
+    """内存中聚合增量、批量合并进dbm的计数器"""
+    
+    def __init__(self, path="counters.db", flush_interval=1.0, flush_threshold=10000, durable=True):
+        self.journal = DBMJournal(path, durable)
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._counts = {key.decode('utf-8'): int(value) for key, value in self.journal.read_all().items()}
+        self._pending = {}
+        self._pending_ops = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+        atexit.register(self.flush)
+    
+    def increment_counter(self, counter_name, amount=1):
+        with self._lock:
+            delta = self._pending.get(counter_name, 0) + amount
+            self._pending[counter_name] = delta
+            self._pending_ops += 1
+            value = self._counts.get(counter_name, 0) + delta
+            if (self._pending_ops >= self.flush_threshold
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+            else:
+                self._schedule_flush_locked()
+            return value
+    
+    def increment_many(self, increments):
+        """批量增加：increments可以是{名称: 增量}，也可以是名称序列（每个加1）"""
+        items = increments.items() if hasattr(increments, 'items') else ((name, 1) for name in increments)
+        with self._lock:
+            pending = self._pending
+            for name, amount in items:
+                pending[name] = pending.get(name, 0) + amount
+                self._pending_ops += 1
+            if (self._pending_ops >= self.flush_threshold
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+            else:
+                self._schedule_flush_locked()
+    
+    def get_counter(self, counter_name):
+        with self._lock:
+            return self._counts.get(counter_name, 0) + self._pending.get(counter_name, 0)
+    
+    def snapshot(self, refresh=False):
+        """所有计数器的当前值；refresh=True时先合并增量，再读入其他进程写入的值"""
+        with self._lock:
+            if refresh:
+                self._flush_locked()
+                self._counts = {key.decode('utf-8'): int(value)
+                                for key, value in self.journal.read_all().items()}
+            snapshot = dict(self._counts)
+            for name, delta in self._pending.items():
+                snapshot[name] = snapshot.get(name, 0) + delta
+            return snapshot
+    
+    def reset_counter(self, counter_name):
+        with self._lock:
+            existed = self._pending.pop(counter_name, None) is not None
+            existed = self._counts.pop(counter_name, None) is not None or existed
+            key = counter_name.encode('utf-8')
+            changes = self.journal.apply(lambda db: {key: None} if key in db else {})
+            return existed or bool(changes)
+    
+    def _schedule_flush_locked(self):
+        """有未合并的修改时安排一次定时合并，进程之后空闲下来也会在flush_interval秒后写入dbm"""
+        if (self._timer is None or not self._timer.is_alive()) and self._pending:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending = self._pending
+        
+        def merge(db):
+            # 以dbm中的当前值为基数，其他进程已经合并的增量不会被覆盖
+            changes = {}
+            for name, delta in pending.items():
+                key = name.encode('utf-8')
+                current = db.get(key)
+                changes[key] = str((int(current) if current is not None else 0) + delta).encode('utf-8')
+            return changes
+        
+        changes = self.journal.apply(merge)
+        for key, value in changes.items():
+            self._counts[key.decode('utf-8')] = int(value)
+        self._pending = {}
+        self._pending_ops = 0
+
+class SessionStore:
+    """会话存储：保存和删除先在内存中累积，批量写入dbm；读取先查内存"""
+    
+    def __init__(self, path="sessions_dbm.db", flush_interval=1.0, flush_threshold=1000, durable=True):
+        self.journal = DBMJournal(path, durable)
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._sessions = {}        # session_id -> (user_id, username, expires_at)
+        self._pending = {}         # session_id -> 编码后的会话数据，None表示删除
+        self._last_flush = time.monotonic()
+        self._timer = None
+        atexit.register(self.flush)
+    
+    def save_session(self, session_id, user_id, username, expires_in=3600):
+        expires_at = datetime.datetime.now() + datetime.timedelta(seconds=expires_in)
+        with self._lock:
+            self._sessions[session_id] = (user_id, username, expires_at)
+            # 与save_session相同的存储格式
+            self._pending[session_id] = f"{user_id}:{username}:{expires_at.isoformat()}".encode('utf-8')
+            self._maybe_flush()
+        return True
+    
+    def get_session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if session_id in self._pending:       # 已删除、尚未写入dbm
+                    return None
+                # 内存中没有：可能是其他进程保存的会话，从dbm读取
+                data = self.journal.read(session_id.encode('utf-8'))
+                if data is None:
+                    return None
+                user_id, username, expires_at_str = data.decode('utf-8').split(':', 2)
+                session = (user_id, username, datetime.datetime.fromisoformat(expires_at_str))
+                self._sessions[session_id] = session
+            user_id, username, expires_at = session
+            if datetime.datetime.now() > expires_at:
+                self._delete_locked(session_id)
+                return None
+            return {'session_id': session_id, 'user_id': user_id,
+                    'username': username, 'expires_at': expires_at}
+    
+    def delete_session(self, session_id):
+        with self._lock:
+            existed = session_id in self._sessions or self._pending.get(session_id) is not None
+            if not existed:
+                existed = self.journal.read(session_id.encode('utf-8')) is not None
+            if existed:
+                self._delete_locked(session_id)
+            return existed
+    
+    def _delete_locked(self, session_id):
+        self._sessions.pop(session_id, None)
+        self._pending[session_id] = None
+        self._maybe_flush()
+    
+    def _maybe_flush(self):
+        if (len(self._pending) >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self._flush_locked()
+        else:
+            self._schedule_flush_locked()
+    
+    def _schedule_flush_locked(self):
+        """有未合并的修改时安排一次定时合并，进程之后空闲下来也会在flush_interval秒后写入dbm"""
+        if (self._timer is None or not self._timer.is_alive()) and self._pending:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        changes = {session_id.encode('utf-8'): data for session_id, data in self._pending.items()}
+        self.journal.apply(lambda db: changes)
+        self._pending = {}
+
+# 使用计数器服务
+counters = CounterService("counters.db", flush_interval=0.5, flush_threshold=1000)
+print(f"  增加页面访问计数器：")
+for _ in range(3):
+    counters.increment_counter("page_views")
+counters.increment_many(["home", "home", "about"])
+counters.increment_many({"page_views": 10})
+print(f"    内存中的值: {counters.get_counter('page_views')}")
+counters.flush()
+print(f"    合并后dbm中的值: {get_counter('page_views')}")
+print(f"    快照: {counters.snapshot()}")
+
+# 多个进程同时增加同一个计数器：每个进程在内存中聚合，持锁合并
+def _count_worker(make_increment, times):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            make_increment(times)
+        finally:
+            os._exit(0)
+    return pid
+
+def _service_increments(times):
+    service = CounterService("counters.db", flush_threshold=500)
+    for _ in range(times):
+        service.increment_counter("shared")
+    service.flush()
+
+def _plain_increments(times):
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(times):
+            increment_counter("shared_plain")
+
+if hasattr(os, 'fork') and fcntl is not None:
+    for label, worker in (("increment_counter", _plain_increments), ("CounterService", _service_increments)):
+        pids = [_count_worker(worker, 500) for _ in range(4)]
+        for pid in pids:
+            os.waitpid(pid, 0)
+        name = "shared_plain" if worker is _plain_increments else "shared"
+        print(f"  4个进程各增加500次，{label}: {counters.snapshot(refresh=True).get(name)} (期望2000)")
+else:
+    print("  当前平台没有os.fork或fcntl，跳过多进程演示")
+
+# 空闲时按时合并：只增加一次，之后不再调用，定时器在flush_interval秒后写入dbm
+counters.increment_counter("idle")
+time.sleep(0.8)
+print(f"  空闲0.8秒后dbm中的值: idle = {counters.journal.read(b'idle').decode()}")
+
+# 模拟合并时崩溃：日志已写入，dbm还没有修改
+counters.journal._write_wal({b"page_views": b"100"})
+recovered = CounterService("counters.db")
+print(f"  崩溃后重新打开，重放日志: page_views = {recovered.get_counter('page_views')}")
+# 写日志时崩溃：不完整的日志被丢弃，dbm保持上一次合并的结果
+with open(counters.journal.wal_path, 'wb') as f:
+    f.write(b"\x10\x00\x00\x00")
+recovered = CounterService("counters.db")
+print(f"  日志不完整时丢弃: page_views = {recovered.get_counter('page_views')}")
+# 另一个进程崩溃留下日志时，已经在运行的实例合并前先重放它，不会用旧值覆盖那一批修改
+counters.journal._write_wal({b"downloads": b"500"})
+counters.increment_counter("downloads")
+counters.flush()
+print(f"  合并前先重放其他进程的日志: downloads = {counters.journal.read(b'downloads').decode()} (期望501)")
+
+print(f"  重置页面访问计数器：")
+print(f"    {counters.reset_counter('page_views')}, {get_counter('page_views')}")
+
+# 使用会话存储
+sessions = SessionStore("sessions_dbm.db")
+sessions.save_session("session123", "1001", "zhangsan", expires_in=60)
+sessions.save_session("session456", "1002", "lisi", expires_in=-1)
+print(f"  获取会话（内存）: {sessions.get_session('session123')['username']}")
+sessions.flush()
+other = SessionStore("sessions_dbm.db")
+print(f"  获取会话（另一个实例，从dbm读取）: {other.get_session('session123')['username']}")
+print(f"  过期会话: {sessions.get_session('session456')}")
+print(f"  与get_session兼容: {get_session('session123')['user_id']}")
+print(f"  删除会话: {sessions.delete_session('session123')}, {sessions.get_session('session123')}")
+
+def benchmark_counters(n_plain=2000, n_fast=1000000, names=1000):
+    """比较increment_counter与CounterService的吞吐量"""
+    import contextlib, io
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n_plain):
+            increment_counter(f"bench{i % names}")
+    plain = n_plain / (time.perf_counter() - start)
+    
+    service = CounterService("counters.db", flush_interval=1.0, flush_threshold=10000)
+    start = time.perf_counter()
+    for i in range(n_fast):
+        service.increment_counter(f"bench{i % names}")
+    service.flush()
+    fast = n_fast / (time.perf_counter() - start)
+    
+    batch = [f"bench{i % names}" for i in range(n_fast)]
+    start = time.perf_counter()
+    for i in range(0, n_fast, 1000):
+        service.increment_many(batch[i:i + 1000])
+    service.flush()
+    many = n_fast / (time.perf_counter() - start)
+    print(f"  increment_counter: {plain:,.0f} 次/秒")
+    print(f"  CounterService.increment_counter: {fast:,.0f} 次/秒")
+    print(f"  CounterService.increment_many: {many:,.0f} 次/秒")
+    assert service.snapshot(refresh=True)["bench0"] == len(range(0, n_plain, names)) + 2 * len(range(0, n_fast, names))
+
+def benchmark_sessions(n=2000):
+    import contextlib, io
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n):
+            save_session(f"s{i}", str(i), f"user{i}")
+        for i in range(n):
+            get_session(f"s{i}")
+    plain = 2 * n / (time.perf_counter() - start)
+    store = SessionStore("sessions_dbm.db")
+    start = time.perf_counter()
+    for i in range(n):
+        store.save_session(f"t{i}", str(i), f"user{i}")
+    for i in range(n):
+        store.get_session(f"t{i}")
+    store.flush()
+    fast = 2 * n / (time.perf_counter() - start)
+    print(f"  save_session/get_session: {plain:,.0f} 次/秒")
+    print(f"  SessionStore: {fast:,.0f} 次/秒")
+
+# 基准测试（为了让示例运行得快一些，这里用较小的次数）
+benchmark_counters(n_plain=200, n_fast=100000)
+benchmark_sessions(n=100)
+# 参考结果（Linux，Python 3.11，单核，dbm.dumb实现，n_plain=2000、n_fast=1000000、1000个计数器，
+# 会话n=2000）：
+#   increment_counter:                    约70 次/秒（每次都要打开dbm，dumb实现打开时要解析整个.dir文件）
+#   CounterService.increment_counter:     约136,000 次/秒
+#   CounterService.increment_many:        约198,000 次/秒
+#   save_session/get_session:             约40 次/秒
+#   SessionStore:                         约17,800 次/秒（每1000次修改写一次dbm）
+#   4个进程各增加500次：increment_counter只留下548次，CounterService得到2000次
+# 几点说明：
+# - 内存中的增量在合并之前不是持久的：进程崩溃最多丢失flush_interval秒或flush_threshold次以内的增量，
+#   atexit只保证正常退出时合并；日志只保证dbm中不会出现"合并了一半"的状态
+# - 没有新调用时由threading.Timer（守护线程）在flush_interval秒后合并；fork出的子进程不会继承定时器线程，
+#   is_alive()为False时下一次修改会重新启动一个
+# - apply、read和read_all持锁后都先重放遗留的日志：另一个进程写完日志后崩溃时，
+#   正在运行的实例不会在那一批修改之前的旧值上计算，再用结果覆盖它
+# - get_counter只包含本进程的增量和上一次合并时读到的值，需要看到其他进程的增量时用snapshot(refresh=True)
+# - SessionStore在内存中找不到会话时仍然会读dbm，所以其他进程保存的会话也能读到；
+#   但其他进程删除的会话，本进程的内存中可能还留着，直到过期
+# - gdbm等实现自带的文件锁与这里的.lock文件互不相关，所有写入都应该通过同一个服务进行
+
+counters.flush()
+sessions.flush()
+for name in os.listdir('.'):
+    if name.startswith(("counters.db.", "sessions_dbm.db.")):
+        os.remove(name)
+
+print()
+
 print("5.3 简单的URL缩短服务：")
 
 import random
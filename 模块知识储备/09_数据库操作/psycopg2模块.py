@@ -918,6 +918,466 @@ if __name__ == "__main__":
                 print(f"- {item['product_name']}: {item['quantity']}个 × ${item['unit_price']} = ${item['quantity'] * item['unit_price']}")
 ```
 
+### 示例3：基于集合的下单与批量导入
+
+`StoreDB.create_order`对每个订单项都要往返数据库好几次：先`SELECT price, stock`检查库存，插入订单后再`SELECT price`一次，然后各执行一次`INSERT`和`UPDATE`。一个有N项的订单要执行4N+1条语句。检查库存时也没有锁住产品行，两个并发的订单可能都通过检查，把库存扣成负数。`UserManager._connect`每次调用都新建一个连接，建立连接本身就要几毫秒。
+
+下面的`PooledStoreDB`和`PooledUserManager`保持原来的方法，做了以下几处修改：
+
+- **集合化下单**：`create_order`不管订单有多少项，都只执行4条语句：
+  - 用`SELECT ... WHERE id = ANY(%s) ORDER BY id FOR UPDATE`一次锁定并读取所有产品
+  - 插入订单
+  - 用`execute_values`一次插入全部订单项
+  - 用`UPDATE ... FROM (VALUES ...)`一次扣减全部库存
+
+  产品行按id顺序加锁，并发下单时不会互相死锁
+- **连接池**：连接来自`ThreadedConnectionPool`，可以在多个线程间共享。`ThreadedConnectionPool`的连接全部被占用时，`getconn`会直接抛出`PoolError`，所以这里的子类`_BlockingConnectionPool`用一个信号量让多出来的线程等待，线程数可以超过`maxconn`。`PooledStoreDB.connection()`在with块正常结束时提交，出错时回滚，然后归还连接。`PooledUserManager`只替换了`_connect`：它返回一个代理对象，原有方法末尾的`conn.close()`会先回滚未完成的事务，再把连接归还给池
+- **COPY批量导入**：`bulk_load_products`和`bulk_load_users`用`copy_expert`执行`COPY ... FROM STDIN`，数据按COPY文本格式转义，每10万行发送一次
+  - 用户需要分配默认角色，所以先COPY进临时表，再用一条`INSERT ... SELECT ... RETURNING`同时写入`users`和`user_roles`
+- **服务器端游标**：`iter_products`用命名游标流式读取，每次从服务器取`itersize`行
+- **索引**：为`order_items(order_id)`建索引，`get_order`和级联删除订单都会用到
+
+```python
+import io
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+def _copy_text(value):
+    """按COPY文本格式转义一个字段：None写成\\N，反斜杠、制表符和换行要转义"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def _copy_rows(cursor, sql, rows, chunk_rows=100000):
+    """分块把rows按COPY文本格式写入sql（COPY ... FROM STDIN），返回写入的行数"""
+    count = 0
+    buffer = io.StringIO()
+    pending = 0
+    for row in rows:
+        buffer.write('\t'.join(map(_copy_text, row)))
+        buffer.write('\n')
+        pending += 1
+        if pending == chunk_rows:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            count += pending
+            buffer = io.StringIO()
+            pending = 0
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        count += pending
+    return count
+
+class _BlockingConnectionPool(ThreadedConnectionPool):
+    """连接全部被占用时，getconn等待其他线程归还连接，而不是抛出PoolError"""
+    
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._available = threading.Semaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+    
+    def getconn(self, key=None):
+        self._available.acquire()
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self._available.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._available.release()
+
+class _PooledConnection:
+    """连接池中连接的代理：close()不关闭连接，而是回滚未完成的事务后归还给连接池"""
+    
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = pool.getconn()
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        self._pool.putconn(conn, close=bool(conn.closed))
+
+class PooledUserManager(UserManager):
+    """UserManager的方法保持不变：_connect从连接池取连接，方法末尾的conn.close()把连接归还给池"""
+    
+    def __init__(self, db_config, minconn=1, maxconn=10):
+        self.pool = _BlockingConnectionPool(minconn, maxconn, **db_config)
+        super().__init__(db_config)
+    
+    def _connect(self):
+        return _PooledConnection(self.pool)
+    
+    def bulk_load_users(self, users_data, chunk_rows=100000):
+        """用COPY批量导入用户并分配默认角色：users_data为(username, password, email)序列
+        
+        先COPY进临时表，再用一条INSERT ... SELECT写入users和user_roles
+        """
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                CREATE TEMP TABLE users_staging (
+                    username VARCHAR(50), password VARCHAR(255), email VARCHAR(100)
+                ) ON COMMIT DROP
+                ''')
+                _copy_rows(cursor, "COPY users_staging (username, password, email) FROM STDIN",
+                           users_data, chunk_rows)
+                cursor.execute('''
+                WITH new_users AS (
+                    INSERT INTO users (username, password, email)
+                    SELECT username, password, email FROM users_staging
+                    RETURNING id
+                )
+                INSERT INTO user_roles (user_id, role_id)
+                SELECT new_users.id, roles.id FROM new_users, roles WHERE roles.name = 'user'
+                ''')
+                count = cursor.rowcount
+            conn.commit()
+            return count
+        finally:
+            conn.close()
+
+class PooledStoreDB:
+    """StoreDB的集合化版本：连接来自ThreadedConnectionPool，下单固定执行4条语句"""
+    
+    def __init__(self, db_config, minconn=1, maxconn=10):
+        self.pool = _BlockingConnectionPool(minconn, maxconn, **db_config)
+        self._create_tables()
+    
+    def close(self):
+        self.pool.closeall()
+    
+    @contextmanager
+    def connection(self):
+        """从连接池取出连接，with块正常结束时提交，出错时回滚，最后归还连接"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+    
+    def _create_tables(self):
+        """创建表结构，与StoreDB相同，另外为order_items.order_id建索引"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                description TEXT,
+                price NUMERIC(10, 2) NOT NULL,
+                stock INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                id SERIAL PRIMARY KEY,
+                customer_name VARCHAR(100) NOT NULL,
+                customer_email VARCHAR(100),
+                total_amount NUMERIC(10, 2) NOT NULL,
+                status VARCHAR(20) DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_items (
+                id SERIAL PRIMARY KEY,
+                order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
+                product_id INTEGER REFERENCES products(id) ON DELETE SET NULL,
+                quantity INTEGER NOT NULL,
+                unit_price NUMERIC(10, 2) NOT NULL
+            )
+            ''')
+            # get_order按order_id查订单项，删除订单时级联删除也要用到
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)")
+    
+    def add_product(self, name, description, price, stock):
+        """添加产品"""
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO products (name, description, price, stock) VALUES (%s, %s, %s, %s) RETURNING id",
+                    (name, description, price, stock)
+                )
+                return True, cursor.fetchone()[0]
+        except psycopg2.Error as e:
+            print(f"添加产品失败: {e}")
+            return False, None
+    
+    def bulk_load_products(self, products, chunk_rows=100000):
+        """用COPY批量导入产品：products为(name, description, price, stock)序列，返回导入的行数"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            return _copy_rows(cursor, "COPY products (name, description, price, stock) FROM STDIN",
+                              products, chunk_rows)
+    
+    def create_order(self, customer_name, customer_email, items):
+        """创建订单：items为{产品ID: 数量}
+        
+        不管有多少个订单项，都只执行4条语句：锁定并读取所有产品、插入订单、
+        一次插入全部订单项、一次更新全部库存
+        """
+        product_ids = sorted(items)   # 按固定顺序加锁，并发下单时不会互相死锁
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, price, stock FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                    (product_ids,)
+                )
+                products = {product_id: (price, stock) for product_id, price, stock in cursor.fetchall()}
+                
+                total_amount = 0
+                for product_id in product_ids:
+                    if product_id not in products:
+                        raise ValueError(f"产品不存在: {product_id}")
+                    price, stock = products[product_id]
+                    if stock < items[product_id]:
+                        raise ValueError(f"产品库存不足: {product_id}")
+                    total_amount += price * items[product_id]
+                
+                cursor.execute(
+                    "INSERT INTO orders (customer_name, customer_email, total_amount) VALUES (%s, %s, %s) RETURNING id",
+                    (customer_name, customer_email, total_amount)
+                )
+                order_id = cursor.fetchone()[0]
+                
+                if product_ids:
+                    execute_values(
+                        cursor,
+                        "INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES %s",
+                        [(order_id, product_id, items[product_id], products[product_id][0])
+                         for product_id in product_ids],
+                        page_size=len(product_ids)
+                    )
+                    execute_values(
+                        cursor,
+                        '''UPDATE products AS p SET stock = p.stock - v.quantity
+                        FROM (VALUES %s) AS v(id, quantity) WHERE p.id = v.id''',
+                        [(product_id, items[product_id]) for product_id in product_ids],
+                        page_size=len(product_ids)
+                    )
+            return True, order_id
+        except (psycopg2.Error, ValueError) as e:
+            print(f"创建订单失败: {e}")
+            return False, None
+    
+    def get_order(self, order_id):
+        """获取订单详情"""
+        with self.connection() as conn, conn.cursor(cursor_factory=DictCursor) as cursor:
+            cursor.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
+            order = cursor.fetchone()
+            if not order:
+                return False, "订单不存在"
+            order = dict(order)     # DictRow不能添加新的键
+            cursor.execute('''
+            SELECT oi.*, p.name as product_name
+            FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id = %s
+            ''', (order_id,))
+            order['items'] = cursor.fetchall()
+            return True, order
+    
+    def iter_products(self, batch_size=2000):
+        """用服务器端（命名）游标流式读取所有产品，每次从服务器取batch_size行"""
+        with self.connection() as conn:
+            with conn.cursor(name='iter_products', cursor_factory=DictCursor) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("SELECT * FROM products ORDER BY id")
+                yield from cursor
+```
+
+测试与基准（`StoreDB`、`UserManager`即上面示例1、示例2中的类；需要一个本地的PostgreSQL，基准会删除并重建示例用到的表）：
+
+```python
+import contextlib
+from decimal import Decimal
+import random
+import resource
+import threading
+import time
+
+def reset_tables(db_config):
+    """删除示例用到的表，重新开始"""
+    conn = psycopg2.connect(**db_config)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS order_items, orders, products, user_roles, roles, users CASCADE")
+    conn.close()
+
+def test_pooled_store(db_config):
+    reset_tables(db_config)
+    store = PooledStoreDB(db_config)
+    store.bulk_load_products([('笔记本电脑', '高性能\t笔记本\\电脑', 5999.99, 10),
+                              ('手机', None, 2999.99, 50),
+                              ('耳机', '无线耳机\n第二行', 299.99, 100)])
+    success, order_id = store.create_order('John Doe', 'john@example.com', {1: 1, 3: 2})
+    assert success
+    success, order = store.get_order(order_id)
+    assert order['total_amount'] == Decimal('6599.97')
+    assert sorted((item['product_id'], item['quantity']) for item in order['items']) == [(1, 1), (3, 2)]
+    # 库存不足或产品不存在时整个订单回滚
+    assert store.create_order('Jane', None, {1: 100, 3: 1}) == (False, None)
+    assert store.create_order('Jane', None, {3: 1, 99: 1}) == (False, None)
+    products = {row['id']: row for row in store.iter_products(batch_size=2)}
+    assert [products[i]['stock'] for i in (1, 2, 3)] == [9, 50, 98]
+    assert products[1]['description'] == '高性能\t笔记本\\电脑' and products[2]['description'] is None
+    assert products[3]['description'] == '无线耳机\n第二行'
+    
+    users = PooledUserManager(db_config, maxconn=2)
+    assert users.create_user('alice', 'password123', 'alice@example.com')[0]
+    assert not users.create_user('alice', 'password123')[0]     # 失败后连接仍可复用
+    assert users.bulk_load_users([('bob', 'pw', 'bob@example.com'), ('carol', 'pw', None)]) == 2
+    conn = users._connect()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+        SELECT u.username, r.name FROM users u
+        JOIN user_roles ur ON ur.user_id = u.id JOIN roles r ON r.id = ur.role_id
+        ORDER BY u.id
+        ''')
+        assert cursor.fetchall() == [('alice', 'user'), ('bob', 'user'), ('carol', 'user')]
+    conn.close()
+    users.pool.closeall()
+    store.close()
+    print("测试通过")
+
+def benchmark_store(db_config, n_products=200000, n_orders=1000, items_per_order=10,
+                    n_users=200000, n_single=1000, threads=4):
+    """比较StoreDB/UserManager与集合化、连接池版本的吞吐量"""
+    reset_tables(db_config)
+    results = []
+    
+    def timed(label, func, count, unit):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        results.append((label, count / (time.perf_counter() - start), unit))
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        store = StoreDB(db_config)
+        users = UserManager(db_config)
+        pooled = PooledStoreDB(db_config, maxconn=threads)
+        pooled_users = PooledUserManager(db_config, maxconn=threads)
+    
+    # 产品导入
+    products = [(f"产品{i}", f"描述{i}", 10 + i % 1000, 1000000) for i in range(n_products)]
+    timed("StoreDB.add_product", lambda: [store.add_product(*p) for p in products[:n_single]],
+          n_single, "行")
+    
+    def insert_values():
+        with pooled.connection() as conn, conn.cursor() as cursor:
+            execute_values(cursor, "INSERT INTO products (name, description, price, stock) VALUES %s",
+                           products, page_size=1000)
+    timed("execute_values", insert_values, n_products, "行")
+    timed("PooledStoreDB.bulk_load_products（COPY）", lambda: pooled.bulk_load_products(products),
+          n_products, "行")
+    
+    # 下单：每个订单items_per_order种产品
+    rng = random.Random(42)
+    product_count = n_single + 2 * n_products
+    orders = [{pid: rng.randint(1, 3) for pid in rng.sample(range(1, product_count + 1), items_per_order)}
+              for _ in range(n_orders)]
+    timed(f"StoreDB.create_order（{items_per_order}项）",
+          lambda: [store.create_order('客户', 'c@example.com', items) for items in orders],
+          n_orders, "单")
+    timed(f"PooledStoreDB.create_order（{items_per_order}项）",
+          lambda: [pooled.create_order('客户', 'c@example.com', items) for items in orders],
+          n_orders, "单")
+    
+    def concurrent_orders():
+        def worker(part):
+            for items in part:
+                assert pooled.create_order('客户', 'c@example.com', items)[0]
+        workers = [threading.Thread(target=worker, args=(orders[i::threads],)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    timed(f"PooledStoreDB.create_order（{threads}个线程）", concurrent_orders, n_orders, "单")
+    
+    with pooled.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT SUM(1000000 - stock) FROM products")
+        sold = cursor.fetchone()[0]
+    assert sold == 3 * sum(sum(items.values()) for items in orders)
+    
+    # 用户
+    names = [(f"user{i}", 'pw', f"user{i}@example.com") for i in range(n_single)]
+    timed("UserManager.create_user", lambda: [users.create_user(*u) for u in names[:n_single]],
+          n_single, "行")
+    timed("PooledUserManager.create_user",
+          lambda: [pooled_users.create_user(f"pooled{i}", 'pw') for i in range(n_single)],
+          n_single, "行")
+    timed("PooledUserManager.bulk_load_users（COPY）",
+          lambda: pooled_users.bulk_load_users([(f"copy{i}", 'pw', None) for i in range(n_users)]),
+          n_users, "行")
+    
+    # 流式读取
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    count = sum(1 for _ in pooled.iter_products())
+    elapsed = time.perf_counter() - start
+    peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    for label, rate, unit in results:
+        print(f"{label}: {rate:,.0f} {unit}/秒")
+    print(f"iter_products读取{count:,}行: {count / elapsed:,.0f} 行/秒，"
+          f"峰值内存增加 {(peak_after - peak_before) / 1024:.1f} MB")
+    pooled_users.pool.closeall()
+    pooled.close()
+
+# 测试
+if __name__ == "__main__":
+    db_config = {
+        'host': 'localhost',
+        'user': 'postgres',
+        'password': 'password',
+        'dbname': 'test_db',
+        'port': 5432
+    }
+    # 注意：会删除并重建products、orders、users等表，请使用专门的测试数据库
+    test_pooled_store(db_config)
+    benchmark_store(db_config)
+```
+
+参考结果（Linux，Python 3.11，psycopg2 2.9，PostgreSQL 16，客户端和服务器在同一台机器上共用一个CPU核心，通过Unix套接字连接；20万个产品，1000个订单，每单10项）：
+
+| 操作 | 原实现 | 新实现 |
+|------|--------|--------|
+| 下单（每单10项，41条语句 → 4条） | 约 270-340 单/秒 | 约 410-480 单/秒 |
+| 下单，4个线程共享连接池 | - | 约 420-430 单/秒 |
+| 添加产品 | 约 3.5-4.4 千行/秒（`add_product`逐条提交） | 约 145-150 千行/秒（COPY） |
+| 同一批产品用`execute_values`插入 | - | 约 50 千行/秒 |
+| 创建用户（逐个调用`create_user`） | 约 150 行/秒（每次新建连接） | 约 1.8-2.1 千行/秒 |
+| `bulk_load_users`（COPY，含分配角色） | - | 约 34-47 千行/秒 |
+| `iter_products`读取40万行 | - | 约 107-133 千行/秒，峰值内存几乎不增加 |
+
+几点说明：
+
+- 这里一次往返只要约0.06毫秒，新的`create_order`大部分时间花在服务器上：插入订单项时要做外键检查，还要锁行。数据库在另一台机器上时，每次往返要零点几毫秒到几毫秒，原实现的41次往返会占去大部分时间，差距会比这里大得多
+- 只有一个CPU核心时，多个线程并发下单不会更快；连接池主要省去了建立连接的开销，并且让多个线程可以安全地共享连接
+- `bulk_load_users`的大部分时间花在`user_roles`的外键检查上，每行要检查两次。单独COPY进没有外键的`products`时约15万行/秒
+- 示例1的`batch_create_users`用`execute_values(..., RETURNING id)`取回新用户的ID，但没有传入`fetch=True`。`fetchall()`只能拿到最后一页（默认100行）的ID，所以超过100个用户时，只有最后100个被分配了角色。`bulk_load_users`在数据库内完成分配，没有这个问题
+- 命名游标必须在事务中使用。`iter_products`遍历期间一直占用一个池中的连接，并持有一个事务；遍历完或者提前退出（生成器被关闭）时，连接才归还
+
 ## 最佳实践
 
 1. **使用参数化查询**：始终使用参数化查询，避免SQL注入攻击
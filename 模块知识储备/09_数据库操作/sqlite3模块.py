@@ -645,6 +645,716 @@ for comment in blog_db.get_comments(post_id):
     print(f"{comment['author_name']}: {comment['content']}")
 ```
 
+### 示例3：连接复用与批量写入的数据访问层
+
+上面的`UserManager`和`BlogDatabase`在每个方法里都调用`sqlite3.connect`，每插入一行就提交一次；数据库使用默认的回滚日志模式，每次提交都要多次fsync；`posts.author_id`和`comments.post_id`上没有索引，`get_comments`每次都要扫描整个评论表，列出一页文章再逐篇取评论就是N+1次这样的扫描。
+
+下面的数据访问层保持原来的方法和返回值，改动集中在连接和事务上：
+
+- **线程本地连接池**：`ConnectionPool.connection()`为每个线程打开一个连接并一直复用，打开时设置`journal_mode=WAL`、`synchronous=NORMAL`、`foreign_keys`和`busy_timeout`
+- **语句复用**：sqlite3模块按SQL文本在每个连接上缓存已编译的语句（`cached_statements`）；连接不再反复打开，这个缓存才起作用。所有方法都使用固定的SQL文本和参数
+- **显式事务**：连接以`isolation_level=None`打开，`pool.transaction()`执行`BEGIN IMMEDIATE`/`COMMIT`，出错时回滚；嵌套使用时并入外层事务，所以`with blog.batch():`可以把多次单条写入合并成一次提交
+- **批量写入**：`add_users`、`create_posts`、`add_comments`在一个事务里用一次`executemany`插入整批数据
+- **补上索引**：`posts(author_id)`、`comments(post_id, created_at)`、`comments(author_id)`，级联删除查找子行时也会用到
+- **避免N+1**：`get_comments_for_posts(post_ids)`用一条`IN (...)`查询取出多篇文章的评论，按文章分组返回；`PooledUserManager.get_users`同理
+
+```python
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+class ConnectionPool:
+    """线程本地的连接池：每个线程第一次使用时打开一个连接并设置pragma，之后一直复用"""
+    
+    DEFAULT_PRAGMAS = {
+        'journal_mode': 'WAL',        # 读写互不阻塞，提交时只追加WAL文件
+        'synchronous': 'NORMAL',      # WAL模式下只在检查点时fsync，断电可能丢失最后几个事务，但不会损坏数据库
+        'foreign_keys': 'ON',
+        'busy_timeout': 5000,
+        'cache_size': -20000,         # 约20MB页缓存
+    }
+    
+    def __init__(self, db_path, cached_statements=256, **pragmas):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.pragmas = {**self.DEFAULT_PRAGMAS, **pragmas}
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+    
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：由transaction()显式控制事务；
+            # 同一个连接上相同的SQL文本会复用已编译的语句（最多cached_statements条）
+            # check_same_thread=False只是为了让close_all能在其他线程关闭连接，连接本身只在创建它的线程中使用
+            conn = sqlite3.connect(self.db_path, isolation_level=None,
+                                   cached_statements=self.cached_statements,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """显式事务；嵌套使用时并入外层事务，只在最外层提交"""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+    
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+def _chunks(items, size=500):
+    """IN (...)的参数个数有上限（旧版本SQLite为999），分批查询"""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class PooledUserManager:
+    """与UserManager接口相同，连接来自连接池，另外提供批量插入"""
+    
+    def __init__(self, pool):
+        self.pool = pool
+        self._create_table()
+    
+    def _create_table(self):
+        with self.pool.transaction() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                email TEXT UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+    
+    def add_user(self, username, password, email=None):
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                    (username, password, email)
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+    
+    def add_users(self, users):
+        """批量添加用户：users为(username, password, email)序列，一个事务、一次executemany
+        
+        用户名或邮箱已存在的行被跳过，返回实际插入的行数
+        """
+        with self.pool.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password, email) VALUES (?, ?, ?)",
+                users
+            )
+            return conn.total_changes - before
+    
+    def get_user(self, user_id):
+        return self.pool.connection().execute(
+            "SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    
+    def get_user_by_username(self, username):
+        return self.pool.connection().execute(
+            "SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+    
+    def get_users(self, user_ids):
+        """一次取出多个用户，返回{id: 行}"""
+        conn = self.pool.connection()
+        users = {}
+        for chunk in _chunks(user_ids):
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT * FROM users WHERE id IN ({placeholders})", chunk):
+                users[row['id']] = row
+        return users
+    
+    def update_user(self, user_id, password=None, email=None):
+        if password and email:
+            sql, params = "UPDATE users SET password = ?, email = ? WHERE id = ?", (password, email, user_id)
+        elif password:
+            sql, params = "UPDATE users SET password = ? WHERE id = ?", (password, user_id)
+        elif email:
+            sql, params = "UPDATE users SET email = ? WHERE id = ?", (email, user_id)
+        else:
+            return False
+        with self.pool.transaction() as conn:
+            return conn.execute(sql, params).rowcount > 0
+    
+    def delete_user(self, user_id):
+        with self.pool.transaction() as conn:
+            return conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount > 0
+    
+    def list_users(self, limit=10, offset=0):
+        return self.pool.connection().execute(
+            "SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+
+class PooledBlogDatabase:
+    """与BlogDatabase接口相同，补上外键列的索引，提供批量写入和批量读取评论"""
+    
+    def __init__(self, pool):
+        self.pool = pool
+        self._create_tables()
+    
+    def _create_tables(self):
+        with self.pool.transaction() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                author_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (author_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content TEXT NOT NULL,
+                post_id INTEGER NOT NULL,
+                author_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE,
+                FOREIGN KEY (author_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+            ''')
+            # 外键列上的索引：按文章查评论、按作者查文章，以及级联删除时查找子行都要用到
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_author ON posts(author_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_post ON comments(post_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_author ON comments(author_id)")
+    
+    def add_users(self, users):
+        """批量添加用户：users为(username, email, password)序列"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO users (username, email, password) VALUES (?, ?, ?)", users)
+    
+    def create_post(self, title, content, author_id):
+        with self.pool.transaction() as conn:
+            return conn.execute(
+                "INSERT INTO posts (title, content, author_id) VALUES (?, ?, ?)",
+                (title, content, author_id)
+            ).lastrowid
+    
+    def create_posts(self, posts):
+        """批量创建文章：posts为(title, content, author_id)序列，一个事务、一次executemany"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO posts (title, content, author_id) VALUES (?, ?, ?)", posts)
+    
+    def get_post(self, post_id):
+        return self.pool.connection().execute('''
+            SELECT p.*, u.username as author_name
+            FROM posts p
+            JOIN users u ON p.author_id = u.id
+            WHERE p.id = ?
+            ''', (post_id,)).fetchone()
+    
+    def get_posts(self, limit=10, offset=0):
+        return self.pool.connection().execute('''
+            SELECT p.*, u.username as author_name
+            FROM posts p
+            JOIN users u ON p.author_id = u.id
+            ORDER BY p.created_at DESC
+            LIMIT ? OFFSET ?
+            ''', (limit, offset)).fetchall()
+    
+    def add_comment(self, content, post_id, author_id):
+        with self.pool.transaction() as conn:
+            return conn.execute(
+                "INSERT INTO comments (content, post_id, author_id) VALUES (?, ?, ?)",
+                (content, post_id, author_id)
+            ).lastrowid
+    
+    def add_comments(self, comments):
+        """批量添加评论：comments为(content, post_id, author_id)序列"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO comments (content, post_id, author_id) VALUES (?, ?, ?)", comments)
+    
+    def get_comments(self, post_id):
+        return self.pool.connection().execute('''
+            SELECT c.*, u.username as author_name
+            FROM comments c
+            JOIN users u ON c.author_id = u.id
+            WHERE c.post_id = ?
+            ORDER BY c.created_at DESC
+            ''', (post_id,)).fetchall()
+    
+    def get_comments_for_posts(self, post_ids):
+        """一次查询取出多篇文章的评论，返回{post_id: [评论, ...]}，代替逐篇调用get_comments"""
+        conn = self.pool.connection()
+        comments = {post_id: [] for post_id in post_ids}
+        for chunk in _chunks(comments):
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'''
+                SELECT c.*, u.username as author_name
+                FROM comments c
+                JOIN users u ON c.author_id = u.id
+                WHERE c.post_id IN ({placeholders})
+                ORDER BY c.post_id, c.created_at DESC
+                ''', chunk)
+            for row in rows:
+                comments[row['post_id']].append(row)
+        return comments
+    
+    def batch(self):
+        """把多次单条写入合并进一个事务：with blog.batch(): blog.create_post(...) ..."""
+        return self.pool.transaction()
+```
+
+测试与基准（`BlogDatabase`即上面示例2中的类）：
+
+```python
+import os
+import time
+
+def _remove_db(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def test_pooled_blog():
+    _remove_db('blog_pooled.db')
+    pool = ConnectionPool('blog_pooled.db')
+    blog = PooledBlogDatabase(pool)
+    users = PooledUserManager(ConnectionPool(':memory:'))
+    assert users.add_user('alice', 'pw', 'a@example.com')
+    assert not users.add_user('alice', 'pw')
+    assert users.add_users([('bob', 'pw', None), ('alice', 'x', None), ('carol', 'pw', None)]) == 2
+    assert users.get_user_by_username('carol')['id'] in users.get_users([1, 2, 3, 4])
+    assert users.update_user(1, email='new@example.com') and users.get_user(1)['email'] == 'new@example.com'
+    assert users.delete_user(1) and len(users.list_users()) == 2
+    
+    blog.add_users([('alice', 'alice@example.com', 'pw'), ('bob', 'bob@example.com', 'pw')])
+    post_id = blog.create_post("标题", "内容", 1)
+    blog.create_posts([(f"文章{i}", "内容", 1 + i % 2) for i in range(10)])
+    blog.add_comment("好文章", post_id, 2)
+    blog.add_comments([("第二条", post_id, 1), ("别的文章", post_id + 1, 2)])
+    assert blog.get_post(post_id)['author_name'] == 'alice'
+    assert len(blog.get_comments(post_id)) == 2
+    grouped = blog.get_comments_for_posts([post_id, post_id + 1, post_id + 2])
+    assert [len(grouped[p]) for p in (post_id, post_id + 1, post_id + 2)] == [2, 1, 0]
+    assert len(blog.get_posts(limit=5)) == 5
+    
+    # 事务中出错时整体回滚
+    try:
+        with blog.batch():
+            blog.create_post("会被回滚", "内容", 1)
+            blog.create_post("作者不存在", "内容", 999)
+    except sqlite3.IntegrityError:
+        pass
+    assert pool.connection().execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 11
+    assert pool.connection().execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    
+    # 每个线程使用自己的连接
+    seen = []
+    def worker():
+        seen.append(pool.connection())
+        blog.create_post("线程中创建", "内容", 2)
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(map(id, seen))) == 4
+    pool.close_all()
+    _remove_db('blog_pooled.db')
+    print("测试通过")
+
+def benchmark_blog(n_posts=2000, n_comments=100000, n_reads=2000, n_listed=100):
+    """比较BlogDatabase与PooledBlogDatabase的写入、读取和N+1查询"""
+    _remove_db('blog_before.db')
+    _remove_db('blog_after.db')
+    users = [(f"user{i}", f"user{i}@example.com", 'pw') for i in range(100)]
+    posts = [(f"文章{i}", "内容" * 50, 1 + i % 100) for i in range(n_posts)]
+    comments = [(f"评论{i}", 1 + i % n_posts, 1 + i % 100) for i in range(n_comments)]
+    
+    before = BlogDatabase('blog_before.db')
+    with sqlite3.connect('blog_before.db') as conn:
+        conn.executemany("INSERT INTO users (username, email, password) VALUES (?, ?, ?)", users)
+    pool = ConnectionPool('blog_after.db')
+    after = PooledBlogDatabase(pool)
+    after.add_users(users)
+    results = []
+    
+    def timed(label, func, count, unit="行"):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        results.append((label, count / elapsed, unit))
+    
+    timed("BlogDatabase.create_post（逐条提交）",
+          lambda: [before.create_post(*post) for post in posts], n_posts)
+    timed("PooledBlogDatabase.create_post（逐条提交）",
+          lambda: [after.create_post(*post) for post in posts], n_posts)
+    timed("PooledBlogDatabase.create_posts（一个事务）",
+          lambda: after.create_posts(posts), n_posts)
+    with sqlite3.connect('blog_before.db') as conn:
+        conn.executemany("INSERT INTO comments (content, post_id, author_id) VALUES (?, ?, ?)", comments)
+    timed("PooledBlogDatabase.add_comments（一个事务）",
+          lambda: after.add_comments(comments), n_comments)
+    
+    ids = [1 + (i * 7919) % n_posts for i in range(n_reads)]
+    timed("BlogDatabase.get_post", lambda: [before.get_post(i) for i in ids], n_reads)
+    timed("PooledBlogDatabase.get_post", lambda: [after.get_post(i) for i in ids], n_reads)
+    
+    listed = list(range(1, n_listed + 1))
+    timed(f"BlogDatabase.get_comments × {n_listed}篇（无索引）",
+          lambda: [before.get_comments(i) for i in listed], n_listed, "篇")
+    timed(f"PooledBlogDatabase.get_comments × {n_listed}篇",
+          lambda: [after.get_comments(i) for i in listed], n_listed, "篇")
+    timed(f"PooledBlogDatabase.get_comments_for_posts（{n_listed}篇一次查询）",
+          lambda: after.get_comments_for_posts(listed), n_listed, "篇")
+    assert sum(map(len, after.get_comments_for_posts(listed).values())) == \
+        sum(len(before.get_comments(i)) for i in listed)
+    
+    for label, rate, unit in results:
+        print(f"{label}: {rate:,.0f} {unit}/秒")
+    pool.close_all()
+    _remove_db('blog_before.db')
+    _remove_db('blog_after.db')
+
+# 运行示例
+test_pooled_blog()
+benchmark_blog()
+```
+
+参考结果（Linux，Python 3.11，SQLite 3.40，单核，ext4；2000篇文章、10万条评论、100个用户，每篇文章50条评论）：
+
+| 操作 | BlogDatabase | PooledBlogDatabase |
+|------|--------------|--------------------|
+| 逐条`create_post`（每条一次提交） | 约 1.1-1.2 千行/秒 | 约 19-21 千行/秒 |
+| `create_posts`（一个事务） | - | 约 150-220 千行/秒 |
+| `add_comments`（一个事务） | - | 约 100-120 千行/秒 |
+| `get_post` | 约 3.4-4.9 千行/秒 | 约 43-48 千行/秒 |
+| 100篇文章逐篇`get_comments` | 约 105-115 篇/秒（全表扫描） | 约 3.6-5.7 千篇/秒 |
+| `get_comments_for_posts`（100篇一次查询） | - | 约 4.5-6.6 千篇/秒 |
+
+几点说明：
+
+- 逐条提交时的差距主要来自WAL和`synchronous=NORMAL`：提交只追加WAL文件，不再每次fsync。断电时可能丢失最后几个已提交的事务，但数据库不会损坏；不能接受时传入`synchronous='FULL'`
+- 读取的差距主要来自连接复用：原来的每次调用都要打开文件、读取表结构、重新编译语句
+- SQLite在进程内执行，没有网络往返，所以把N+1次查询合并成一次只快了两三成；`get_comments`快30多倍靠的是`comments(post_id, created_at)`索引
+- 连接池按线程分配连接，`db_path`必须是文件：对`:memory:`来说，每个线程会得到各自独立的空数据库
+- WAL模式会生成`-wal`和`-shm`两个文件，复制数据库文件之前先执行检查点或使用`conn.backup`
+
+### 示例4：键集分页与覆盖索引
+
+`list_users(limit, offset)`和`get_posts(limit, offset)`用`LIMIT/OFFSET`分页：OFFSET为n时，SQLite要按排序顺序先读出前n行再丢掉，翻到第几页就要多读几页的数据。`get_posts`还会取出`p.*`，列表页用不到的正文也要从表中读出来。
+
+下面在示例3的数据访问层上增加键集（seek）分页：
+
+- **游标**：每页返回`(行列表, 下一页的游标)`。游标是上一页最后一行的`(created_at, id)`编码成的不透明字符串，下一页用`WHERE (created_at, id) < (?, ?)`直接从索引中的这个位置开始读取，不管翻到多深都只读`limit + 1`行（多读的一行用来判断是否还有下一页）。`created_at`可能重复，用`id`区分同一时刻的多行
+- **覆盖索引**：`users(created_at, id, username, email)`和`posts(created_at, id, author_id, title)`包含列表页要用的全部列，并且已经按翻页的顺序排列，查询只读索引，不用回表，也不用排序。`get_posts_page(with_content=True)`需要正文时，只对这一页的20行回表
+- **先分页再关联**：文章先在子查询中按索引取出一页，再关联`users`；直接写JOIN时，用户很少的表可能被查询规划器选为外层循环，结果是先关联全部文章再排序
+- **流式遍历**：`iter_posts`和`iter_users`执行一条查询，用`fetchmany`每次取`batch_size`行，遍历整张表时内存占用不随行数增长
+
+```python
+import base64
+import json
+
+def encode_cursor(values):
+    """把最后一行的排序键编码成不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor!r}") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f"无效的分页游标: {cursor!r}")
+    return values
+
+def _page(rows, limit):
+    """多取的一行只用来判断是否还有下一页"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor([last['created_at'], last['id']])
+    return rows, None
+
+class PagedUserManager(PooledUserManager):
+    """在PooledUserManager上增加键集分页和流式遍历"""
+    
+    LIST_COLUMNS = "id, username, email, created_at"
+    
+    def _create_table(self):
+        super()._create_table()
+        with self.pool.transaction() as conn:
+            # 列表页用到的列都在索引里（覆盖索引），按(created_at, id)有序，翻页时不用回表，也不用排序
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_users_listing ON users(created_at, id, username, email)")
+    
+    def list_users_page(self, limit=10, cursor=None):
+        """按创建时间倒序列出用户，返回(行列表, 下一页的游标)；没有下一页时游标为None"""
+        conn = self.pool.connection()
+        if cursor is None:
+            rows = conn.execute(
+                f"SELECT {self.LIST_COLUMNS} FROM users "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (limit + 1,)
+            ).fetchall()
+        else:
+            created_at, last_id = decode_cursor(cursor)
+            # 从上一页最后一行的位置直接定位，不管翻到第几页都只读limit + 1行
+            rows = conn.execute(
+                f"SELECT {self.LIST_COLUMNS} FROM users "
+                "WHERE (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (created_at, last_id, limit + 1)
+            ).fetchall()
+        return _page(rows, limit)
+    
+    def iter_users(self, batch_size=1000):
+        """按id顺序流式遍历所有用户，每次只取batch_size行到内存"""
+        cur = self.pool.connection().execute(f"SELECT {self.LIST_COLUMNS} FROM users ORDER BY id")
+        cur.arraysize = batch_size
+        try:
+            while True:
+                rows = cur.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+class PagedBlogDatabase(PooledBlogDatabase):
+    """在PooledBlogDatabase上增加文章的键集分页和流式遍历"""
+    
+    SUMMARY_COLUMNS = "id, title, author_id, created_at"
+    FULL_COLUMNS = "id, title, content, author_id, created_at, updated_at"
+    
+    def _create_tables(self):
+        super()._create_tables()
+        with self.pool.transaction() as conn:
+            # 覆盖不含正文的列表页：created_at、id、author_id、title都在索引中
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_posts_listing ON posts(created_at, id, author_id, title)")
+    
+    def get_posts_page(self, limit=10, cursor=None, with_content=False):
+        """按创建时间倒序分页，返回(行列表, 下一页的游标)
+        
+        with_content=False时只读覆盖索引；需要正文时，只对这一页的行回表读取
+        """
+        columns = self.FULL_COLUMNS if with_content else self.SUMMARY_COLUMNS
+        if cursor is None:
+            where, params = "", (limit + 1,)
+        else:
+            created_at, last_id = decode_cursor(cursor)
+            where, params = "WHERE (created_at, id) < (?, ?)", (created_at, last_id, limit + 1)
+        # 先在子查询中按索引取出一页文章，再关联作者；
+        # 直接写JOIN时，用户很少的情况下查询规划器可能会选择先遍历users再排序
+        rows = self.pool.connection().execute(f'''
+            SELECT p.*, u.username as author_name
+            FROM (SELECT {columns} FROM posts {where}
+                  ORDER BY created_at DESC, id DESC LIMIT ?) p
+            JOIN users u ON p.author_id = u.id
+            ORDER BY p.created_at DESC, p.id DESC
+            ''', params).fetchall()
+        return _page(rows, limit)
+    
+    def iter_posts(self, batch_size=1000, with_content=False):
+        """按id顺序流式遍历所有文章，每次只取batch_size行到内存"""
+        columns = self.FULL_COLUMNS if with_content else self.SUMMARY_COLUMNS
+        cur = self.pool.connection().execute(f"SELECT {columns} FROM posts ORDER BY id")
+        cur.arraysize = batch_size
+        try:
+            while True:
+                rows = cur.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+```
+
+测试与基准（`get_posts`即示例3中的`LIMIT/OFFSET`分页，在同一个数据库上执行，也能用到新建的索引）：
+
+```python
+import os
+import resource
+import time
+
+def _remove_db(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def _explain(conn, sql, params):
+    return ' | '.join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+def test_keyset_pagination():
+    _remove_db('paged.db')
+    pool = ConnectionPool('paged.db')
+    blog = PagedBlogDatabase(pool)
+    users = PagedUserManager(pool)
+    users.add_users([(f"user{i}", 'pw', f"user{i}@example.com") for i in range(25)])
+    with blog.batch() as conn:
+        # 很多行的created_at相同，翻页靠id区分
+        conn.executemany(
+            "INSERT INTO posts (title, content, author_id, created_at) VALUES (?, ?, ?, ?)",
+            [(f"文章{i}", "正文", 1 + i % 25, f"2024-01-01 00:00:{i // 7:02d}") for i in range(103)]
+        )
+    expected = [row['id'] for row in blog.pool.connection().execute(
+        "SELECT id FROM posts ORDER BY created_at DESC, id DESC")]
+    seen, cursor = [], None
+    while True:
+        rows, cursor = blog.get_posts_page(limit=10, cursor=cursor)
+        seen.extend(row['id'] for row in rows)
+        if cursor is None:
+            break
+    assert seen == expected
+    rows, _ = blog.get_posts_page(limit=3, with_content=True)
+    assert rows[0]['content'] == "正文" and rows[0]['author_name'].startswith("user")
+    assert [row['id'] for row in blog.iter_posts(batch_size=7)] == sorted(expected)
+    
+    pages, cursor = [], None
+    while True:
+        rows, cursor = users.list_users_page(limit=4, cursor=cursor)
+        pages.append(len(rows))
+        if cursor is None:
+            break
+    assert sum(pages) == 25 and pages[-1] == 1
+    assert len(list(users.iter_users(batch_size=4))) == 25
+    try:
+        users.list_users_page(cursor="不是游标")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("无效的游标应该抛出ValueError")
+    
+    # 翻页查询只使用覆盖索引
+    conn = pool.connection()
+    plan = _explain(conn, "SELECT id, username, email, created_at FROM users "
+                          "WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+                    ('2030-01-01', 0, 10))
+    assert 'COVERING INDEX idx_users_listing' in plan and 'TEMP B-TREE' not in plan, plan
+    pool.close_all()
+    _remove_db('paged.db')
+    print("测试通过")
+
+def _build_posts(pool, n_rows):
+    conn = pool.connection()
+    conn.execute("INSERT INTO users (username, email, password) "
+                 "SELECT 'user' || x, 'user' || x || '@example.com', 'pw' FROM "
+                 "(WITH RECURSIVE s(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM s WHERE x < 100) SELECT x FROM s)")
+    # 每秒10篇文章；先插入数据再建索引比边插入边维护索引快
+    conn.execute("DROP INDEX idx_posts_listing")
+    conn.execute("DROP INDEX idx_posts_author")
+    conn.execute("BEGIN")
+    conn.execute('''
+        WITH RECURSIVE s(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM s WHERE x < ?)
+        INSERT INTO posts (title, content, author_id, created_at)
+        SELECT '文章' || x, '正文', 1 + x % 100, datetime(1700000000 + x / 10, 'unixepoch') FROM s
+        ''', (n_rows,))
+    conn.execute("COMMIT")
+    conn.execute("CREATE INDEX idx_posts_listing ON posts(created_at, id, author_id, title)")
+    conn.execute("CREATE INDEX idx_posts_author ON posts(author_id)")
+    conn.execute("ANALYZE")
+
+def benchmark_pagination(n_rows=10_000_000, depths=(0, 1_000, 100_000, 1_000_000, 9_999_000), repeat=5):
+    """比较不同页深度下OFFSET分页与键集分页的耗时"""
+    _remove_db('paged_bench.db')
+    pool = ConnectionPool('paged_bench.db')
+    blog = PagedBlogDatabase(pool)
+    start = time.perf_counter()
+    _build_posts(pool, n_rows)
+    print(f"建表: {n_rows:,}行，{time.perf_counter() - start:.0f}秒")
+    conn = pool.connection()
+    
+    def timed(func):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+    
+    for depth in depths:
+        if depth:
+            # 游标取自该页之前的最后一行，相当于从第一页一路翻到这里
+            row = conn.execute("SELECT created_at, id FROM posts ORDER BY created_at DESC, id DESC "
+                               "LIMIT 1 OFFSET ?", (depth - 1,)).fetchone()
+            cursor = encode_cursor([row['created_at'], row['id']])
+        else:
+            cursor = None
+        offset_ms = timed(lambda: blog.get_posts(limit=20, offset=depth))
+        keyset_ms = timed(lambda: blog.get_posts_page(limit=20, cursor=cursor))
+        full_ms = timed(lambda: blog.get_posts_page(limit=20, cursor=cursor, with_content=True))
+        assert [r['id'] for r in blog.get_posts(limit=20, offset=depth)] == \
+            [r['id'] for r in blog.get_posts_page(limit=20, cursor=cursor)[0]]
+        print(f"第{depth:>10,}行起: get_posts(OFFSET) {offset_ms:9.2f} 毫秒, "
+              f"get_posts_page {keyset_ms:.3f} 毫秒, 含正文 {full_ms:.3f} 毫秒")
+    
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    count = sum(1 for _ in blog.iter_posts(batch_size=1000))
+    elapsed = time.perf_counter() - start
+    peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"iter_posts遍历{count:,}行: {elapsed:.1f}秒，{count / elapsed:,.0f} 行/秒，"
+          f"峰值内存增加 {(peak_after - peak_before) / 1024:.1f} MB")
+    pool.close_all()
+    _remove_db('paged_bench.db')
+
+# 运行示例
+test_keyset_pagination()
+benchmark_pagination()
+```
+
+参考结果（Linux，Python 3.11，SQLite 3.40，单核，ext4；1000万篇文章，每页20篇，取5次中最快的一次）：
+
+| 起始位置 | get_posts（OFFSET） | get_posts_page | get_posts_page（含正文） |
+|----------|---------------------|----------------|--------------------------|
+| 第1页 | 约 0.08 毫秒 | 约 0.08 毫秒 | 约 0.11 毫秒 |
+| 第1,000行 | 约 0.3 毫秒 | 约 0.1 毫秒 | 约 0.13 毫秒 |
+| 第100,000行 | 约 23 毫秒 | 约 0.1 毫秒 | 约 0.13 毫秒 |
+| 第1,000,000行 | 约 186 毫秒 | 约 0.06 毫秒 | 约 0.08 毫秒 |
+| 第9,999,000行 | 约 1984 毫秒 | 约 0.13 毫秒 | 约 0.17 毫秒 |
+
+`iter_posts`遍历1000万行约21秒（约47万行/秒），峰值内存只增加了约0.4 MB。
+
+几点说明：
+
+- 键集分页只能一页一页往后翻（倒过来查询也可以往前翻），不能直接跳到第n页；需要页码的界面可以只对前几页用OFFSET
+- 游标依赖排序方式：换一种排序就要换一组索引列和游标内容，不同排序方式的游标不能混用
+- 翻页期间插入或删除的行不会让后面的页重复或漏掉行，这一点OFFSET做不到
+- `iter_posts`在遍历期间一直持有一个读事务；WAL模式下不会阻塞写入，但检查点无法回收这段时间写入的WAL，遍历很长时WAL文件会变大。需要在遍历中途释放读事务时，可以改用`get_posts_page`一页一页地读取
+
 ## 最佳实践
 
 1. **使用参数化查询**：始终使用参数化查询，避免SQL注入攻击
@@ -1351,6 +1351,561 @@ if __name__ == "__main__":
     use_api_client()
 ```
 
+#### 7.2.1 长连接的API客户端
+
+上面的`SimpleAPIClient`每次请求都调用`_get_connection`创建新的`HTTPConnection`，用完立即关闭。批处理任务频繁调用内部API时，大部分时间花在TCP握手（HTTPS还要加上TLS握手）上，而不是请求本身。此外：
+
+- `_parse_response`用`response.read()`把整个响应体读入内存，几十MB的导出接口会占用同样大小的内存，而且解析JSON前必须等响应全部到达
+- 没有声明`Accept-Encoding`，服务器只能返回未压缩的数据；即使服务器返回了gzip，也不会解压
+- 连接关闭后没有重连逻辑，不能直接改成长连接：服务器关闭空闲连接后，下一个请求会失败
+
+下面的`KeepAliveAPIClient`保持与`SimpleAPIClient`相同的接口，并做了以下改进：
+
+- **按主机的连接池**：每个主机一个`ConnectionPool`，读完响应体的连接放回池中，下一次请求直接复用；池有上限，可以在多个线程之间共享
+- **失效连接重连**：复用的连接可能已经被服务器关闭，此时换一个新连接重试一次。幂等请求总是可以重试；POST只在请求还没有发送成功时重试，避免重复提交
+- **流式解压**：发送`Accept-Encoding: gzip, deflate`，用`zlib.decompressobj`逐块解压，每次最多产出chunk_size字节，压缩炸弹也不会一次性占满内存
+- **流式读取**：`stream()`返回`StreamingResponse`，提供`iter_bytes`、`iter_lines`和`iter_json`；`iter_json`同时支持每行一个对象（NDJSON）和顶层数组，边接收边产出对象
+- **可选的请求流水线**：`get_many(..., pipeline=True)`在同一个连接上连续发送多个GET后再依次读取响应，省掉每个请求的往返等待；服务器中途关闭连接时，没有拿到响应的请求会在新连接上重发；混合多个主机的URL时按主机分组，各自在对应主机的连接上发送
+
+```python
+import codecs
+import http.client
+import json
+import re
+import threading
+import urllib.parse
+import zlib
+from collections import deque
+from contextlib import contextmanager
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+# 复用的连接已被服务器关闭时，会出现这些异常（RemoteDisconnected是ConnectionResetError的子类）
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine)
+
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_ARRAY_SEPARATOR = re.compile(r'[ \t\r\n,]*')
+
+class ConnectionPool:
+    """一个主机的空闲连接池"""
+    
+    def __init__(self, host, secure=False, timeout=None, maxsize=10):
+        self.host = host
+        self.conn_class = http.client.HTTPSConnection if secure else http.client.HTTPConnection
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.created = 0
+        self.reused = 0
+        self._idle = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """返回(连接, 是否为复用的连接)"""
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                # 后进先出：最近用过的连接最不可能已经被服务器超时关闭
+                return self._idle.pop(), True
+            self.created += 1
+        return self.conn_class(self.host, timeout=self.timeout), False
+    
+    def release(self, conn, reusable=True):
+        """归还连接；响应声明了Connection: close时http.client已经关闭了socket"""
+        if reusable and conn.sock is not None:
+            with self._lock:
+                if len(self._idle) < self.maxsize:
+                    self._idle.append(conn)
+                    return
+        conn.close()
+    
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+def iter_decoded(response, chunk_size=65536):
+    """逐块读取响应体，按Content-Encoding解压"""
+    encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+    decoder = None
+    while True:
+        chunk = response.read1(chunk_size)
+        if not chunk:
+            response.close()            # 读到Content-Length时read1不会自动关闭响应，连接也就无法复用
+            break
+        if encoding not in ('gzip', 'x-gzip', 'deflate'):
+            yield chunk
+            continue
+        if decoder is None:
+            if encoding == 'deflate' and (chunk[0] & 0x0F != 8 or int.from_bytes(chunk[:2], 'big') % 31):
+                decoder = zlib.decompressobj(-zlib.MAX_WBITS)   # 有的服务器发送不带zlib头的裸deflate
+            else:
+                decoder = zlib.decompressobj(zlib.MAX_WBITS | 32)  # 自动识别gzip和zlib头
+        data = decoder.decompress(chunk, chunk_size)
+        while data:
+            yield data
+            data = decoder.decompress(decoder.unconsumed_tail, chunk_size)
+    if decoder is not None:
+        tail = decoder.flush()
+        if tail:
+            yield tail
+
+class StreamingResponse:
+    """流式响应，由KeepAliveAPIClient.stream()创建"""
+    
+    def __init__(self, response):
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = dict(response.getheaders())
+        self.consumed = False
+        self._response = response
+    
+    def iter_bytes(self, chunk_size=65536):
+        """产出解压后的数据块"""
+        yield from iter_decoded(self._response, chunk_size)
+        self.consumed = True
+    
+    def iter_lines(self, chunk_size=65536):
+        """按行产出bytes（不含换行符）"""
+        pending = b''
+        for chunk in self.iter_bytes(chunk_size):
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r')
+        if pending:
+            yield pending
+    
+    def iter_json(self, chunk_size=65536):
+        """逐个产出JSON对象，支持NDJSON和顶层数组两种格式"""
+        raw_decode = json.JSONDecoder().raw_decode
+        text = codecs.getincrementaldecoder('utf-8')()
+        skip = _WHITESPACE.match
+        buffer = ''
+        in_array = None
+        for chunk in self.iter_bytes(chunk_size):
+            buffer += text.decode(chunk)
+            pos = 0
+            while True:
+                pos = skip(buffer, pos).end()
+                if pos == len(buffer):
+                    break
+                if in_array is None:
+                    in_array = buffer[pos] == '['
+                    if in_array:
+                        skip = _ARRAY_SEPARATOR.match
+                        pos += 1
+                        continue
+                if in_array and buffer[pos] == ']':
+                    pos += 1
+                    continue
+                try:
+                    obj, end = raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break               # 对象还不完整，等待下一块数据
+                if end == len(buffer) and isinstance(obj, (int, float)):
+                    break               # 位于末尾的数字可能还没有接收完
+                yield obj
+                pos = end
+            buffer = buffer[pos:]
+        rest = buffer.strip()
+        if in_array:
+            rest = rest.rstrip(']').strip()
+        if rest:
+            yield json.loads(rest)
+    
+    def json(self):
+        return json.loads(self.read())
+    
+    def read(self):
+        return b''.join(self.iter_bytes())
+
+class _DecodedResponse:
+    """把解压后的响应体交给SimpleAPIClient._parse_response处理"""
+    
+    def __init__(self, response):
+        self.status = response.status
+        self.reason = response.reason
+        self.getheader = response.getheader
+        self.getheaders = response.getheaders
+        self._response = response
+    
+    def read(self):
+        return b''.join(iter_decoded(self._response))
+
+class _SharedReader:
+    """流水线的多个响应在同一个缓冲区中首尾相连，让多个HTTPResponse依次读取它"""
+    
+    def __init__(self, sock):
+        self._file = sock.makefile('rb')
+    
+    def makefile(self, mode, *args, **kwargs):
+        return self
+    
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+    
+    def close(self):
+        pass                            # HTTPResponse读完后会关闭fp，这里要留给下一个响应
+
+class KeepAliveAPIClient(SimpleAPIClient):
+    """复用连接的API客户端，接口与SimpleAPIClient相同"""
+    
+    def __init__(self, base_url, secure=False, timeout=None, pool_size=10):
+        super().__init__(base_url, secure, timeout)
+        self.pool_size = pool_size
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+    
+    def _route(self, endpoint):
+        """返回(连接池, 请求路径)；endpoint可以是完整URL"""
+        if endpoint.startswith(('http://', 'https://')):
+            parts = urllib.parse.urlsplit(endpoint)
+            key = (parts.scheme == 'https', parts.netloc)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+        else:
+            key = (self.secure, self.base_url)
+            path = endpoint
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = self._pools[key] = ConnectionPool(key[1], key[0], self.timeout, self.pool_size)
+        return pool, path
+    
+    def _send(self, method, endpoint, body=None, headers=None):
+        """发送请求，返回(响应, 连接, 连接池)；调用者负责读完响应后归还连接"""
+        pool, path = self._route(endpoint)
+        headers = self._prepare_headers(headers)
+        while True:
+            conn, reused = pool.acquire()
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                return conn.getresponse(), conn, pool
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                # 只在复用的连接上重试；非幂等请求已经发出去时，服务器可能已经处理过
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+    
+    def _request(self, method, endpoint, body=None, headers=None):
+        response, conn, pool = self._send(method, endpoint, body, headers)
+        try:
+            result = self._parse_response(_DecodedResponse(response))
+        except BaseException:
+            conn.close()
+            raise
+        pool.release(conn)
+        return result
+    
+    @staticmethod
+    def _with_params(endpoint, params):
+        if params:
+            return f"{endpoint}?{urllib.parse.urlencode(params)}"
+        return endpoint
+    
+    @staticmethod
+    def _encode_body(data, json_data, headers):
+        """与SimpleAPIClient相同的请求体规则，统一编码为UTF-8字节"""
+        headers = dict(headers or {})
+        body = None
+        if json_data is not None:
+            body = json.dumps(json_data)
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            if isinstance(data, dict):
+                body = urllib.parse.urlencode(data)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            else:
+                body = str(data)
+        return (body.encode('utf-8') if body is not None else None), headers
+    
+    def get(self, endpoint, params=None, headers=None):
+        return self._request('GET', self._with_params(endpoint, params), headers=headers)
+    
+    def post(self, endpoint, data=None, json_data=None, headers=None):
+        body, headers = self._encode_body(data, json_data, headers)
+        return self._request('POST', endpoint, body, headers)
+    
+    def put(self, endpoint, data=None, json_data=None, headers=None):
+        body, headers = self._encode_body(data, json_data, headers)
+        return self._request('PUT', endpoint, body, headers)
+    
+    def delete(self, endpoint, headers=None):
+        return self._request('DELETE', endpoint, headers=headers)
+    
+    @contextmanager
+    def stream(self, endpoint, params=None, headers=None):
+        """流式GET：with client.stream('/export') as r: for item in r.iter_json(): ..."""
+        response, conn, pool = self._send('GET', self._with_params(endpoint, params), headers=headers)
+        streaming = StreamingResponse(response)
+        try:
+            yield streaming
+        finally:
+            # 响应体没有读完的连接上还有残留数据，不能复用
+            pool.release(conn, reusable=streaming.consumed)
+    
+    def get_many(self, endpoints, pipeline=False, depth=16):
+        """批量GET；pipeline=True时每批在一个连接上连续发送depth个请求
+        
+        endpoints可以混合多个主机的完整URL：按主机分组，每组在自己的连接池上流水线发送，结果按原顺序返回。
+        """
+        if not pipeline:
+            return [self.get(endpoint) for endpoint in endpoints]
+        groups = {}
+        for index, endpoint in enumerate(endpoints):
+            pool, path = self._route(endpoint)
+            groups.setdefault(pool, []).append((index, path))
+        results = [None] * len(endpoints)
+        for pool, pending in groups.items():
+            while pending:
+                batch = pending[:depth]
+                done = self._pipeline(pool, [path for _, path in batch])
+                for (index, _), result in zip(batch, done):
+                    results[index] = result
+                # 服务器可能在中途关闭连接，没有拿到响应的请求留到下一批
+                pending = pending[len(done):]
+        return results
+    
+    def _pipeline(self, pool, paths):
+        """在pool的一个连接上连续发送paths中的GET请求，返回已收到的响应"""
+        headers = self._prepare_headers()
+        head = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        requests = ''.join(f"GET {path} HTTP/1.1\r\nHost: {pool.host}\r\n{head}\r\n"
+                           for path in paths).encode('latin-1')
+        while True:
+            conn, reused = pool.acquire()
+            results = []
+            response = None
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.sendall(requests)
+                reader = _SharedReader(conn.sock)
+                for _ in paths:
+                    response = http.client.HTTPResponse(reader, method='GET')
+                    response.begin()
+                    results.append(self._parse_response(_DecodedResponse(response)))
+                    if response.will_close:
+                        break
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused and not results:
+                    raise
+                if not results:
+                    continue            # 复用的连接已失效，换新连接重发整批
+                return results
+            except BaseException:
+                conn.close()
+                raise
+            pool.release(conn, reusable=not response.will_close)
+            return results
+    
+    def close(self):
+        for pool in list(self._pools.values()):
+            pool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+```
+
+下面的测试在本地启动一个HTTP/1.1服务器。服务器在每个连接上处理50个请求后直接关闭连接，不发送`Connection: close`，模拟空闲超时，用来验证客户端的重连：
+
+```python
+import gzip
+import multiprocessing
+import time
+import tracemalloc
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+RECORDS = [{'id': i, 'name': f'user_{i}', 'email': f'user_{i}@example.com', 'score': i * 0.5}
+           for i in range(200_000)]
+BIG_JSON = json.dumps(RECORDS).encode()
+BIG_GZIP = gzip.compress(BIG_JSON, 6)
+
+class APITestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    requests_per_connection = 50
+    
+    def setup(self):
+        super().setup()
+        self.served = 0
+    
+    def do_GET(self):
+        self.served += 1
+        if self.path.startswith('/items/'):
+            body = json.dumps({'id': int(self.path.rsplit('/', 1)[1]), 'status': 'ok',
+                               'port': self.server.server_address[1]}).encode()
+            self._send(body)
+        elif self.path == '/export':
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self._send(BIG_GZIP, {'Content-Encoding': 'gzip'})
+            else:
+                self._send(BIG_JSON)
+        elif self.path == '/events':
+            self._send_ndjson(int(self.headers.get('X-Count', 1000)))
+        else:
+            self.send_error(404)
+        if self.served >= self.requests_per_connection:
+            self.close_connection = True    # 不通知客户端，直接关闭连接
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._send(json.dumps({'received': json.loads(body)}).encode())
+    
+    def _send(self, body, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_ndjson(self, count):
+        """分块传输、边生成边压缩的NDJSON"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for start in range(0, count, 500):
+            lines = ''.join(json.dumps({'seq': i}) + '\n' for i in range(start, min(start + 500, count)))
+            self._write_chunk(compressor.compress(lines.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._write_chunk(compressor.flush())
+        self.wfile.write(b'0\r\n\r\n')
+    
+    def _write_chunk(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+    
+    def log_message(self, format, *args):
+        pass
+
+class APITestServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def start_api_server(separate_process=False):
+    """启动测试服务器，返回(停止函数, 主机)；测量吞吐时放到单独的进程中，避免与客户端争抢GIL"""
+    server = APITestServer(('127.0.0.1', 0), APITestHandler)
+    host = f"127.0.0.1:{server.server_address[1]}"
+    if separate_process:
+        process = multiprocessing.get_context('fork').Process(target=server.serve_forever, daemon=True)
+        process.start()
+        server.socket.close()
+        return process.terminate, host
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, host
+
+def test_keep_alive_client():
+    stop, host = start_api_server()
+    with KeepAliveAPIClient(host) as client:
+        # 120个请求跨越了服务器的两次断开，客户端应该透明地重连
+        for i in range(120):
+            assert client.get(f'/items/{i}')['data']['id'] == i
+        pool = client._pools[(False, host)]
+        print(f"120个请求: 新建连接 {pool.created} 个, 复用 {pool.reused} 次")
+        
+        assert client.post('/items', json_data={'名称': '测试'})['data'] == {'received': {'名称': '测试'}}
+        
+        # 流水线：跨越服务器断开的请求会在新连接上重发，结果的顺序与请求一致
+        results = client.get_many([f'/items/{i}' for i in range(200)], pipeline=True)
+        assert [r['data']['id'] for r in results] == list(range(200))
+        
+        # 混合两个主机的流水线批次：每个请求都发到自己的主机
+        stop_other, other_host = start_api_server()
+        endpoints = [f'http://{other_host}/items/{i}' if i % 3 == 0 else f'/items/{i}' for i in range(60)]
+        results = client.get_many(endpoints, pipeline=True)
+        assert [r['data']['id'] for r in results] == list(range(60))
+        assert all(r['data']['port'] == int((other_host if i % 3 == 0 else host).rsplit(':', 1)[1])
+                   for i, r in enumerate(results))
+        stop_other()
+        
+        with client.stream('/events', headers={'X-Count': '10000'}) as response:
+            seqs = [item['seq'] for item in response.iter_json()]
+        assert seqs == list(range(10000))
+        
+        with client.stream('/export') as response:
+            assert response.headers['Content-Encoding'] == 'gzip'
+            count = sum(1 for _ in response.iter_json())
+        assert count == len(RECORDS)
+        print("所有测试通过")
+    stop()
+
+def benchmark_api_clients(n=2000):
+    stop, host = start_api_server(separate_process=True)
+    paths = [f'/items/{i}' for i in range(n)]
+    
+    simple = SimpleAPIClient(host)
+    start = time.perf_counter()
+    for path in paths:
+        simple.get(path)
+    print(f"SimpleAPIClient          : {n / (time.perf_counter() - start):6.0f} 请求/秒")
+    
+    with KeepAliveAPIClient(host) as client:
+        start = time.perf_counter()
+        for path in paths:
+            client.get(path)
+        print(f"KeepAliveAPIClient       : {n / (time.perf_counter() - start):6.0f} 请求/秒")
+        start = time.perf_counter()
+        client.get_many(paths, pipeline=True)
+        print(f"KeepAliveAPIClient流水线  : {n / (time.perf_counter() - start):6.0f} 请求/秒")
+    
+    # 导出接口：20万条记录，约13MB的JSON
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = len(simple.get('/export')['data'])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"\nSimpleAPIClient.get      : {count} 条, {elapsed:.2f} 秒, 峰值内存 {peak / 2**20:.1f} MB")
+    
+    with KeepAliveAPIClient(host) as client:
+        tracemalloc.start()
+        start = time.perf_counter()
+        with client.stream('/export') as response:
+            count = sum(1 for _ in response.iter_json())
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"stream().iter_json()     : {count} 条, {elapsed:.2f} 秒, 峰值内存 {peak / 2**20:.1f} MB")
+    stop()
+
+if __name__ == "__main__":
+    test_keep_alive_client()
+    benchmark_api_clients()
+```
+
+参考结果（Linux，Python 3.11，单核，本机回环，服务器在单独的进程中）：
+
+| 场景 | SimpleAPIClient | KeepAliveAPIClient |
+|------|-----------------|--------------------|
+| 2000个小GET请求，逐个发送 | 约 1200-1600 请求/秒 | 约 2900-3400 请求/秒 |
+| 2000个小GET请求，流水线（depth=16） | - | 约 3100-4000 请求/秒 |
+| 导出20万条记录（约13MB JSON） | 2.5-3.0 秒，峰值内存 106 MB | 3.9-4.7 秒，峰值内存 0.4 MB |
+
+几点说明：
+
+- 连接复用让小请求的吞吐提高了一倍多，这还只是本机回环上的TCP握手；跨机房或使用HTTPS时，每次握手要多花一个到几个往返时间，差距会更大。
+- 本机回环的往返时间只有几十微秒，而客户端和服务器共用一个CPU，所以流水线的收益不明显。流水线省掉的是每个请求的往返等待：往返时间为1ms时，逐个发送最多约1000请求/秒，流水线则可以在一个往返内完成depth个请求。流水线要求服务器按顺序处理请求，只适合幂等的GET。
+- 流式解析比`json.loads`一次解析整个响应慢（逐个对象调用`raw_decode`，还要解压gzip），但内存占用与响应大小无关，而且第一条记录到达后就可以开始处理。
+
 ## 8. 安全考虑
 
 ### 8.1 安全最佳实践
@@ -1557,6 +2112,589 @@ if __name__ == "__main__":
     run_threaded_server()
 ```
 
+#### 9.2.1 静态文件服务：热点缓存、预压缩与有界线程池
+
+上面的示例在静态文件场景下有几个问题：
+
+- `OptimizedHandler`发送了`Connection: keep-alive`，但`protocol_version`仍是默认的`HTTP/1.0`，服务器在每个响应之后都会关闭连接；gzip部分只是注释掉的占位代码
+- `ThreadingMixIn`为每个连接创建一个线程，`max_threads = 100`并没有被任何代码使用，连接数暴涨时线程数也跟着暴涨；`request_queue_size`是默认的5，并发连接稍多就会丢弃SYN，客户端要等1秒后重传
+- `SimpleHTTPRequestHandler`每个请求都要`open`、`fstat`并用`shutil.copyfileobj`在用户态复制文件，不支持`Range`，也不发送`ETag`
+
+下面的`StaticFileHandler`和`PooledHTTPServer`解决了这些问题：
+
+- **热点文件LRU缓存**：`StaticFileCache`缓存小文件的内容，以及预先计算好的`ETag`、`Last-Modified`和`Content-Type`。每个请求只做一次`os.stat`，文件的`mtime`或大小变化时自动失效；按总字节数淘汰最久未用的文件
+- **预压缩**：客户端接受gzip时，优先使用同目录下较新的`.gz`文件；没有`.gz`文件时对文本类型即时压缩，压缩结果和原始内容一起缓存，每个文件只压缩一次
+- **条件请求与Range**：支持`If-None-Match`/`If-Modified-Since`（返回304）、单个字节范围的`Range`请求（返回206或416）和`If-Range`
+- **sendfile**：不在缓存中的大文件用`socket.sendfile`（即`os.sendfile`）发送，数据不经过用户态
+- **有界线程池**：`PooledHTTPServer`用固定大小的`ThreadPoolExecutor`处理请求。工作线程处理完一个请求后不会阻塞等待同一连接的下一个请求，而是把空闲的长连接交给一个`selectors`线程“停放”，连接上有新数据时再提交给线程池，因此少量线程就能服务大量长连接；停放超过keep_alive_timeout的连接会被关闭
+
+```python
+import email.utils
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from socketserver import StreamRequestHandler
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+
+class CachedFile:
+    """一个文件的元数据，以及（文件较小时）它的内容和gzip版本"""
+    __slots__ = ('path', 'mtime_ns', 'size', 'etag', 'last_modified', 'content_type',
+                 'compressible', 'body', 'gzip_body', 'gzip_path', 'gzip_size')
+    
+    def __init__(self, path, st, content_type):
+        self.path = path
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        self.last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        self.content_type = content_type
+        self.compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+        self.body = None
+        self.gzip_body = None
+        self.gzip_path = None
+        self.gzip_size = None
+    
+    @property
+    def gzip_etag(self):
+        return self.etag[:-1] + '-gzip"'
+    
+    @property
+    def cached_bytes(self):
+        return len(self.body or b'') + len(self.gzip_body or b'')
+
+class StaticFileCache:
+    """热点文件的LRU缓存，按缓存内容的总字节数淘汰"""
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_file_size=1024 * 1024, compress_min_size=1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.compress_min_size = compress_min_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, path, content_type):
+        """返回最新的CachedFile；文件不存在时抛出OSError"""
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        # 在锁外读文件和压缩，避免一个慢的磁盘读取阻塞所有请求
+        entry = CachedFile(path, st, content_type)
+        if st.st_size <= self.max_file_size:
+            with open(path, 'rb') as f:
+                entry.body = f.read()
+        self._attach_gzip(entry, st)
+        self._put(entry)
+        return entry
+    
+    def _attach_gzip(self, entry, st):
+        """优先使用不旧于原文件的.gz文件，否则对可压缩的小文件即时压缩"""
+        try:
+            gz_st = os.stat(entry.path + '.gz')
+        except OSError:
+            gz_st = None
+        if gz_st is not None and gz_st.st_mtime_ns >= st.st_mtime_ns:
+            entry.gzip_path = entry.path + '.gz'
+            entry.gzip_size = gz_st.st_size
+            if gz_st.st_size <= self.max_file_size:
+                with open(entry.gzip_path, 'rb') as f:
+                    entry.gzip_body = f.read()
+        elif entry.compressible and entry.body is not None and entry.size >= self.compress_min_size:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            gzip_body = compressor.compress(entry.body) + compressor.flush()
+            if len(gzip_body) < entry.size:
+                entry.gzip_body = gzip_body
+                entry.gzip_size = len(gzip_body)
+    
+    def _put(self, entry):
+        with self._lock:
+            old = self._entries.pop(entry.path, None)
+            if old is not None:
+                self._bytes -= old.cached_bytes
+            self._entries[entry.path] = entry
+            self._bytes += entry.cached_bytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.cached_bytes
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+def parse_range(header, size):
+    """解析单个字节范围，返回(start, end)，end不含在内
+    
+    不支持的格式（包括多个范围）返回None，按RFC 9110应当忽略Range返回完整内容；
+    范围无法满足时抛出ValueError，对应416响应
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, min(end, size)
+
+class StaticFileHandler(OptimizedHandler):
+    """使用StaticFileCache的静态文件处理器，配合PooledHTTPServer使用"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True      # 响应头和响应体分两次写入，避免Nagle算法带来的延迟
+    timeout = 30                        # 读取一个请求的最长时间
+    cache = StaticFileCache()
+    
+    def handle(self):
+        # 只处理一个请求，同一连接上的后续请求由PooledHTTPServer重新调度
+        self.handle_one_request()
+    
+    def finish(self):
+        # 连接可能还要复用，rfile中可能有已经读入缓冲区的下一个请求，不能关闭
+        if not self.wfile.closed:
+            self.wfile.flush()
+    
+    def do_GET(self):
+        content_length = self.headers.get('Content-Length')
+        if content_length and int(content_length) > 1048576:
+            self.send_error(413, "Request Entity Too Large")
+            return
+        self.serve_static(head=False)
+    
+    def do_HEAD(self):
+        self.serve_static(head=True)
+    
+    def serve_static(self, head):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not self.path.split('?', 1)[0].endswith('/') or not os.path.isfile(index):
+                # 重定向和目录列表交给SimpleHTTPRequestHandler处理
+                return super().do_HEAD() if head else SimpleHTTPRequestHandler.do_GET(self)
+            path = index
+        if path.endswith('/'):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        try:
+            entry = self.cache.get(path, self.guess_type(path))
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        
+        range_header = self.headers.get('Range')
+        use_gzip = (entry.gzip_size is not None and range_header is None
+                    and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        etag = entry.gzip_etag if use_gzip else entry.etag
+        if self._not_modified(entry):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        status, start, end = HTTPStatus.OK, 0, entry.gzip_size if use_gzip else entry.size
+        if range_header and self._range_applies(entry):
+            try:
+                byte_range = parse_range(range_header, entry.size)
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{entry.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is not None:
+                status, (start, end) = HTTPStatus.PARTIAL_CONTENT, byte_range
+        
+        self.send_response(status)
+        self.send_header('Content-Type', entry.content_type)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+        if entry.compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{entry.size}')
+        self.end_headers()
+        if head:
+            return
+        
+        body = entry.gzip_body if use_gzip else entry.body
+        if body is not None:
+            self.wfile.write(memoryview(body)[start:end])
+        else:
+            with open(entry.gzip_path if use_gzip else entry.path, 'rb') as f:
+                self.connection.sendfile(f, start, end - start)
+    
+    def _not_modified(self, entry):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or entry.etag in tags or entry.gzip_etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return entry.mtime_ns // 1_000_000_000 <= since
+        return False
+    
+    def _range_applies(self, entry):
+        """If-Range与当前版本不一致时忽略Range，返回完整的新内容"""
+        if_range = self.headers.get('If-Range')
+        return if_range is None or if_range in (entry.etag, entry.last_modified)
+
+class PooledHTTPServer(HTTPServer):
+    """固定大小线程池的HTTP服务器，空闲的长连接由selectors线程停放"""
+    max_threads = 16
+    keep_alive_timeout = 15
+    max_requests_in_a_row = 16          # 一个连接连续占用工作线程处理的最大请求数
+    request_queue_size = 1024
+    
+    def __init__(self, server_address, handler_class, max_threads=None):
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(max_threads or self.max_threads,
+                                            thread_name_prefix='http-worker')
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._to_park = queue.SimpleQueue()
+        self._parked = {}               # handler -> 停放的时间
+        self._closing = False
+        threading.Thread(target=self._watch_parked, name='http-idle', daemon=True).start()
+    
+    def process_request(self, request, client_address):
+        self._executor.submit(self._serve, request, client_address)
+    
+    def _serve(self, request, client_address):
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._after_request(handler)
+    
+    def _resume(self, handler):
+        try:
+            handler.handle_one_request()
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.connection, handler.client_address)
+        self._after_request(handler)
+    
+    def _after_request(self, handler):
+        # 下一个请求已经到达时直接处理，省掉一次停放和唤醒
+        pending = False
+        try:
+            for _ in range(self.max_requests_in_a_row):
+                if handler.close_connection or not self._has_pending_request(handler):
+                    break
+                handler.handle_one_request()
+            else:
+                pending = not handler.close_connection and self._has_pending_request(handler)
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.connection, handler.client_address)
+        if handler.close_connection or self._closing:
+            self._close(handler)
+        elif pending:
+            # 达到连续处理的上限时，流水线中的后续请求可能已经全部读进了rfile的缓冲区，
+            # socket不会再变为可读，停放到selector上就永远不会被唤醒；
+            # 重新排到线程池队列末尾，先让其他连接得到处理
+            self._executor.submit(self._resume, handler)
+        else:
+            self._to_park.put(handler)
+            self._wakeup_send.send(b'\0')
+    
+    @staticmethod
+    def _has_pending_request(handler):
+        """非阻塞地检查rfile缓冲区或socket中是否已经有数据"""
+        handler.connection.setblocking(False)
+        try:
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return True                 # 让handle_one_request处理连接错误
+        finally:
+            handler.connection.settimeout(handler.timeout)
+    
+    def _close(self, handler):
+        try:
+            StreamRequestHandler.finish(handler)
+        except OSError:
+            pass
+        self.shutdown_request(handler.connection)
+    
+    def _watch_parked(self):
+        last_sweep = time.monotonic()
+        while not self._closing:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj is self._wakeup_recv:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    while not self._to_park.empty():
+                        handler = self._to_park.get()
+                        self._selector.register(handler.connection, selectors.EVENT_READ, handler)
+                        self._parked[handler] = time.monotonic()
+                else:
+                    handler = key.data
+                    self._selector.unregister(handler.connection)
+                    del self._parked[handler]
+                    self._executor.submit(self._resume, handler)
+            
+            now = time.monotonic()
+            if now - last_sweep >= 1.0:
+                last_sweep = now
+                for handler, since in list(self._parked.items()):
+                    if now - since > self.keep_alive_timeout:
+                        self._selector.unregister(handler.connection)
+                        del self._parked[handler]
+                        self._close(handler)
+    
+    def server_close(self):
+        self._closing = True
+        self._wakeup_send.send(b'\0')
+        super().server_close()
+        self._executor.shutdown(wait=True)
+        for handler in list(self._parked):
+            self._close(handler)
+
+def run_static_server(directory='.', port=8080, max_threads=16):
+    handler = lambda *args, **kwargs: StaticFileHandler(*args, directory=directory, **kwargs)
+    httpd = PooledHTTPServer(('localhost', port), handler, max_threads=max_threads)
+    print(f"静态文件服务器运行在 http://localhost:{port}，目录: {os.path.abspath(directory)}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务器关闭")
+        httpd.server_close()
+```
+
+下面的测试先检查304、gzip、`.gz`文件、Range和缓存失效，再用一个基于asyncio的负载生成器比较两种服务器。负载生成器打开多个长连接，每个连接逐个发送请求并记录延迟；服务器声明`HTTP/1.0`时每个请求重新连接，连接时间计入延迟：
+
+```python
+import asyncio
+import gzip
+import http.client
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+
+def make_site():
+    root = tempfile.mkdtemp()
+    words = ['function', 'return', 'const', 'value', 'element', 'document', 'window', 'event']
+    with open(os.path.join(root, 'index.html'), 'w') as f:
+        f.write('<html><body>' + '<p>hello world</p>' * 220 + '</body></html>')   # 约4KB
+    with open(os.path.join(root, 'app.js'), 'w') as f:
+        f.write(' '.join(random.choice(words) for _ in range(15000)))            # 约100KB
+    with open(os.path.join(root, 'style.css'), 'w') as f:
+        f.write('body { margin: 0; }\n' * 500)
+    with open(os.path.join(root, 'style.css'), 'rb') as src, gzip.open(os.path.join(root, 'style.css.gz'), 'wb') as dst:
+        dst.write(src.read())
+    with open(os.path.join(root, 'big.bin'), 'wb') as f:
+        f.write(os.urandom(32 * 1024 * 1024))
+    return root
+
+def test_static_server():
+    root = make_site()
+    handler = lambda *args, **kwargs: StaticFileHandler(*args, directory=root, **kwargs)
+    server = PooledHTTPServer(('127.0.0.1', 0), handler, max_threads=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    
+    def get(path, **headers):
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+    
+    with open(os.path.join(root, 'app.js'), 'rb') as f:
+        app_js = f.read()
+    response, body = get('/app.js')
+    assert response.status == 200 and body == app_js
+    etag = response.getheader('ETag')
+    assert get('/app.js', **{'If-None-Match': etag})[0].status == 304
+    
+    response, body = get('/app.js', **{'Accept-Encoding': 'gzip'})
+    assert response.getheader('Content-Encoding') == 'gzip' and gzip.decompress(body) == app_js
+    response, body = get('/style.css', **{'Accept-Encoding': 'gzip'})
+    with open(os.path.join(root, 'style.css.gz'), 'rb') as f:
+        assert body == f.read()             # 直接发送预压缩的.gz文件
+    
+    response, body = get('/big.bin', Range='bytes=1000-1999')
+    with open(os.path.join(root, 'big.bin'), 'rb') as f:
+        f.seek(1000)
+        assert response.status == 206 and body == f.read(1000)
+        assert response.getheader('Content-Range') == f'bytes 1000-1999/{32 * 1024 * 1024}'
+    assert get('/big.bin', Range='bytes=999999999-')[0].status == 416
+    assert get('/app.js', Range='bytes=-10')[1] == app_js[-10:]
+    assert get('/app.js', Range='bytes=0-1', **{'If-Range': '"stale"'})[0].status == 200
+    
+    time.sleep(0.01)
+    with open(os.path.join(root, 'index.html'), 'w') as f:
+        f.write('changed')
+    assert get('/index.html')[1] == get('/')[1] == b'changed'
+    assert get('/missing.txt')[0].status == 404
+    
+    # 一次发出40个流水线请求，超过max_requests_in_a_row的部分已经在rfile缓冲区中
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(b'GET /index.html HTTP/1.1\r\nHost: localhost\r\n\r\n' * 40)
+        stream = sock.makefile('rb')
+        for _ in range(40):
+            assert stream.readline().startswith(b'HTTP/1.1 200')
+            length = 0
+            while (line := stream.readline()) not in (b'\r\n', b''):
+                name, _, value = line.partition(b':')
+                if name.lower() == b'content-length':
+                    length = int(value)
+            assert stream.read(length) == b'changed'
+        stream.close()
+    
+    # 4个工作线程服务64个长连接
+    conns = [http.client.HTTPConnection('127.0.0.1', port) for _ in range(64)]
+    for _ in range(3):
+        for c in conns:
+            c.request('GET', '/index.html')
+        for c in conns:
+            response = c.getresponse()
+            assert response.read() == b'changed'
+    print("所有测试通过:", StaticFileHandler.cache.stats())
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(root)
+
+async def _load_worker(port, request, deadline, latencies):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = int(head.lower().split(b'content-length:', 1)[1].split(b'\r\n', 1)[0])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        if head.startswith(b'HTTP/1.0'):
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+def run_load(port, path, connections=64, duration=5.0, accept_gzip=False):
+    """返回(请求/秒, p50毫秒, p99毫秒)"""
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+    if accept_gzip:
+        request += "Accept-Encoding: gzip\r\n"
+    request = (request + "\r\n").encode()
+    latencies = []
+    
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(_load_worker(port, request, deadline, latencies)
+                               for _ in range(connections)))
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+def _serve_in_process(make_server):
+    """在子进程中创建并运行服务器（服务器的线程不能跨fork），返回(进程, 端口)"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    
+    def serve():
+        sys.stderr = open(os.devnull, 'w')     # 不计入每个请求的访问日志
+        server = make_server()
+        sender.send(server.server_address[1])
+        server.serve_forever()
+    
+    process = multiprocessing.get_context('fork').Process(target=serve, daemon=True)
+    process.start()
+    return process, receiver.recv()
+
+def benchmark_static_servers():
+    root = make_site()
+    class LargeBacklogServer(ThreadingHTTPServer):
+        request_queue_size = 1024
+    
+    servers = {
+        'ThreadingHTTPServer+OptimizedHandler': lambda: ThreadingHTTPServer(
+            ('127.0.0.1', 0), lambda *a, **kw: OptimizedHandler(*a, directory=root, **kw)),
+        'ThreadingHTTPServer(backlog=1024)+OptimizedHandler': lambda: LargeBacklogServer(
+            ('127.0.0.1', 0), lambda *a, **kw: OptimizedHandler(*a, directory=root, **kw)),
+        'PooledHTTPServer+StaticFileHandler': lambda: PooledHTTPServer(
+            ('127.0.0.1', 0), lambda *a, **kw: StaticFileHandler(*a, directory=root, **kw), max_threads=8),
+    }
+    for name, make_server in servers.items():
+        process, port = _serve_in_process(make_server)
+        print(f"\n{name}")
+        for label, path, gz in [('4KB index.html       ', '/index.html', False),
+                                ('100KB app.js(gzip)   ', '/app.js', True)]:
+            rps, p50, p99 = run_load(port, path, accept_gzip=gz)
+            print(f"  {label}: {rps:6.0f} 请求/秒, p50 {p50:6.1f} ms, p99 {p99:6.1f} ms")
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        for _ in range(10):
+            conn.request('GET', '/big.bin')
+            conn.getresponse().read()
+        print(f"  32MB big.bin x10     : {320 / (time.perf_counter() - start):6.0f} MB/s")
+        process.terminate()
+    shutil.rmtree(root)
+
+if __name__ == "__main__":
+    test_static_server()
+    benchmark_static_servers()
+```
+
+参考结果（Linux，Python 3.11，单核，本机回环，64个并发长连接，每项5秒，服务器在单独的进程中）：
+
+| 服务器 | 4KB index.html | 100KB app.js（接受gzip） | 32MB文件 |
+|--------|----------------|--------------------------|----------|
+| ThreadingHTTPServer + OptimizedHandler | 约 900 请求/秒，p99 约 1040 ms | 约 350-650 请求/秒，p99 约 1050 ms | 约 650-860 MB/s |
+| 同上，request_queue_size=1024 | 约 1200 请求/秒，p99 约 70 ms | 约 1000-1300 请求/秒，p99 约 65-85 ms | 约 650-770 MB/s |
+| PooledHTTPServer（8线程）+ StaticFileHandler | 约 3600-4100 请求/秒，p99 约 50 ms | 约 3500-3700 请求/秒，p99 约 52 ms | 约 830-890 MB/s |
+
+几点说明：
+
+- 原来的服务器p99超过1秒，原因是默认的`request_queue_size = 5`：每个请求都要重新连接，监听队列满时SYN被丢弃，客户端1秒后才重传。把队列调大后p99回到几十毫秒，但每个请求仍然要建立连接、创建线程、打开文件。
+- `PooledHTTPServer`只用8个线程服务64个长连接。64个连接同时请求时，p50约为64 ÷ 吞吐 ≈ 16ms，这是排队时间，而不是单个请求的处理时间。
+- 100KB的app.js压缩后约10KB（测试文件只由8个单词组成，压缩率比真实的JS高），压缩在第一次请求时完成，之后直接发送缓存的结果，所以它的吞吐和4KB的页面几乎相同。
+- 大文件的吞吐受Python客户端读取速度的限制，`sendfile`主要节省的是服务器一侧的CPU和内存复制，在单核的本机测试中差别不大。
+- 缓存按`os.stat`的结果判断文件是否变化，修改文件后下一个请求就能拿到新内容；不希望每个请求都`stat`时，可以让缓存项在几秒内直接视为有效，代价是更新延迟。
+
 ## 10. 常见问题与解决方案
 
 ### 10.1 服务器相关问题
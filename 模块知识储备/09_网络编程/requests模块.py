@@ -1062,6 +1062,8 @@ if __name__ == "__main__":
     test_concurrent_performance()
 ```
 
+需要按主机限流、失败重试或大量URL时，参见10.2.1节的BulkFetcher。
+
 ### 9.3 响应缓存
 
 ```python
@@ -1175,6 +1177,555 @@ if __name__ == "__main__":
     test_caching_performance()
 ```
 
+#### 9.3.1 遵循HTTP语义的缓存
+
+上面的`requests_with_cache`作为演示足够直观，但用在实际项目中有不少问题：
+
+- 缓存键只有URL，`?a=1&b=2`和`?b=2&a=1`是两个条目；同一URL因`Accept-Language`等请求头不同而返回的不同内容会互相覆盖
+- 完全忽略服务器给出的`Cache-Control`、`Expires`、`ETag`和`Last-Modified`，过期时间只能由调用者猜测；过期后直接删除，不能用条件请求廉价地确认内容没有变化
+- 每个URL一个pickle文件，命中时要打开文件并反序列化整个响应；缓存目录没有大小限制，也从不淘汰
+- 多个线程同时写同一个缓存文件时，读取方可能读到写了一半的文件
+
+下面的CachedSession继承`requests.Session`，GET和HEAD请求先查缓存：
+
+- **缓存键规范化**：方法 + 规范化的URL（协议和主机名小写、去掉默认端口和片段、查询参数排序）；响应带`Vary`时，再加上对应请求头的值
+- **新鲜度计算**：依次使用`Cache-Control: max-age`、`Expires`、基于`Last-Modified`的启发式规则（距今时间的10%，最多一天）和default_ttl；遵守请求和响应中的`no-store`、`no-cache`
+- **条件请求**：条目过期后带上`If-None-Match`和`If-Modified-Since`重新验证，服务器返回304时只更新头部和时间，不重新传输响应体
+- **stale-while-revalidate**：在响应允许的窗口内先返回旧内容，同时在后台线程中重新验证，同一个条目同时只有一个后台验证
+- **单文件存储**：所有条目保存在一个WAL模式的SQLite数据库中，按最近访问时间做LRU淘汰，总大小不超过max_size；最近使用的条目同时保存在按字节数限制的内存LRU中，命中时不需要访问磁盘，也不需要反序列化
+- **线程安全**：存储的所有操作都在一把锁中完成；命中时的访问时间先记在内存里，在下一次写入时批量更新到数据库
+- **失效**：同一URL上成功的POST、PUT、PATCH、DELETE请求会删除它的所有缓存变体
+
+```python
+import email.utils
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+HEURISTICALLY_CACHEABLE = {200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501}
+
+@functools.lru_cache(maxsize=4096)
+def normalize_url(url):
+    """规范化URL，使语义相同的URL得到相同的缓存键"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host if parts.port in (None, DEFAULT_PORTS.get(scheme)) else f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def parse_cache_control(value):
+    """'max-age=60, no-cache' -> {'max-age': '60', 'no-cache': True}"""
+    directives = {}
+    for item in value.split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else True
+    return directives
+
+def _parse_seconds(value, default=0):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+def _parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class CacheEntry:
+    """一条缓存的响应"""
+    __slots__ = ('key', 'url', 'status', 'reason', 'headers', 'body',
+                 'encoding', 'born', 'fresh_for', 'swr', 'size')
+    
+    def __init__(self, key, url, status, reason, headers, body, born, fresh_for, swr):
+        self.key = key
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = CaseInsensitiveDict(headers)  # 头部名称不区分大小写
+        self.body = body
+        self.encoding = get_encoding_from_headers(self.headers)
+        self.born = born        # 响应在源服务器上生成的时间（已扣除Age）
+        self.fresh_for = fresh_for
+        self.swr = swr          # stale-while-revalidate窗口（秒）
+        self.size = len(body) + sum(len(k) + len(v) for k, v in self.headers.items())
+    
+    def has_validators(self):
+        return 'ETag' in self.headers or 'Last-Modified' in self.headers
+
+class CachedResponse(Response):
+    """由缓存条目构造的响应，省去Response.__init__中用不到的初始化"""
+    
+    def __init__(self, entry, state):
+        self._content = entry.body
+        self._content_consumed = True
+        self._next = None
+        self.status_code = entry.status
+        self.reason = entry.reason
+        self.headers = entry.headers.copy()
+        self.url = entry.url
+        self.encoding = entry.encoding
+        self.raw = None
+        self.history = []
+        self.cookies = RequestsCookieJar()
+        self.elapsed = timedelta(0)
+        self.request = None
+        self.from_cache = True
+        self.cache_state = state  # HIT / STALE / REVALIDATED
+
+class HTTPCacheStore:
+    """单文件SQLite存储 + 内存LRU，所有方法都是线程安全的"""
+    
+    def __init__(self, path='http_cache.sqlite', max_size=256 * 1024 * 1024,
+                 memory_limit=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.memory_limit = memory_limit
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, url TEXT, status INTEGER, reason TEXT,
+                headers TEXT, body BLOB, born REAL, fresh_for REAL, swr REAL,
+                size INTEGER, last_access REAL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vary (primary_key TEXT PRIMARY KEY, fields TEXT)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._vary = {}
+        self._touched = {}
+    
+    def get_vary(self, primary_key):
+        """返回该URL的响应所声明的Vary请求头（元组，可能为空）"""
+        with self._lock:
+            fields = self._vary.get(primary_key)
+            if fields is None:
+                row = self._db.execute("SELECT fields FROM vary WHERE primary_key = ?",
+                                       (primary_key,)).fetchone()
+                fields = self._vary[primary_key] = tuple(json.loads(row[0])) if row else ()
+            return fields
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            else:
+                row = self._db.execute(
+                    "SELECT key, url, status, reason, headers, body, born, fresh_for, swr "
+                    "FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                entry = CacheEntry(*row[:4], json.loads(row[4]), *row[5:])
+                self._remember(entry)
+            self._touched[key] = time.time()
+            return entry
+    
+    def put(self, entry, vary_fields=()):
+        with self._lock:
+            primary_key = entry.key.split('\n', 1)[0]
+            if self._vary.get(primary_key) != vary_fields:
+                self._db.execute("INSERT OR REPLACE INTO vary VALUES (?, ?)",
+                                 (primary_key, json.dumps(vary_fields)))
+                self._vary[primary_key] = vary_fields
+            self._flush_touches()
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (entry.key,)).fetchone()
+            self._size += entry.size - (row[0] if row else 0)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.key, entry.url, entry.status, entry.reason, json.dumps(dict(entry.headers)),
+                 entry.body, entry.born, entry.fresh_for, entry.swr, entry.size, time.time()))
+            self._forget(entry.key)
+            self._remember(entry)
+            if self._size > self.max_size:
+                self._evict()
+    
+    def delete(self, key):
+        """删除一条缓存条目"""
+        with self._lock:
+            self._flush_touches()
+            self._forget(key)
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= row[0]
+    
+    def invalidate(self, primary_key):
+        """删除一个URL的所有变体"""
+        with self._lock:
+            self._flush_touches()
+            for key in [k for k in self._memory if k.split('\n', 1)[0] == primary_key]:
+                self._forget(key)
+            removed = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE key = ? OR key LIKE ?",
+                (primary_key, primary_key + '\n%')).fetchone()[0]
+            self._db.execute("DELETE FROM entries WHERE key = ? OR key LIKE ?",
+                             (primary_key, primary_key + '\n%'))
+            self._size -= removed
+    
+    def _remember(self, entry):
+        if entry.size > self.memory_limit // 4:
+            return  # 太大的响应只放在磁盘上
+        self._memory[entry.key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self.memory_limit:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= old.size
+    
+    def _forget(self, key):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+    
+    def _flush_touches(self):
+        if self._touched:
+            self._db.executemany("UPDATE entries SET last_access = ? WHERE key = ?",
+                                 [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+    
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小降到max_size的90%"""
+        target = self.max_size * 0.9
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access")
+        victims = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            victims.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", victims)
+        for (key,) in victims:
+            self._forget(key)
+    
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._db.close()
+
+class CachedSession(requests.Session):
+    """GET/HEAD请求遵循HTTP缓存语义的Session"""
+    
+    def __init__(self, store=None, default_ttl=0, revalidate_workers=2):
+        super().__init__()
+        self.cache = store if store is not None else HTTPCacheStore()
+        self.default_ttl = default_ttl
+        self.stats = Counter()
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(revalidate_workers,
+                                            thread_name_prefix='cache-revalidate')
+    
+    def _request_header(self, name, headers):
+        """headers是CaseInsensitiveDict，self.headers也是，查找都不区分大小写"""
+        if headers and headers.get(name) is not None:
+            return headers[name]
+        return self.headers.get(name) or ''
+    
+    def _cache_key(self, primary_key, vary_fields, headers):
+        if not vary_fields:
+            return primary_key
+        return primary_key + '\n' + '\n'.join(
+            f"{field}={self._request_header(field, headers)}" for field in vary_fields)
+    
+    def request(self, method, url, **kwargs):
+        method = method.upper()
+        if kwargs.get('params'):
+            url = requests.Request(method, url, params=kwargs.pop('params')).prepare().url
+        primary_key = f"{method} {normalize_url(url)}"
+        if method not in ('GET', 'HEAD'):
+            response = super().request(method, url, **kwargs)
+            if response.status_code < 400 and method != 'OPTIONS':
+                self.cache.invalidate(f"GET {normalize_url(url)}")
+                self.cache.invalidate(f"HEAD {normalize_url(url)}")
+            return response
+        
+        headers = kwargs.get('headers')
+        if headers:
+            headers = CaseInsensitiveDict(headers)
+        request_cc = parse_cache_control(self._request_header('Cache-Control', headers))
+        if 'no-store' in request_cc or kwargs.get('stream'):
+            self.stats['bypass'] += 1
+            return super().request(method, url, **kwargs)
+        
+        key = self._cache_key(primary_key, self.cache.get_vary(primary_key), headers)
+        entry = self.cache.get(key)
+        if entry is not None:
+            age = time.time() - entry.born
+            must_revalidate = 'no-cache' in request_cc or \
+                _parse_seconds(request_cc.get('max-age'), age + 1) <= age
+            if not must_revalidate and age < entry.fresh_for:
+                self.stats['hit'] += 1
+                return CachedResponse(entry, 'HIT')
+            if not must_revalidate and age < entry.fresh_for + entry.swr:
+                self.stats['stale'] += 1
+                self._revalidate_in_background(method, url, kwargs, primary_key, entry)
+                return CachedResponse(entry, 'STALE')
+        return self._fetch(method, url, kwargs, primary_key, entry)
+    
+    def _fetch(self, method, url, kwargs, primary_key, entry):
+        """向服务器请求；有可用的缓存条目时发送条件请求"""
+        if entry is not None and entry.has_validators():
+            headers = CaseInsensitiveDict(kwargs.get('headers') or {})
+            if 'ETag' in entry.headers:
+                headers['If-None-Match'] = entry.headers['ETag']
+            if 'Last-Modified' in entry.headers:
+                headers['If-Modified-Since'] = entry.headers['Last-Modified']
+            kwargs = {**kwargs, 'headers': headers}
+        request_time = time.time()
+        response = super().request(method, url, **kwargs)
+        if entry is not None and response.status_code == 304:
+            merged = entry.headers.copy()
+            merged.update((k, v) for k, v in response.headers.items()
+                          if k.lower() not in ('content-length', 'transfer-encoding',
+                                               'content-encoding'))
+            updated = self._make_entry(entry.key, entry.url, entry.status, entry.reason,
+                                       merged, entry.body, request_time)
+            self.stats['revalidated'] += 1
+            if updated is None:
+                # 304带来的新头部使响应不可缓存（例如no-store），删除旧条目；
+                # 304本身没有响应体，仍用刚验证过的内容构造这一次的响应
+                self.cache.delete(entry.key)
+                return CachedResponse(CacheEntry(entry.key, entry.url, entry.status, entry.reason,
+                                                 merged, entry.body, request_time, 0, 0),
+                                      'REVALIDATED')
+            self.cache.put(updated, self.cache.get_vary(primary_key))
+            return CachedResponse(updated, 'REVALIDATED')
+        self.stats['miss'] += 1
+        self._store(primary_key, kwargs.get('headers'), response, request_time)
+        response.from_cache = False
+        return response
+    
+    def _revalidate_in_background(self, method, url, kwargs, primary_key, entry):
+        with self._revalidating_lock:
+            if entry.key in self._revalidating:
+                return
+            self._revalidating.add(entry.key)
+        
+        def revalidate():
+            try:
+                self._fetch(method, url, kwargs, primary_key, entry)
+            except requests.RequestException as e:
+                self.stats['revalidate_error'] += 1
+                print(f"后台验证失败 {url}: {e}")
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(entry.key)
+        
+        self._executor.submit(revalidate)
+    
+    def _make_entry(self, key, url, status, reason, headers, body, request_time):
+        """根据响应头计算新鲜度，返回CacheEntry；不可缓存时返回None"""
+        cc = parse_cache_control(headers.get('Cache-Control', ''))
+        if 'no-store' in cc:
+            return None
+        date = _parse_http_date(headers.get('Date')) or request_time
+        born = min(date, request_time) - _parse_seconds(headers.get('Age'))
+        if 'no-cache' in cc:
+            fresh_for = 0
+        elif 'max-age' in cc:
+            fresh_for = _parse_seconds(cc['max-age'])
+        elif 'Expires' in headers:
+            expires = _parse_http_date(headers['Expires'])
+            fresh_for = max(0, expires - date) if expires else 0
+        elif 'Last-Modified' in headers and status in HEURISTICALLY_CACHEABLE:
+            last_modified = _parse_http_date(headers['Last-Modified']) or date
+            fresh_for = min(86400, max(0, date - last_modified) * 0.1)
+        else:
+            fresh_for = self.default_ttl if status in HEURISTICALLY_CACHEABLE else 0
+        swr = _parse_seconds(cc.get('stale-while-revalidate'))
+        entry = CacheEntry(key, url, status, reason, headers, body, born, fresh_for, swr)
+        if fresh_for <= 0 and not entry.has_validators():
+            return None
+        return entry
+    
+    def _store(self, primary_key, request_headers, response, request_time):
+        vary = response.headers.get('Vary', '')
+        if vary.strip() == '*':
+            return
+        vary_fields = tuple(sorted(f.strip().title() for f in vary.split(',') if f.strip()))
+        key = self._cache_key(primary_key, vary_fields, CaseInsensitiveDict(request_headers or {}))
+        entry = self._make_entry(key, response.url, response.status_code, response.reason,
+                                 response.headers, response.content, request_time)
+        if entry is not None:
+            self.cache.put(entry, vary_fields)
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
+        super().close()
+        self.cache.close()
+
+_default_session = None
+
+def requests_with_http_cache(url, **kwargs):
+    """与requests_with_cache用法相同，但遵循服务器给出的缓存指令"""
+    global _default_session
+    if _default_session is None:
+        _default_session = CachedSession()
+    return _default_session.get(url, **kwargs)
+```
+
+下面的测试在本地启动一个HTTP服务器：`/fresh`的max-age为60秒，`/etag`的max-age为0但带ETag，`/swr`的max-age为0、stale-while-revalidate为60秒，`/lang`按`Accept-Language`返回不同内容。测试检查各种情况下服务器实际收到的请求数，然后比较命中路径的耗时：
+
+```python
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class CacheTestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 头部和响应体分两次写出，避免碰上延迟确认
+    counts = Counter()
+    
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        type(self).counts[path] += 1
+        body = (f"{path} " + 'x' * 2000).encode()
+        headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        if path == '/fresh':
+            headers['Cache-Control'] = 'max-age=60'
+        elif path in ('/etag', '/swr', '/revoke'):
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers['ETag'] = etag
+            headers['Cache-Control'] = 'max-age=0' + (
+                ', stale-while-revalidate=60' if path == '/swr' else '')
+            if self.headers.get('If-None-Match') == etag:
+                if path == '/revoke':
+                    headers['Cache-Control'] = 'no-store'  # 验证时撤销可缓存性
+                self._send(304, headers, b'')
+                return
+        elif path == '/lang':
+            body = self.headers.get('Accept-Language', 'none').encode()
+            headers.update({'Cache-Control': 'max-age=60', 'Vary': 'Accept-Language'})
+        self._send(200, headers, body)
+    
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def test_http_cache():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CacheTestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    counts = CacheTestHandler.counts
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        session = CachedSession(HTTPCacheStore(os.path.join(tmp, 'cache.sqlite')))
+        for _ in range(3):
+            session.get(f"{base}/fresh?b=2&a=1")
+            session.get(f"{base}/fresh?a=1&b=2")
+        print(f"/fresh: 服务器收到 {counts['/fresh']} 次请求")
+        
+        states = [getattr(session.get(f"{base}/etag"), 'cache_state', 'MISS') for _ in range(3)]
+        print(f"/etag: 服务器收到 {counts['/etag']} 次请求, 缓存状态 {states}")
+        
+        revoked = [session.get(f"{base}/revoke") for _ in range(3)]
+        print(f"/revoke: 状态 {[r.status_code for r in revoked]}, 响应体完整 "
+              f"{all(r.content == revoked[0].content for r in revoked)}, "
+              f"服务器收到 {counts['/revoke']} 次请求")
+        
+        session.get(f"{base}/swr")
+        response = session.get(f"{base}/swr")
+        session._executor.shutdown(wait=True)  # 等待后台验证完成
+        print(f"/swr: 第二次请求状态 {response.cache_state}, 服务器收到 {counts['/swr']} 次请求")
+        
+        bodies = [session.get(f"{base}/lang", headers={name: lang}).text
+                  for name, lang in (('Accept-Language', 'zh'), ('Accept-Language', 'en'),
+                                     ('accept-language', 'zh'), ('ACCEPT-LANGUAGE', 'en'))]
+        print(f"/lang: 响应 {bodies}, 服务器收到 {counts['/lang']} 次请求")
+        
+        session.get(f"{base}/fresh", headers={'cache-control': 'no-cache'})
+        print(f"/fresh: 小写的cache-control: no-cache强制验证, 服务器收到 {counts['/fresh']} 次请求")
+        
+        # 命中路径的耗时
+        url = f"{base}/fresh"
+        session.get(url)
+        n = 20000
+        start = time.perf_counter()
+        for _ in range(n):
+            session.get(url)
+        cached_us = (time.perf_counter() - start) / n * 1e6
+        
+        cache_dir = os.path.join(tmp, 'pickle_cache')
+        with redirect_stdout(io.StringIO()):
+            requests_with_cache(url, cache_dir=cache_dir)
+            start = time.perf_counter()
+            for _ in range(n // 10):
+                requests_with_cache(url, cache_dir=cache_dir)
+            pickle_us = (time.perf_counter() - start) / (n // 10) * 1e6
+        
+        plain = requests.Session()
+        start = time.perf_counter()
+        for _ in range(200):
+            plain.get(url)
+        network_us = (time.perf_counter() - start) / 200 * 1e6
+        
+        # 多线程同时命中
+        def worker():
+            for _ in range(n // 8):
+                session.get(url)
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        threaded = n / (time.perf_counter() - start)
+        
+        print(f"\n命中路径: CachedSession {cached_us:.1f} 微秒/次, "
+              f"requests_with_cache {pickle_us:.1f} 微秒/次, 不使用缓存 {network_us:.1f} 微秒/次")
+        print(f"8个线程同时命中: {threaded:.0f} 次/秒")
+        print(f"统计: {dict(session.stats)}")
+        session.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    test_http_cache()
+```
+
+参考结果（Linux，Python 3.11，requests 2.32，本机回环）：
+
+| 方式 | 每次请求耗时 |
+|------|--------------|
+| 不使用缓存（Session，保持连接） | ~2,000 微秒 |
+| requests_with_cache（每次读取pickle文件） | ~40 微秒 |
+| CachedSession（内存LRU命中） | ~19 微秒 |
+| CachedSession，8个线程同时命中 | ~45,000 次/秒 |
+
+测试中`/fresh`的两种参数顺序只产生了1次请求；`/etag`每次都发送条件请求，但只有第一次传输了响应体；`/swr`的第二次请求立即返回了旧内容，后台验证产生了第2次请求；`/lang`的两个语言各请求一次，请求头名称的大小写不影响Vary的匹配，小写的`cache-control: no-cache`同样会强制验证；`/revoke`在304中返回`no-store`，旧条目被删除，之后的请求都重新完整获取。
+
+requests_with_cache的40微秒是在缓存文件已经位于页缓存中的理想情况下测得的，并且它返回的不是服务器给出的状态码和头部。CachedSession命中时只有一次加锁的字典查找，剩下的时间主要花在`Session.get`的参数处理和构造Response对象上；为此CachedResponse跳过了`Response.__init__`中创建CookieJar等工作，URL规范化的结果也用`lru_cache`缓存起来。
+
 ## 10. 实际应用示例
 
 ### 10.1 REST API客户端
@@ -1535,6 +2086,691 @@ if __name__ == "__main__":
     test_file_downloader()
 ```
 
+#### 10.2.1 统一的批量抓取引擎
+
+9.2节的`concurrent_requests`和上面的`batch_download`都是"线程池 + 每个任务一次请求"的写法，放到大批量任务中会遇到这些问题：
+
+- `concurrent_requests`默认不使用会话，每个请求都重新建立连接；`batch_download`调用的`download_file_with_progress`使用`requests.get`，同样没有连接复用
+- 没有按主机的并发上限，URL集中在少数几个主机时，会同时向同一个主机打开max_workers个连接
+- 没有重试，一次超时或503就算失败；如果简单地固定间隔重试，所有失败的请求又会在同一时刻一起重试
+- 大文件只能用一个连接顺序下载，下载中断后只能从头开始，而且失败时会删除已经下载的部分
+
+下面的BulkFetcher把这些功能集中在一个引擎中，同时提供基于aiohttp的AsyncBulkFetcher：
+
+- **共享连接池**：所有任务共用一个Session和一个`HTTPAdapter`，连接池满时阻塞等待（`pool_block=True`），而不是创建用完即弃的连接
+- **按主机限流**：每个主机一个信号量，同一主机上同时进行的请求不超过per_host
+- **抖动退避重试**：连接错误、超时、429和5xx响应按`random.uniform(0, backoff * 2**attempt)`（full jitter）等待后重试，遵守`Retry-After`
+- **流式写入**：单连接下载用`iter_content`按块追加写入`.part`文件，不预先分配空间，`.part`文件的大小就是已经收到的字节数，中断后从这里续传
+- **分段并行和断点续传**：服务器支持`Range`且文件大于range_threshold时，把文件切成若干段，每段由一个连接用`os.pwrite`写到各自的偏移处；每段的完成进度记录在`.progress`文件中，中断后再次下载只请求缺少的字节
+
+```python
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+class FetchResult:
+    """一个抓取或下载任务的结果"""
+    __slots__ = ('url', 'status', 'size', 'path', 'attempts', 'elapsed', 'error')
+    
+    def __init__(self, url, status=None, size=0, path=None, attempts=0, elapsed=0.0, error=None):
+        self.url = url
+        self.status = status
+        self.size = size
+        self.path = path
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.error = error
+    
+    @property
+    def ok(self):
+        return self.error is None and self.status is not None and self.status < 400
+    
+    def __repr__(self):
+        state = f"状态码 {self.status}, {self.size} 字节" if self.ok else f"失败: {self.error}"
+        return f"<FetchResult {self.url} {state}, 尝试 {self.attempts} 次>"
+
+class RetryableStatus(Exception):
+    """服务器返回了可以重试的状态码"""
+    
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+def backoff_delay(attempt, backoff, backoff_max, retry_after=None):
+    """full jitter退避；服务器给出Retry-After秒数时以它为准"""
+    if retry_after and str(retry_after).isdigit():
+        return min(backoff_max, int(retry_after))
+    return random.uniform(0, min(backoff_max, backoff * 2 ** attempt))
+
+def split_ranges(size, parts):
+    """把[0, size)切成parts段，返回[(start, end)]，end不包含"""
+    step = -(-size // parts)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+class RangeProgress:
+    """分段下载的进度文件：记录每一段已经写入的字节数"""
+    
+    def __init__(self, path, url, size, parts):
+        self.path = path + '.progress'
+        self.lock = threading.Lock()
+        self.state = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved['url'] == url and saved['size'] == size:
+                self.state = saved
+        if self.state is None:
+            self.state = {'url': url, 'size': size,
+                          'ranges': [[start, end, 0] for start, end in split_ranges(size, parts)]}
+        self.save()
+    
+    def advance(self, index, written):
+        with self.lock:
+            self.state['ranges'][index][2] = written
+            self.save()
+    
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+    
+    def pending(self):
+        """尚未完成的段：[(序号, 下一个字节的位置, 段末尾, 已写入字节数)]"""
+        return [(i, start + done, end, done)
+                for i, (start, end, done) in enumerate(self.state['ranges'])
+                if start + done < end]
+    
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class BulkFetcher:
+    """基于共享连接池的批量抓取和下载引擎"""
+    
+    def __init__(self, max_workers=16, per_host=4, retries=3, backoff=0.2, backoff_max=10.0,
+                 timeout=(5, 30), chunk_size=256 * 1024,
+                 range_threshold=16 * 1024 * 1024, range_parts=4):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.range_threshold = range_threshold
+        self.range_parts = range_parts
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=max_workers * range_parts,
+                              pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._host_slots_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='fetch')
+        # 分段任务使用独立的线程池，避免下载任务在等待分段时占满工作线程导致死锁
+        self._part_executor = ThreadPoolExecutor(max_workers * range_parts,
+                                                 thread_name_prefix='fetch-part')
+    
+    @contextmanager
+    def _host_slot(self, url):
+        with self._host_slots_lock:
+            slot = self._host_slots[urlsplit(url).netloc]
+        with slot:
+            yield
+    
+    def _with_retries(self, url, func):
+        """在主机并发限制内执行func(attempt)，可重试的错误按抖动退避重试"""
+        for attempt in range(self.retries + 1):
+            try:
+                with self._host_slot(url):
+                    return func(attempt)
+            except (RetryableStatus, *RETRY_EXCEPTIONS) as e:
+                if attempt == self.retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff, self.backoff_max,
+                                         getattr(e, 'retry_after', None)))
+    
+    def _get(self, url, **kwargs):
+        response = self.session.get(url, timeout=self.timeout, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            response.close()
+            raise RetryableStatus(response.status_code, response.headers.get('Retry-After'))
+        return response
+    
+    def fetch(self, url):
+        """获取一个URL，返回包含状态码和长度的FetchResult"""
+        result = FetchResult(url)
+        start = time.perf_counter()
+        
+        def attempt(n):
+            result.attempts = n + 1
+            response = self._get(url)
+            result.status, result.size = response.status_code, len(response.content)
+        
+        try:
+            self._with_retries(url, attempt)
+        except Exception as e:
+            result.error = str(e)
+        result.elapsed = time.perf_counter() - start
+        return result
+    
+    def fetch_all(self, urls):
+        """并发获取所有URL，按完成顺序产出FetchResult"""
+        futures = [self._executor.submit(self.fetch, url) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+    
+    def _probe(self, url):
+        """用Range: bytes=0-0探测文件大小和是否支持分段请求"""
+        def attempt(n):
+            with self._get(url, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+                response.raise_for_status()
+                if response.status_code == 206:
+                    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                    return (int(total) if total.isdigit() else None), True
+                length = response.headers.get('Content-Length')
+                return (int(length) if length else None), False
+        return self._with_retries(url, attempt)
+    
+    def download(self, url, path):
+        """下载到path；大文件分段并行下载，中断后可以续传"""
+        result = FetchResult(url, path=path)
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            size, ranged = self._probe(url)
+            if ranged and size and size >= self.range_threshold:
+                self._download_ranges(url, path, size, result)
+            else:
+                self._download_stream(url, path, size, ranged, result)
+            result.status, result.size = 200, os.path.getsize(path)
+        except Exception as e:
+            result.error = str(e)  # 保留已下载的部分，下次调用时续传
+        result.elapsed = time.perf_counter() - start
+        return result
+    
+    def _download_stream(self, url, path, size, ranged, result):
+        """单连接下载；服务器支持Range时从.part文件的末尾续传
+        
+        .part文件不预先分配空间：它的大小必须等于已经收到的字节数，否则中断后会从错误的位置续传
+        """
+        part_path = path + '.part'
+        
+        def attempt(n):
+            result.attempts = n + 1
+            offset = os.path.getsize(part_path) if ranged and os.path.exists(part_path) else 0
+            if size is not None and offset >= size:
+                if offset == size:
+                    return  # 上次已经收完，只是没来得及重命名
+                offset = 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            with self._get(url, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                with open(part_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                    f.truncate()
+        
+        self._with_retries(url, attempt)
+        os.replace(part_path, path)
+    
+    def _download_ranges(self, url, path, size, result):
+        part_path = path + '.part'
+        progress = RangeProgress(path, url, size, self.range_parts)
+        if not os.path.exists(part_path):
+            with open(part_path, 'wb') as f:
+                f.truncate(size)  # 预分配，各段用pwrite写入自己的偏移
+        fd = os.open(part_path, os.O_WRONLY)
+        attempts = []
+        
+        def fetch_range(index, position, end, done):
+            def attempt(n):
+                nonlocal position, done
+                attempts.append(1)
+                headers = {'Range': f'bytes={position}-{end - 1}'}
+                with self._get(url, headers=headers, stream=True) as response:
+                    if response.status_code != 206:
+                        raise requests.HTTPError(f"服务器没有返回206: {response.status_code}")
+                    unsaved = 0
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        os.pwrite(fd, chunk, position)
+                        position += len(chunk)
+                        done += len(chunk)
+                        unsaved += len(chunk)
+                        if unsaved >= 4 * 1024 * 1024:  # 每4MB记录一次进度
+                            progress.advance(index, done)
+                            unsaved = 0
+                    progress.advance(index, done)
+                    if position < end:
+                        raise requests.exceptions.ChunkedEncodingError("分段数据不完整")
+            self._with_retries(url, attempt)
+        
+        try:
+            futures = [self._part_executor.submit(fetch_range, *pending)
+                       for pending in progress.pending()]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            os.close(fd)
+            result.attempts = len(attempts)
+        os.replace(part_path, path)
+        progress.remove()
+    
+    def download_all(self, urls, directory):
+        """urls可以是URL列表或{url: 文件名}字典，按完成顺序产出FetchResult"""
+        if not isinstance(urls, dict):
+            urls = {url: os.path.basename(urlsplit(url).path) or f'downloaded_{i}.bin'
+                    for i, url in enumerate(urls)}
+        futures = [self._executor.submit(self.download, url, os.path.join(directory, name))
+                   for url, name in urls.items()]
+        for future in as_completed(futures):
+            yield future.result()
+    
+    def close(self):
+        self._executor.shutdown()
+        self._part_executor.shutdown()
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+```
+
+AsyncBulkFetcher提供同样的功能：aiohttp连接器的`limit`和`limit_per_host`分别对应总并发和按主机并发，重试和分段下载的逻辑与BulkFetcher相同：
+
+```python
+import asyncio
+
+import aiohttp
+
+class AsyncBulkFetcher:
+    """BulkFetcher的asyncio版本"""
+    
+    def __init__(self, max_concurrency=64, per_host=4, retries=3, backoff=0.2,
+                 backoff_max=10.0, timeout=30, chunk_size=256 * 1024,
+                 range_threshold=16 * 1024 * 1024, range_parts=4):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=timeout)
+        self.chunk_size = chunk_size
+        self.range_threshold = range_threshold
+        self.range_parts = range_parts
+        self.session = None
+    
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                         limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.session.close()
+    
+    async def _with_retries(self, func):
+        for attempt in range(self.retries + 1):
+            try:
+                return await func(attempt)
+            except (RetryableStatus, aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.backoff, self.backoff_max,
+                                                  getattr(e, 'retry_after', None)))
+    
+    @staticmethod
+    def _check(response):
+        if response.status in RETRY_STATUSES:
+            raise RetryableStatus(response.status, response.headers.get('Retry-After'))
+    
+    async def fetch(self, url):
+        result = FetchResult(url)
+        start = time.perf_counter()
+        
+        async def attempt(n):
+            result.attempts = n + 1
+            async with self.session.get(url) as response:
+                self._check(response)
+                body = await response.read()
+                result.status, result.size = response.status, len(body)
+        
+        try:
+            await self._with_retries(attempt)
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+        result.elapsed = time.perf_counter() - start
+        return result
+    
+    async def fetch_all(self, urls):
+        """并发获取所有URL，按完成顺序产出FetchResult"""
+        for future in asyncio.as_completed([self.fetch(url) for url in urls]):
+            yield await future
+    
+    async def download(self, url, path):
+        result = FetchResult(url, path=path)
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            size, ranged = await self._probe(url)
+            part_path = path + '.part'
+            if ranged and size and size >= self.range_threshold:
+                progress = RangeProgress(path, url, size, self.range_parts)
+                if not os.path.exists(part_path):
+                    with open(part_path, 'wb') as f:
+                        f.truncate(size)
+                fd = os.open(part_path, os.O_WRONLY)
+                try:
+                    await asyncio.gather(*(self._fetch_range(url, fd, progress, *pending, result)
+                                           for pending in progress.pending()))
+                finally:
+                    os.close(fd)
+                progress.remove()
+            else:
+                await self._download_stream(url, part_path, size, ranged, result)
+            os.replace(part_path, path)
+            result.status, result.size = 200, os.path.getsize(path)
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+        result.elapsed = time.perf_counter() - start
+        return result
+    
+    async def _probe(self, url):
+        async def attempt(n):
+            async with self.session.get(url, headers={'Range': 'bytes=0-0'}) as response:
+                self._check(response)
+                response.raise_for_status()
+                if response.status == 206:
+                    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                    return (int(total) if total.isdigit() else None), True
+                return response.content_length, False
+        return await self._with_retries(attempt)
+    
+    async def _download_stream(self, url, part_path, size, ranged, result):
+        async def attempt(n):
+            result.attempts = n + 1
+            # 与BulkFetcher相同，.part文件不预分配，它的大小就是已经收到的字节数
+            offset = os.path.getsize(part_path) if ranged and os.path.exists(part_path) else 0
+            if size is not None and offset >= size:
+                if offset == size:
+                    return
+                offset = 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            async with self.session.get(url, headers=headers) as response:
+                self._check(response)
+                response.raise_for_status()
+                if response.status != 206:
+                    offset = 0
+                with open(part_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        f.write(chunk)
+                    f.truncate()
+        await self._with_retries(attempt)
+    
+    async def _fetch_range(self, url, fd, progress, index, position, end, done, result):
+        async def attempt(n):
+            nonlocal position, done
+            result.attempts += 1
+            headers = {'Range': f'bytes={position}-{end - 1}'}
+            async with self.session.get(url, headers=headers) as response:
+                self._check(response)
+                if response.status != 206:
+                    raise aiohttp.ClientPayloadError(f"服务器没有返回206: {response.status}")
+                unsaved = 0
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    os.pwrite(fd, chunk, position)
+                    position += len(chunk)
+                    done += len(chunk)
+                    unsaved += len(chunk)
+                    if unsaved >= 4 * 1024 * 1024:
+                        progress.advance(index, done)
+                        unsaved = 0
+                progress.advance(index, done)
+                if position < end:
+                    raise aiohttp.ClientPayloadError("分段数据不完整")
+        await self._with_retries(attempt)
+```
+
+下面的测试服务器基于`SimpleHTTPRequestHandler`，增加了Range支持，并且可以为每个响应增加固定延迟、限制每个连接的带宽、按一定比例返回503。在本机回环上单个连接的带宽几乎没有上限，分段并行下载体现不出优势，所以测试中把每个连接限制为20MB/s，模拟真实网络中单个TCP连接受限于往返时间和拥塞窗口的情况：
+
+```python
+import shutil
+import tempfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+class BenchHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    latency = 0.0           # 每个响应的固定延迟（秒）
+    bandwidth = None        # 每个连接的带宽上限（字节/秒）
+    failure_rate = 0.0      # 返回503的比例
+    interrupted = False     # 为True时中断正在发送的响应，用于测试断点续传
+    interrupt_after = None  # 下一个响应发送这么多字节后中断连接（只中断一次）
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """支持单个Range的静态文件处理器"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    
+    def send_head(self):
+        time.sleep(self.server.latency)
+        if random.random() < self.server.failure_rate:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        f = open(path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+    
+    def copyfile(self, source, outputfile):
+        block = 64 * 1024
+        started = time.perf_counter()
+        sent = 0
+        while self._remaining > 0:
+            if self.server.interrupted:
+                self.close_connection = True
+                return
+            if self.server.interrupt_after is not None and sent >= self.server.interrupt_after:
+                self.server.interrupt_after = None
+                self.close_connection = True
+                return
+            data = source.read(min(block, self._remaining))
+            if not data:
+                break
+            outputfile.write(data)
+            sent += len(data)
+            self._remaining -= len(data)
+            if self.server.bandwidth:
+                ahead = sent / self.server.bandwidth - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_file_server(directory, **settings):
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    server = BenchHTTPServer(('127.0.0.1', 0), handler)
+    for name, value in settings.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def benchmark_bulk_fetch():
+    root = tempfile.mkdtemp()
+    for i in range(300):
+        with open(os.path.join(root, f'small_{i}.bin'), 'wb') as f:
+            f.write(os.urandom(16 * 1024))
+    with open(os.path.join(root, 'large.bin'), 'wb') as f:
+        f.write(os.urandom(64 * 1024 * 1024))
+    
+    # 1. 300个16KB的小文件，每个响应20ms延迟
+    server, base = start_file_server(root, latency=0.02)
+    urls = [f"{base}/small_{i}.bin" for i in range(300)]
+    for name, run in [
+        ('concurrent_requests(不使用会话)', lambda: concurrent_requests(urls, max_workers=16)),
+        ('concurrent_requests(使用会话)  ', lambda: concurrent_requests(urls, max_workers=16, use_session=True)),
+    ]:
+        start = time.perf_counter()
+        ok = sum(1 for _, status, _ in run() if status == 200)
+        print(f"{name}: {len(urls) / (time.perf_counter() - start):6.0f} 请求/秒, 成功 {ok}")
+    with BulkFetcher(max_workers=16, per_host=16) as fetcher:
+        start = time.perf_counter()
+        ok = sum(1 for r in fetcher.fetch_all(urls) if r.ok)
+        print(f"BulkFetcher                   : {len(urls) / (time.perf_counter() - start):6.0f} 请求/秒, 成功 {ok}")
+    
+    async def run_async():
+        async with AsyncBulkFetcher(max_concurrency=64, per_host=64) as fetcher:
+            start = time.perf_counter()
+            ok = 0
+            async for r in fetcher.fetch_all(urls):
+                ok += r.ok
+            print(f"AsyncBulkFetcher(64并发)      : {len(urls) / (time.perf_counter() - start):6.0f} 请求/秒, 成功 {ok}")
+    asyncio.run(run_async())
+    server.shutdown()
+    
+    # 2. 20%的响应为503
+    server, base = start_file_server(root, failure_rate=0.2)
+    urls = [f"{base}/small_{i}.bin" for i in range(300)]
+    ok = sum(1 for _, status, _ in concurrent_requests(urls, max_workers=16, use_session=True)
+             if status == 200)
+    print(f"\n20%的响应为503: concurrent_requests 成功 {ok}/{len(urls)}", end='')
+    with BulkFetcher(max_workers=16, per_host=16, backoff=0.05) as fetcher:
+        results = list(fetcher.fetch_all(urls))
+        print(f", BulkFetcher 成功 {sum(r.ok for r in results)}/{len(urls)}, "
+              f"平均尝试 {sum(r.attempts for r in results) / len(results):.2f} 次")
+    server.shutdown()
+    
+    # 3. 64MB大文件，每个连接限速20MB/s
+    server, base = start_file_server(root, bandwidth=20 * 1024 * 1024)
+    out = tempfile.mkdtemp()
+    url = f"{base}/large.bin"
+    start = time.perf_counter()
+    download_file_with_progress(url, os.path.join(out, 'a.bin'), show_progress=False)
+    elapsed = time.perf_counter() - start
+    print(f"\ndownload_file_with_progress   : {64 / elapsed:6.1f} MB/s")
+    for parts in (1, 4, 8):
+        with BulkFetcher(per_host=parts, range_parts=parts, range_threshold=1) as fetcher:
+            result = fetcher.download(url, os.path.join(out, f'b{parts}.bin'))
+        print(f"BulkFetcher 分 {parts} 段           : {64 / result.elapsed:6.1f} MB/s")
+    
+    async def run_async_download():
+        async with AsyncBulkFetcher(per_host=8, range_parts=8, range_threshold=1) as fetcher:
+            return await fetcher.download(url, os.path.join(out, 'c.bin'))
+    result = asyncio.run(run_async_download())
+    print(f"AsyncBulkFetcher 分 8 段      : {64 / result.elapsed:6.1f} MB/s")
+    
+    # 4. 断点续传：下载0.4秒后服务器中断所有响应
+    target = os.path.join(out, 'resume.bin')
+    with BulkFetcher(per_host=4, range_parts=4, range_threshold=1, retries=0) as fetcher:
+        threading.Timer(0.4, setattr, (server, 'interrupted', True)).start()
+        first = fetcher.download(url, target)
+    server.interrupted = False
+    with BulkFetcher(per_host=4, range_parts=4, range_threshold=1) as fetcher:
+        second = fetcher.download(url, target)
+    with open(target, 'rb') as a, open(os.path.join(root, 'large.bin'), 'rb') as b:
+        same = a.read() == b.read()
+    print(f"\n断点续传: 第一次 {'成功' if first.ok else '中断'}, 用时 {first.elapsed:.2f} 秒; "
+          f"第二次用时 {second.elapsed:.2f} 秒, 内容一致: {same}")
+    
+    # 5. 单连接下载的断点续传：响应发送10MB后中断，同一次download调用中由重试从.part的末尾续传
+    for name, make_fetcher in [
+        ('BulkFetcher     ', lambda: BulkFetcher(range_threshold=1 << 40)),
+        ('AsyncBulkFetcher', lambda: AsyncBulkFetcher(range_threshold=1 << 40)),
+    ]:
+        target = os.path.join(out, 'stream.bin')
+        server.interrupt_after = 10 * 1024 * 1024
+        fetcher = make_fetcher()
+        if isinstance(fetcher, AsyncBulkFetcher):
+            async def run_stream(fetcher=fetcher):
+                async with fetcher:
+                    return await fetcher.download(url, target)
+            result = asyncio.run(run_stream())
+        else:
+            with fetcher:
+                result = fetcher.download(url, target)
+        with open(target, 'rb') as a, open(os.path.join(root, 'large.bin'), 'rb') as b:
+            same = a.read() == b.read()
+        print(f"{name} 单连接中断后续传: 成功 {result.ok}, 尝试 {result.attempts} 次, 内容一致: {same}")
+        assert result.ok and result.attempts >= 2 and same
+        os.remove(target)
+    server.shutdown()
+    shutil.rmtree(root)
+    shutil.rmtree(out)
+
+if __name__ == "__main__":
+    benchmark_bulk_fetch()
+```
+
+参考结果（Linux，Python 3.11，单核，本机回环）：
+
+| 场景 | 实现 | 结果 |
+|------|------|------|
+| 300个16KB文件，20ms延迟 | concurrent_requests（不使用会话） | 264 请求/秒 |
+| | concurrent_requests（使用会话） | 407 请求/秒 |
+| | BulkFetcher（16线程） | 377 请求/秒 |
+| | AsyncBulkFetcher（64并发） | 1159 请求/秒 |
+| 20%的响应为503 | concurrent_requests | 成功 239/300 |
+| | BulkFetcher | 成功 300/300，平均尝试 1.25 次 |
+| 64MB文件，单连接限速20MB/s | download_file_with_progress | 20.0 MB/s |
+| | BulkFetcher 分1/4/8段 | 20.0 / 78.4 / 150.3 MB/s |
+| | AsyncBulkFetcher 分8段 | 155.6 MB/s |
+| 下载0.4秒后中断 | BulkFetcher 续传 | 第二次 0.61 秒完成，内容一致 |
+| 单连接下载，发送10MB后中断 | BulkFetcher / AsyncBulkFetcher | 第2次尝试从断点续传完成，内容一致 |
+
+几点说明：
+
+- 小文件场景中，BulkFetcher 与使用会话的 `concurrent_requests` 相当（多出的是信号量和重试包装的开销），它的价值在于连接池有上限、按主机限流和失败重试，而不是单纯的吞吐；`concurrent_requests` 不使用会话时每个请求都要重新建立TCP连接。
+- 线程版受限于单核上的GIL与线程切换，16个线程在20ms延迟下远未达到理论上的800请求/秒；异步版用一个事件循环维持64个并发请求，吞吐约为线程版的3倍。
+- 503场景中没有重试的实现直接丢掉了约20%的结果；带抖动的指数退避让所有请求最终成功，平均只多出0.25次尝试。
+- 分段下载的收益来自“每个连接的带宽有上限”这一前提（CDN和对象存储通常如此）；在不限速的本机回环上分段几乎没有收益，此时保持 `range_parts=1` 即可。
+- 断点续传依赖 `.part` 文件和 `.progress` 记录，第二次只下载剩余部分，并且在完成后才重命名为目标文件，不会留下看似完整的半截文件。分段下载预先分配了整个文件，所以每段的进度必须单独记录在 `.progress` 中；单连接下载不预分配，`.part` 文件的大小就是续传的位置。
+
 ### 10.3 简易网页爬虫
 
 ```python
@@ -568,6 +568,363 @@ if __name__ == "__main__":
     select_server()
 ```
 
+### 4.6 基于selectors的Reactor事件循环
+
+上面的select_server适合演示原理，但有几个问题使它在几百个连接之后就难以为继：
+
+- `select.select`每次调用都要把整个套接字列表复制到内核并线性扫描，而且在Linux上文件描述符超过1024（FD_SETSIZE）时会直接抛出ValueError
+- `sockets_list.remove(sock)`是O(n)操作
+- 在可读事件里直接调用阻塞式的`send`，一个接收很慢的客户端会卡住整个循环
+
+下面的Reactor基于`selectors.DefaultSelector`（Linux上是epoll，BSD/macOS上是kqueue），并且：
+
+- 每个连接有自己的写缓冲区，发送不完的数据先缓存，只有缓冲区非空时才关注可写事件
+- 一次可读事件中循环`recv_into`到EAGAIN或达到预算，把多次读取合并为一次`data_received`调用，效果上接近边缘触发的批量读取（selectors只提供水平触发，需要真正的EPOLLET时可以直接使用`select.epoll`）
+- 写缓冲区超过高水位时暂停读取该连接，防止慢客户端耗尽内存
+- 协议处理器可插拔：Reactor只负责I/O，业务逻辑写在Protocol子类中
+
+```python
+import errno
+import selectors
+import socket
+
+class Protocol:
+    """协议处理器基类：Reactor只负责I/O，业务逻辑在协议中实现"""
+    
+    def connection_made(self, conn):
+        pass
+    
+    def data_received(self, conn, data):
+        raise NotImplementedError
+    
+    def connection_lost(self, conn, exc):
+        pass
+
+class Connection:
+    """一个客户端连接及其写缓冲区"""
+    
+    __slots__ = ('reactor', 'sock', 'address', 'protocol', 'write_buffer',
+                 'events', 'closing', 'paused', 'bytes_in', 'bytes_out')
+    
+    def __init__(self, reactor, sock, address, protocol):
+        self.reactor = reactor
+        self.sock = sock
+        self.address = address
+        self.protocol = protocol
+        self.write_buffer = bytearray()
+        self.events = selectors.EVENT_READ
+        self.closing = False
+        self.paused = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+    
+    def write(self, data):
+        """写入数据；内核缓冲区满时把剩余部分放入写缓冲区，等可写时再发送"""
+        if self.closing:
+            return
+        if not self.write_buffer:
+            try:
+                sent = self.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                self.reactor.close_connection(self, e)
+                return
+            self.bytes_out += sent
+            if sent == len(data):
+                return
+            data = memoryview(data)[sent:]
+        self.write_buffer += data
+        self.reactor.update_interest(self)
+    
+    def close(self):
+        """写缓冲区发送完毕后关闭连接"""
+        self.closing = True
+        if not self.write_buffer:
+            self.reactor.close_connection(self)
+
+class Reactor:
+    """基于selectors.DefaultSelector（Linux上是epoll）的单线程事件循环
+    
+    - 注册/注销都是O(1)，不需要维护套接字列表
+    - 每个连接有自己的写缓冲区，只有缓冲区非空时才关注可写事件
+    - 一次可读事件中循环读取直到EAGAIN或达到预算，把多次recv合并为一次data_received
+    - 写缓冲区超过高水位时暂停读取该连接，形成背压
+    """
+    
+    def __init__(self, protocol_factory, host='localhost', port=8080, backlog=1024,
+                 read_size=65536, reads_per_event=16, high_water=1024 * 1024):
+        self.protocol_factory = protocol_factory
+        self.selector = selectors.DefaultSelector()
+        self.read_size = read_size
+        self.reads_per_event = reads_per_event
+        self.high_water = high_water
+        self.low_water = high_water // 4
+        self.connections = {}
+        self.running = False
+        self._read_buffer = bytearray(read_size)
+        self._read_view = memoryview(self._read_buffer)
+        
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(backlog)
+        self.server_socket.setblocking(False)
+        self.address = self.server_socket.getsockname()
+        self.selector.register(self.server_socket, selectors.EVENT_READ, None)
+        
+        # 自唤醒管道：其他线程调用stop()时唤醒select
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._wakeup_r)
+    
+    def run(self, timeout=1.0):
+        """运行事件循环，直到stop()被调用"""
+        self.running = True
+        try:
+            while self.running:
+                for key, events in self.selector.select(timeout):
+                    conn = key.data
+                    if conn is None:
+                        self._accept()
+                    elif conn is self._wakeup_r:
+                        self._drain_wakeup()
+                    else:
+                        if events & selectors.EVENT_READ:
+                            self._handle_read(conn)
+                        if events & selectors.EVENT_WRITE and conn.sock.fileno() != -1:
+                            self._handle_write(conn)
+        finally:
+            for conn in list(self.connections.values()):
+                self.close_connection(conn)
+            self.selector.close()
+            self.server_socket.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+    
+    def stop(self):
+        """可以从其他线程调用"""
+        self.running = False
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+    
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+    
+    def _accept(self):
+        """一次可读事件中接受所有排队的连接"""
+        while True:
+            try:
+                sock, address = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in (errno.EMFILE, errno.ENFILE):
+                    print(f"文件描述符耗尽，暂时无法接受新连接: {e}")
+                    return
+                raise
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(self, sock, address, self.protocol_factory())
+            self.connections[sock.fileno()] = conn
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+            conn.protocol.connection_made(conn)
+    
+    def _handle_read(self, conn):
+        chunks = []
+        closed = False
+        view = self._read_view
+        for _ in range(self.reads_per_event):
+            try:
+                n = conn.sock.recv_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self.close_connection(conn, e)
+                return
+            if n == 0:
+                closed = True
+                break
+            chunks.append(bytes(view[:n]))
+            if n < self.read_size:
+                break  # 内核缓冲区已经读空，省掉一次必然返回EAGAIN的recv
+        if chunks:
+            data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+            conn.bytes_in += len(data)
+            conn.protocol.data_received(conn, data)
+        if closed:
+            self.close_connection(conn)
+    
+    def _handle_write(self, conn):
+        try:
+            sent = conn.sock.send(conn.write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.close_connection(conn, e)
+            return
+        conn.bytes_out += sent
+        del conn.write_buffer[:sent]
+        if not conn.write_buffer and conn.closing:
+            self.close_connection(conn)
+        else:
+            self.update_interest(conn)
+    
+    def update_interest(self, conn):
+        """根据写缓冲区状态更新关注的事件"""
+        if conn.sock.fileno() == -1:
+            return
+        if len(conn.write_buffer) > self.high_water:
+            conn.paused = True
+        elif conn.paused and len(conn.write_buffer) <= self.low_water:
+            conn.paused = False
+        events = 0 if conn.paused else selectors.EVENT_READ
+        if conn.write_buffer:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events:
+            if not conn.events:
+                self.selector.register(conn.sock, events, conn)
+            elif events:
+                self.selector.modify(conn.sock, events, conn)
+            else:
+                self.selector.unregister(conn.sock)
+            conn.events = events
+    
+    def close_connection(self, conn, exc=None):
+        fileno = conn.sock.fileno()
+        if fileno == -1:
+            return
+        self.connections.pop(fileno, None)
+        if conn.events:
+            self.selector.unregister(conn.sock)
+        conn.sock.close()
+        conn.protocol.connection_lost(conn, exc)
+
+class EchoProtocol(Protocol):
+    """与select_server行为相同的回显协议"""
+    
+    def connection_made(self, conn):
+        conn.write("欢迎连接到多路复用服务器！\n".encode('utf-8'))
+    
+    def data_received(self, conn, data):
+        conn.write("已收到: ".encode('utf-8') + data)
+
+def reactor_server():
+    reactor = Reactor(EchoProtocol, 'localhost', 8080)
+    print(f"服务器启动在 {reactor.address}")
+    try:
+        reactor.run()
+    except KeyboardInterrupt:
+        print("服务器关闭")
+
+if __name__ == "__main__":
+    reactor_server()
+```
+
+下面的基准测试在另一个进程中打开最多10000个并发连接，每个连接做20次64字节的往返：
+
+```python
+
+class RawEchoProtocol(Protocol):
+    """原样回显，用于基准测试"""
+    
+    def data_received(self, conn, data):
+        conn.write(data)
+
+def _drive_clients(address, num_connections, rounds, message_size, result_queue):
+    """在独立进程中打开num_connections个连接，每个连接发送rounds条消息并等待回显"""
+    import resource
+    import time
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, num_connections + 1024), hard))
+    selector = selectors.DefaultSelector()
+    message = b'x' * message_size
+    start = time.perf_counter()
+    socks = []
+    for _ in range(num_connections):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex(address)
+        socks.append(sock)
+        # 每个连接的状态：[剩余轮数, 本轮还需接收的字节数]
+        selector.register(sock, selectors.EVENT_WRITE, [rounds, 0])
+    pending = num_connections
+    connected = 0
+    connect_time = None
+    while pending:
+        for key, events in selector.select(5):
+            sock, state = key.fileobj, key.data
+            if events & selectors.EVENT_WRITE:
+                # 连接建立（或上一条消息已回显），发送下一条消息
+                connected += state[0] == rounds
+                if connected == num_connections and connect_time is None:
+                    connect_time = time.perf_counter() - start
+                sock.send(message)
+                state[1] = message_size
+                selector.modify(sock, selectors.EVENT_READ, state)
+            else:
+                data = sock.recv(65536)
+                state[1] -= len(data)
+                if state[1] <= 0:
+                    state[0] -= 1
+                    if state[0] == 0:
+                        selector.unregister(sock)
+                        pending -= 1
+                    else:
+                        selector.modify(sock, selectors.EVENT_WRITE, state)
+    elapsed = time.perf_counter() - start
+    for sock in socks:
+        sock.close()
+    result_queue.put((connect_time or elapsed, elapsed))
+
+def benchmark_reactor(num_connections=10000, rounds=20, message_size=64):
+    """用另一个进程驱动num_connections个并发连接，测量Reactor的连接速度和消息吞吐量"""
+    import multiprocessing
+    import resource
+    import threading
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, num_connections + 1024), hard))
+    reactor = Reactor(RawEchoProtocol, '127.0.0.1', 0, backlog=4096)
+    server_thread = threading.Thread(target=reactor.run)
+    server_thread.start()
+    
+    result_queue = multiprocessing.Queue()
+    client = multiprocessing.Process(target=_drive_clients,
+                                     args=(reactor.address, num_connections, rounds, message_size, result_queue))
+    client.start()
+    connect_time, elapsed = result_queue.get()
+    client.join()
+    reactor.stop()
+    server_thread.join()
+    
+    messages = num_connections * rounds
+    print(f"{num_connections} 个并发连接: 全部建立用时 {connect_time:.2f}s, "
+          f"{messages} 条往返消息用时 {elapsed:.2f}s ({messages / elapsed:,.0f} msgs/s, "
+          f"{messages * message_size * 2 / elapsed / 1e6:.1f} MB/s)")
+
+if __name__ == "__main__":
+    for n in (100, 1000, 10000):
+        benchmark_reactor(num_connections=n)
+```
+
+参考结果（本机回环接口，单线程Reactor）：
+
+| 并发连接数 | 全部建立用时 | 往返吞吐量 |
+|-----------|------------|-----------|
+| 100 | ~0.01 s | ~43,000 msgs/s |
+| 1,000 | ~0.08 s | ~26,000 msgs/s |
+| 10,000 | ~0.58 s | ~26,500 msgs/s |
+
+连接数从1000增加到10000时吞吐量基本不变，说明每次事件分发的开销与连接总数无关；而select_server在超过1024个文件描述符时无法运行。运行10000个连接需要把文件描述符上限（`ulimit -n`）调到10000以上。
+
 ## 5. 实际应用示例
 
 ### 5.1 简单的HTTP服务器
@@ -856,6 +1213,8 @@ if __name__ == "__main__":
     file_client()
 ```
 
+> 大文件传输的零拷贝、可续传版本见7.4节的framed_file_server和framed_file_client。
+
 ### 5.3 聊天服务器
 
 创建一个简单的多客户端聊天服务器，支持多个客户端之间的消息广播。
@@ -1234,6 +1593,341 @@ def receive_large_data(sock):
     return received_data
 ```
 
+### 7.4 零拷贝的分帧传输
+
+上面的receive_large_data用`received_data += chunk`拼接数据，每次拼接都会复制已经收到的全部内容，总开销是O(n^2)；file_server和file_client每次只读写4KB，并把整个文件保存在内存中。传输几个GB的构建产物时，这些复制会让传输速度远低于网卡带宽。下面的分帧层做了以下改进：
+
+- **预分配缓冲区**：根据帧头中的长度预先分配`bytearray`，用`recv_into`通过`memoryview`直接接收到目标位置，没有中间对象；帧头中的长度超过`max_frame_size`时在分配之前拒绝，对端不能用一个伪造的长度让接收端分配任意大的内存
+- **sendfile**：文件内容用`socket.sendfile`发送，Linux上使用sendfile(2)，数据不经过用户态
+- **可选校验尾**：帧和文件传输都可以附带crc32校验，发送端用mmap计算文件的校验值
+- **断点续传**：接收端把未完成的数据保存在`.part`文件中，`.part`文件的大小就是实际收到的字节数（不预先分配空间）；重新连接后，客户端先核对已收到部分的crc32，一致时从断点继续发送，不一致时从头重传
+
+```python
+import json
+import mmap
+import os
+import socket
+import struct
+import zlib
+
+# 帧头：魔数(4字节) + 标志(1字节) + 负载长度(8字节)，网络字节序
+FRAME_HEADER = struct.Struct('!4sBQ')
+FRAME_MAGIC = b'FRM1'
+FLAG_CRC32 = 0x01           # 负载后面跟一个4字节的crc32校验尾
+CRC_TRAILER = struct.Struct('!I')
+RECV_CHUNK = 1024 * 1024    # 每次recv_into最多接收1MB
+MAX_FRAME_SIZE = 64 * 1024 * 1024   # recv_frame默认接受的最大负载长度
+MAX_JSON_FRAME_SIZE = 1024 * 1024   # 控制消息（JSON）的最大长度
+
+class FrameError(Exception):
+    """帧格式错误或校验失败"""
+
+def recv_exactly_into(sock, view):
+    """用recv_into把数据直接接收到view中，直到填满；连接提前关闭时抛出ConnectionError"""
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:], min(RECV_CHUNK, total - received))
+        if n == 0:
+            raise ConnectionError(f"连接在接收 {received}/{total} 字节后关闭")
+        received += n
+    return received
+
+def send_frame(sock, data, checksum=True):
+    """发送一帧数据；data可以是bytes、bytearray或memoryview，发送时不会切片复制"""
+    view = memoryview(data).cast('B')
+    flags = FLAG_CRC32 if checksum else 0
+    sock.sendall(FRAME_HEADER.pack(FRAME_MAGIC, flags, len(view)))
+    sock.sendall(view)
+    if checksum:
+        sock.sendall(CRC_TRAILER.pack(zlib.crc32(view)))
+    return len(view)
+
+def recv_frame_header(sock):
+    header = bytearray(FRAME_HEADER.size)
+    recv_exactly_into(sock, memoryview(header))
+    magic, flags, length = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise FrameError(f"无效的帧魔数: {magic!r}")
+    return flags, length
+
+def recv_frame(sock, buffer=None, max_frame_size=MAX_FRAME_SIZE):
+    """接收一帧数据，返回负载的memoryview
+    
+    数据直接接收到预先分配的bytearray中，没有`received_data += chunk`带来的二次方复制。
+    传入足够大的buffer可以在多次调用之间复用同一块内存。
+    帧头中的长度来自对端，超过max_frame_size时在分配内存之前就抛出FrameError。
+    """
+    flags, length = recv_frame_header(sock)
+    if length > max_frame_size:
+        raise FrameError(f"帧长度 {length} 超过上限 {max_frame_size}")
+    if buffer is None or len(buffer) < length:
+        buffer = bytearray(length)
+    view = memoryview(buffer)[:length]
+    recv_exactly_into(sock, view)
+    if flags & FLAG_CRC32:
+        trailer = bytearray(CRC_TRAILER.size)
+        recv_exactly_into(sock, memoryview(trailer))
+        (expected,) = CRC_TRAILER.unpack(trailer)
+        if zlib.crc32(view) != expected:
+            raise FrameError("crc32校验失败")
+    return view
+
+def send_json(sock, obj):
+    send_frame(sock, json.dumps(obj).encode('utf-8'), checksum=False)
+
+def recv_json(sock):
+    return json.loads(bytes(recv_frame(sock, max_frame_size=MAX_JSON_FRAME_SIZE)))
+
+def file_crc32(path, offset, count):
+    """用mmap计算文件某一段的crc32，不需要把文件读入Python对象"""
+    if count == 0:
+        return 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            crc = 0
+            for start in range(offset, offset + count, 64 * 1024 * 1024):
+                crc = zlib.crc32(view[start:min(start + 64 * 1024 * 1024, offset + count)], crc)
+            return crc
+        finally:
+            view.release()
+
+def send_file_framed(sock, path, checksum=True):
+    """上传文件：支持断点续传，文件内容用socket.sendfile发送（Linux上是sendfile(2)零拷贝）
+    
+    协议：
+        1. 客户端发送 {"filename", "size"}
+        2. 服务器回复 {"offset", "crc32"}：服务器上已经收到的字节数，以及这部分数据的crc32
+        3. 客户端核对本地文件 [0, offset) 的crc32，回复 {"offset"}：一致时从offset继续，否则从0开始
+        4. 客户端用sendfile发送 [offset, size) 的原始字节，然后发送 {"crc32"} 校验尾
+        5. 服务器回复 {"status", "received"}
+    """
+    size = os.path.getsize(path)
+    send_json(sock, {"filename": os.path.basename(path), "size": size})
+    resume = recv_json(sock)
+    offset = resume["offset"]
+    if offset and file_crc32(path, 0, offset) != resume["crc32"]:
+        offset = 0  # 服务器上的部分与本地文件不一致（文件已修改或.part损坏），从头重传
+    send_json(sock, {"offset": offset})
+    count = size - offset
+    with open(path, 'rb') as f:
+        if count:
+            sock.sendfile(f, offset, count)
+    send_json(sock, {"crc32": file_crc32(path, offset, count) if checksum else None})
+    return recv_json(sock)
+
+def receive_file_framed(sock, save_dir, buffer_size=4 * 1024 * 1024):
+    """接收send_file_framed上传的文件，未完成的部分保存在.part文件中以便续传"""
+    request = recv_json(sock)
+    filename = os.path.basename(request["filename"])
+    size = request["size"]
+    final_path = os.path.join(save_dir, filename)
+    part_path = final_path + '.part'
+    # .part文件只包含实际写入的数据，它的大小就是可以续传的位置
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > size:
+        offset = 0
+    send_json(sock, {"offset": offset, "crc32": file_crc32(part_path, 0, offset)})
+    offset = recv_json(sock)["offset"]  # 客户端核对后决定的起点，0表示从头重传
+    
+    buffer = bytearray(buffer_size)  # 预分配并复用的接收缓冲区
+    view = memoryview(buffer)
+    crc = 0
+    received = 0
+    remaining = size - offset
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT)
+    try:
+        # 不预先分配空间：否则中断后.part文件的大小不再等于已收到的字节数
+        os.ftruncate(fd, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        while remaining:
+            n = sock.recv_into(view, min(buffer_size, remaining))
+            if n == 0:
+                raise ConnectionError(f"连接在接收 {received} 字节后关闭，已保存的部分可续传")
+            chunk = view[:n]
+            written = 0
+            while written < n:
+                written += os.write(fd, chunk[written:])
+            crc = zlib.crc32(chunk, crc)
+            received += n
+            remaining -= n
+    finally:
+        os.close(fd)
+    trailer = recv_json(sock)
+    if trailer["crc32"] is not None and trailer["crc32"] != crc:
+        os.remove(part_path)  # 校验失败，丢弃本次传输的数据
+        send_json(sock, {"status": "crc_mismatch", "received": received})
+        raise FrameError(f"文件 {filename} 的crc32校验失败")
+    os.replace(part_path, final_path)
+    send_json(sock, {"status": "ok", "received": received, "resumed_from": offset})
+    return final_path
+
+def framed_file_server(host='localhost', port=8080, save_dir='received'):
+    """使用分帧协议的文件服务器，替代上面的file_server"""
+    os.makedirs(save_dir, exist_ok=True)
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(5)
+    print(f"文件服务器启动在 {(host, port)}")
+    try:
+        while True:
+            client_socket, client_address = server_socket.accept()
+            with client_socket:
+                try:
+                    path = receive_file_framed(client_socket, save_dir)
+                    print(f"来自 {client_address} 的文件已保存到: {path}")
+                except (ConnectionError, FrameError) as e:
+                    print(f"处理 {client_address} 的文件时出错: {e}")
+    except KeyboardInterrupt:
+        print("服务器关闭")
+    finally:
+        server_socket.close()
+
+def framed_file_client(path, host='localhost', port=8080):
+    """使用分帧协议上传文件，替代上面的file_client；中断后再次调用会从断点继续"""
+    with socket.create_connection((host, port)) as client_socket:
+        result = send_file_framed(client_socket, path)
+        print(f"服务器响应: {result}")
+        return result
+
+def benchmark_framed_transfer(sizes_mb=(16, 256, 1024)):
+    """在本机回环接口上比较旧的send/receive_large_data与新的分帧传输（GB/s）"""
+    import tempfile
+    import threading
+    import time
+    
+    def loopback_pair():
+        listener = socket.create_server(('127.0.0.1', 0))
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+        listener.close()
+        return client, server
+    
+    def run(sender, receiver, nbytes):
+        client, server = loopback_pair()
+        thread = threading.Thread(target=sender, args=(client,))
+        start = time.perf_counter()
+        thread.start()
+        receiver(server)
+        thread.join()
+        elapsed = time.perf_counter() - start
+        client.close()
+        server.close()
+        return nbytes / elapsed / 1e9
+    
+    for size_mb in sizes_mb:
+        data = os.urandom(1024 * 1024) * size_mb
+        nbytes = len(data)
+        if size_mb <= 16:
+            # 旧实现的接收端是O(n^2)的，只在小数据上测试
+            gbps = run(lambda s: send_large_data(s, data), receive_large_data, nbytes)
+            print(f"{size_mb:>5} MB  send/receive_large_data:        {gbps:6.2f} GB/s")
+        gbps = run(lambda s: send_frame(s, data, checksum=False),
+                   lambda s: recv_frame(s, max_frame_size=nbytes), nbytes)
+        print(f"{size_mb:>5} MB  send_frame/recv_frame:          {gbps:6.2f} GB/s")
+        gbps = run(lambda s: send_frame(s, data, checksum=True),
+                   lambda s: recv_frame(s, max_frame_size=nbytes), nbytes)
+        print(f"{size_mb:>5} MB  send_frame/recv_frame + crc32:  {gbps:6.2f} GB/s")
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, "artifact.bin")
+            with open(src, 'wb') as f:
+                f.write(data)
+            dest_dir = os.path.join(tmp_dir, "received")
+            os.makedirs(dest_dir)
+            gbps = run(lambda s: send_file_framed(s, src, checksum=False),
+                       lambda s: receive_file_framed(s, dest_dir), nbytes)
+            print(f"{size_mb:>5} MB  sendfile -> recv_into -> file: {gbps:6.2f} GB/s")
+        del data
+
+def test_resumable_upload():
+    """真实地中断一次上传，然后续传；再模拟.part文件损坏，确认会从头重传"""
+    import tempfile
+    import threading
+    
+    def serve_once(listener, dest_dir, results):
+        conn = listener.accept()[0]
+        with conn:
+            try:
+                results.append(receive_file_framed(conn, dest_dir))
+            except (ConnectionError, FrameError) as e:
+                results.append(e)
+    
+    def upload(listener, dest_dir, sender):
+        results = []
+        server_thread = threading.Thread(target=serve_once, args=(listener, dest_dir, results))
+        server_thread.start()
+        with socket.create_connection(listener.getsockname()) as client:
+            result = sender(client)
+        server_thread.join()
+        return result, results[0]
+    
+    def interrupted_sender(path, nbytes):
+        """按协议开始上传，发送nbytes字节后直接断开连接"""
+        def sender(client):
+            send_json(client, {"filename": os.path.basename(path), "size": os.path.getsize(path)})
+            recv_json(client)
+            send_json(client, {"offset": 0})
+            with open(path, 'rb') as f:
+                client.sendfile(f, 0, nbytes)
+        return sender
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = os.path.join(tmp_dir, "artifact.bin")
+        with open(src, 'wb') as f:
+            f.write(os.urandom(8 * 1024 * 1024))
+        dest_dir = os.path.join(tmp_dir, "received")
+        os.makedirs(dest_dir)
+        part_path = os.path.join(dest_dir, "artifact.bin.part")
+        final_path = os.path.join(dest_dir, "artifact.bin")
+        listener = socket.create_server(('127.0.0.1', 0))
+        
+        # 第一次上传在3MB处中断
+        _, error = upload(listener, dest_dir, interrupted_sender(src, 3 * 1024 * 1024))
+        print(f"第一次上传中断: {error}，.part大小: {os.path.getsize(part_path)}")
+        assert os.path.getsize(part_path) == 3 * 1024 * 1024
+        
+        result, _ = upload(listener, dest_dir, lambda client: send_file_framed(client, src))
+        with open(src, 'rb') as a, open(final_path, 'rb') as b:
+            identical = a.read() == b.read()
+        print(f"续传结果: {result}, 文件一致: {identical}")
+        assert result["resumed_from"] == 3 * 1024 * 1024 and identical
+        
+        # 再次中断后破坏.part中的一个字节：前缀校验不一致，从头重传
+        os.remove(final_path)
+        upload(listener, dest_dir, interrupted_sender(src, 5 * 1024 * 1024))
+        with open(part_path, 'r+b') as part:
+            part.seek(1000)
+            byte = part.read(1)
+            part.seek(1000)
+            part.write(bytes([byte[0] ^ 0xFF]))
+        result, _ = upload(listener, dest_dir, lambda client: send_file_framed(client, src))
+        with open(src, 'rb') as a, open(final_path, 'rb') as b:
+            identical = a.read() == b.read()
+        print(f".part损坏后的结果: {result}, 文件一致: {identical}")
+        assert result["resumed_from"] == 0 and identical
+        listener.close()
+
+if __name__ == "__main__":
+    test_resumable_upload()
+    benchmark_framed_transfer()
+```
+
+在本机回环接口上的参考结果：
+
+| 数据大小 | send/receive_large_data | send_frame/recv_frame | 加crc32校验 | sendfile上传到文件 |
+|---------|------------------------|-----------------------|------------|------------------|
+| 16 MB | ~0.01 GB/s | ~0.69 GB/s | ~0.57 GB/s | ~0.25 GB/s |
+| 256 MB | 未测试（太慢） | ~0.70 GB/s | ~0.42 GB/s | ~0.65 GB/s |
+| 1024 MB | 未测试（太慢） | ~0.72 GB/s | ~0.36 GB/s | ~0.68 GB/s |
+
+**说明：**
+- 旧实现的耗时随数据量平方增长，16MB时已经比新实现慢约70倍
+- crc32校验需要在用户态遍历一遍数据，对吞吐量影响明显；在可靠的内部网络中可以关闭校验，只依赖TCP校验和
+- 实际的跨主机传输速度还受网卡带宽和`SO_SNDBUF`/`SO_RCVBUF`设置影响，参见7.1节
+
 ## 8. 常见问题与解决方案
 
 ### 8.1 连接被拒绝
